@@ -1,20 +1,52 @@
-from flask import Flask, render_template, request, jsonify, Response, send_from_directory
-import requests
+from flask import Flask, render_template, request, jsonify, Response, send_from_directory, stream_with_context, g
+import contextvars
+import csv
+import json
+import sys
+import threading
 import time
 import os
-from io import BytesIO
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from datetime import datetime, timezone
+from io import BytesIO, StringIO
+from tempfile import SpooledTemporaryFile
 from flask import send_file
-from reportlab.pdfgen import canvas
-from reportlab.lib.pagesizes import A4
-from reportlab.lib.utils import simpleSplit
 
-try:
-    from dotenv import load_dotenv
-    load_dotenv()
-except:
-    pass
-
-app = Flask(__name__)
+# .env is read before the local modules below, which take their settings from the
+# environment at import. Deployments without one (Vercel) skip importing dotenv.
+DOTENV_PATH = next((p for p in (os.path.join(os.path.dirname(os.path.abspath(__file__)), '.env'), '.env')
+                    if os.path.isfile(p)), None)
+if DOTENV_PATH:
+    try:
+        from dotenv import load_dotenv
+        load_dotenv(DOTENV_PATH)
+    except:
+        pass
+
+import upstream
+import log
+import metrics
+from metrics import stage
+from cache import LRUCache, SQLiteCache, TieredCache, content_hash
+from singleflight import SingleFlight
+from ratelimit import UpstreamLimiter, RateLimited
+from breaker import CircuitBreaker, CircuitOpen
+from jobs import JobQueue, MemoryJobStore, SQLiteJobStore, QueueFull, job_view
+from hedge import Hedger
+from token_budget import TokenBudget, estimate_tokens, usage_of
+from assets import AssetManifest, Payload
+from probes import Prober
+from history import HistoryStore
+import local_templates
+from local_templates import experience_label
+from jd_text import clean_markdown, MarkdownStreamCleaner, parse_sections, valid_sections
+
+# The PDF stack (pdf_render, pdf_batch and reportlab under them) is imported by the
+# PDF routes on first use: most cold starts serve a page or /generate and never need it.
+
+# static/ is served by static_files() below (fingerprinted, precompressed), not Flask's default view
+app = Flask(__name__, static_folder=None)
+STATIC_DIR = os.path.join(app.root_path, 'static')
 OPENROUTER_API_KEY = os.getenv('OPENROUTER_API_KEY')
 OPENROUTER_MODEL = os.getenv('OPENROUTER_MODEL', 'meta-llama/llama-3.3-70b-instruct:free')
 # Allow overriding the base API URL (useful for proxies or private networks)
@@ -22,112 +54,336 @@ OPENROUTER_BASE_URL = os.getenv('OPENROUTER_BASE_URL', 'https://openrouter.ai/ap
 openrouter_init_error = None
 # simple availability flag; we will use HTTP calls to OpenRouter
 openrouter_available = bool(OPENROUTER_API_KEY)
+OPENROUTER_TEMPERATURE = 0.7
+
+# Cache of generated descriptions keyed on the normalised prompt inputs.
+# JD_CACHE_DB enables a SQLite tier that survives restarts.
+JD_CACHE_SIZE = int(os.getenv('JD_CACHE_SIZE', '256'))
+JD_CACHE_TTL = int(os.getenv('JD_CACHE_TTL', '3600'))
+JD_CACHE_DB = os.getenv('JD_CACHE_DB', '')
+jd_cache_disk = None
+if JD_CACHE_DB:
+    try:
+        jd_cache_disk = SQLiteCache(JD_CACHE_DB, table='jd_cache', ttl=JD_CACHE_TTL)
+    except Exception as e:
+        log.event('cache.disabled', level='warning', path=JD_CACHE_DB, error=str(e))
+jd_cache = TieredCache(LRUCache(max_entries=JD_CACHE_SIZE, ttl=JD_CACHE_TTL), jd_cache_disk)
+
+# Identical concurrent generations (same cache key) share one upstream call.
+# Followers give up after SINGLEFLIGHT_WAIT_TIMEOUT seconds and fall back locally.
+upstream_flights = SingleFlight(wait_timeout=float(os.getenv('SINGLEFLIGHT_WAIT_TIMEOUT', '120')))
+
+# Client-side limiter shared by every worker thread (see ratelimit.py). A request that
+# cannot get an upstream slot within OPENROUTER_QUEUE_DEADLINE seconds falls back locally.
+OPENROUTER_QUEUE_DEADLINE = float(os.getenv('OPENROUTER_QUEUE_DEADLINE', '5'))
+upstream_limiter = UpstreamLimiter(
+    requests_per_minute=int(os.getenv('OPENROUTER_RPM', '20')),
+    tokens_per_minute=int(os.getenv('OPENROUTER_TPM', '0')),
+    max_concurrency=int(os.getenv('OPENROUTER_MAX_CONCURRENCY', '8')),
+)
+# The /diag API probe has its own small budget so it never takes a user request's token
+probe_limiter = UpstreamLimiter(
+    requests_per_minute=int(os.getenv('OPENROUTER_PROBE_RPM', '2')),
+    max_concurrency=1,
+)
+
+# Stop calling OpenRouter while it is unhealthy (see breaker.py); requests go
+# straight to the local generator until a half-open probe succeeds.
+upstream_breaker = CircuitBreaker(
+    window_seconds=float(os.getenv('BREAKER_WINDOW_SECONDS', '60')),
+    min_calls=int(os.getenv('BREAKER_MIN_CALLS', '5')),
+    failure_rate=float(os.getenv('BREAKER_FAILURE_RATE', '0.5')),
+    timeout_rate=float(os.getenv('BREAKER_TIMEOUT_RATE', '0.3')),
+    open_seconds=float(os.getenv('BREAKER_OPEN_SECONDS', '30')),
+)
+
+# Optional hedging (see hedge.py): if the primary model has not produced a first token
+# within a percentile of its recent first-token latencies, the same prompt is also sent
+# to OPENROUTER_HEDGE_MODEL and/or OPENROUTER_HEDGE_BASE_URL and the first to finish wins.
+OPENROUTER_HEDGE_MODEL = os.getenv('OPENROUTER_HEDGE_MODEL', '')
+OPENROUTER_HEDGE_BASE_URL = os.getenv('OPENROUTER_HEDGE_BASE_URL', '')
+OPENROUTER_HEDGE_API_KEY = os.getenv('OPENROUTER_HEDGE_API_KEY') or OPENROUTER_API_KEY
+hedging_enabled = bool(OPENROUTER_HEDGE_MODEL or OPENROUTER_HEDGE_BASE_URL)
+hedger = Hedger(
+    percentile=float(os.getenv('HEDGE_PERCENTILE', '95')),
+    initial_delay=float(os.getenv('HEDGE_INITIAL_DELAY', '3')),
+    min_delay=float(os.getenv('HEDGE_MIN_DELAY', '0.5')),
+    max_delay=float(os.getenv('HEDGE_MAX_DELAY', '15')),
+    # Cancelling the loser shuts its socket at once, even before its headers arrive
+    make_cancel=upstream.Abort,
+)
+
+# Each generation's max_tokens and target length are sized from the sections and the
+# input (see token_budget.py); OPENROUTER_MAX_TOKENS is the ceiling, the old fixed value.
+generation_budget = TokenBudget(
+    min_tokens=int(os.getenv('OPENROUTER_MIN_TOKENS', '400')),
+    max_tokens=int(os.getenv('OPENROUTER_MAX_TOKENS', '1500')),
+    headroom=float(os.getenv('TOKEN_HEADROOM', '1.4')),
+    max_skills=int(os.getenv('PROMPT_MAX_SKILLS', '20')),
+    skills_max_tokens=int(os.getenv('PROMPT_SKILLS_MAX_TOKENS', '80')),
+    details_max_tokens=int(os.getenv('PROMPT_DETAILS_MAX_TOKENS', '200')),
+)
+
+# Rendered PDFs keyed on a hash of the posted jobDetails/jobDescription. Bump
+# PDF_LAYOUT_VERSION whenever pdf_render.py output changes.
+PDF_LAYOUT_VERSION = 3
+PDF_CACHE_MAX_BYTES = int(os.getenv('PDF_CACHE_MAX_BYTES', str(32 * 1024 * 1024)))
+PDF_CACHE_DB = os.getenv('PDF_CACHE_DB', '')
+pdf_cache_disk = None
+if PDF_CACHE_DB:
+    try:
+        pdf_cache_disk = SQLiteCache(PDF_CACHE_DB, table='pdf_cache', ttl=int(os.getenv('PDF_CACHE_TTL', '86400')),
+                                     max_rows=int(os.getenv('PDF_CACHE_DB_MAX_ROWS', '2000')))
+    except Exception as e:
+        log.event('cache.disabled', level='warning', path=PDF_CACHE_DB, error=str(e))
+pdf_cache = TieredCache(LRUCache(max_entries=int(os.getenv('PDF_CACHE_ENTRIES', '512')),
+                                 max_bytes=PDF_CACHE_MAX_BYTES), pdf_cache_disk)
+
+# /download_pdf renders into a spooled temp file: documents up to PDF_SPOOL_MAX_MEMORY
+# bytes stay in memory (and are cached), larger ones spill to disk and are streamed
+# from there without being cached.
+PDF_SPOOL_MAX_MEMORY = int(os.getenv('PDF_SPOOL_MAX_MEMORY', str(1024 * 1024)))
+
+# /download_pdf/batch: postings are rendered in a process pool of PDF_BATCH_WORKERS
+# (1 renders inline) and streamed back as a ZIP or one merged PDF.
+PDF_BATCH_MAX_ITEMS = int(os.getenv('PDF_BATCH_MAX_ITEMS', '500'))
+PDF_BATCH_WORKERS = int(os.getenv('PDF_BATCH_WORKERS', str(os.cpu_count() or 1)))
+PDF_BATCH_START_METHOD = os.getenv('PDF_BATCH_START_METHOD', 'spawn')
+
+# Static assets are hashed at startup and compressed on first request (see assets.py).
+# ASSETS_AUTO_RELOAD=1 picks up edits without a restart (on by default under `python app.py`).
+static_assets = AssetManifest(STATIC_DIR, auto_reload=os.getenv('ASSETS_AUTO_RELOAD', '').lower() in ('1', 'true'))
+STATIC_IMMUTABLE_CACHE = 'public, max-age=31536000, immutable'
+
+# The page routes below don't depend on the request, so each template is rendered on
+# its first hit and then served from memory (compressed, with an ETag). PAGE_CACHE=0
+# renders on every hit (also the default under `python app.py`, for template edits).
+page_cache_enabled = os.getenv('PAGE_CACHE', '1').lower() not in ('0', 'false')
+rendered_pages = {}
+
+# /metrics (Prometheus text format). Stage timings live in metrics.STAGE_SECONDS.
+REQUEST_SECONDS = metrics.registry.histogram('jd_http_request_duration_seconds',
+                                             'Time to produce a response (streams: until the first byte)',
+                                             ('route', 'method', 'status'))
+GENERATIONS = metrics.registry.counter('jd_generations_total', 'Job descriptions produced, by source',
+                                       ('route', 'outcome'))
+FALLBACKS = metrics.registry.counter('jd_fallbacks_total', 'Local-generator fallbacks, by reason',
+                                     ('route', 'reason'))
+UPSTREAM_TOKENS = metrics.registry.counter('jd_upstream_tokens_total', 'Tokens used as reported by the upstream',
+                                           ('route', 'kind'))
+
+
+def breaker_state_series():
+    state = upstream_breaker.state
+    return {(s,): int(s == state) for s in upstream_breaker.transitions}
+
+
+# The hedger and breaker keep their own counts (also in /debug); these read them at scrape time
+metrics.registry.snapshot('jd_hedge_races_total', 'Upstream generations run through the hedger', (),
+                          lambda: {(): hedger.races}, kind='counter')
+metrics.registry.snapshot('jd_hedges_fired_total', 'Races in which the secondary call was started', (),
+                          lambda: {(): hedger.fired}, kind='counter')
+metrics.registry.snapshot('jd_hedge_wins_total', 'Finished races by the call that won (none: both failed)',
+                          ('winner',), lambda: {('primary',): hedger.primary_wins,
+                                                ('secondary',): hedger.secondary_wins,
+                                                ('none',): hedger.both_failed}, kind='counter')
+metrics.registry.snapshot('jd_hedge_delay_seconds', 'Wait for a first token before a hedge fires', (),
+                          lambda: {(): hedger.delay()})
+metrics.registry.snapshot('jd_circuit_breaker_state', 'Upstream circuit breaker state (1 = current)', ('state',),
+                          breaker_state_series)
+metrics.registry.snapshot('jd_circuit_breaker_transitions_total', 'Times the breaker entered each state',
+                          ('state',), lambda: {(s,): n for s, n in upstream_breaker.transitions.items()},
+                          kind='counter')
+metrics.registry.snapshot('jd_circuit_breaker_short_circuited_total', 'Calls refused while the breaker was open',
+                          (), lambda: {(): upstream_breaker.short_circuited}, kind='counter')
+
+# /generate/batch fan-out limits
+BATCH_MAX_ITEMS = int(os.getenv('BATCH_MAX_ITEMS', '100'))
+BATCH_CONCURRENCY = int(os.getenv('BATCH_CONCURRENCY', '4'))
+BATCH_MAX_CONCURRENCY = int(os.getenv('BATCH_MAX_CONCURRENCY', '16'))
+
+# Async job queue (POST /jobs, GET /jobs/<id>). JOBS_DB keeps jobs in SQLite so they
+# survive restarts; JOBS_WEBHOOKS=1 allows a per-job callbackUrl.
+JOBS_WORKERS = int(os.getenv('JOBS_WORKERS', '4'))
+JOBS_MAX_DEPTH = int(os.getenv('JOBS_MAX_DEPTH', '100'))
+JOBS_RESULT_TTL = int(os.getenv('JOBS_RESULT_TTL', '3600'))
+JOBS_MAX_WAIT = float(os.getenv('JOBS_MAX_WAIT', '25'))
+JOBS_DB = os.getenv('JOBS_DB', '')
+JOBS_WEBHOOKS = os.getenv('JOBS_WEBHOOKS', '').lower() in ('1', 'true')
+
+# Generation history (GET /history, /history/<id>, /history/export). HISTORY_DB enables the
+# append-only SQLite store; entries are written by a background thread, off the request path.
+HISTORY_DB = os.getenv('HISTORY_DB', '')
+HISTORY_PAGE_MAX = int(os.getenv('HISTORY_PAGE_MAX', '100'))
+history_store = None
+if HISTORY_DB:
+    try:
+        history_store = HistoryStore(HISTORY_DB, queue_size=int(os.getenv('HISTORY_QUEUE_SIZE', '1000')))
+    except Exception as e:
+        log.event('history.disabled', level='warning', path=HISTORY_DB, error=str(e))
+
+@app.before_request
+def start_request_metrics():
+    g.request_started = time.perf_counter()
+    metrics.current_route.set(request.url_rule.rule if request.url_rule is not None else 'unmatched')
+
+
+@app.after_request
+def record_request_metrics(resp):
+    started = g.get('request_started')
+    if started is not None:
+        REQUEST_SECONDS.observe(time.perf_counter() - started, route=metrics.current_route.get(),
+                                method=request.method, status=f'{resp.status_code // 100}xx')
+    return resp
+
+
+def fallback_reason(api_error):
+    if not api_error:
+        return 'empty'
+    if api_error == 'force_local':
+        return 'force_local'
+    if 'not configured' in api_error:
+        return 'not_configured'
+    if 'circuit' in api_error.lower():
+        return 'circuit_open'
+    if 'rate' in api_error.lower() or 'HTTP 429' in api_error:
+        return 'rate_limited'
+    return 'upstream_error'
+
+
+def local_fallback(data, api_error):
+    """Generate locally after the upstream was skipped or failed, and count why."""
+    reason = fallback_reason(api_error)
+    FALLBACKS.inc(route=metrics.current_route.get(), reason=reason)
+    with stage('fallback', outcome=reason):
+        return generate_local_job_description(data)
+
+
+def send_payload(payload, cache_control):
+    """Serve an in-memory Payload, negotiating Accept-Encoding and answering If-None-Match."""
+    encoding = request.accept_encodings.best_match(payload.encodings) if payload.encodings else None
+    if encoding and payload.variant(encoding) is None:
+        encoding = None
+    body, etag = payload.body(encoding)
+    if etag in request.if_none_match:
+        resp = Response(status=304)
+    else:
+        resp = Response(body, mimetype=payload.mimetype)
+        if encoding:
+            resp.content_encoding = encoding
+    resp.set_etag(etag)
+    resp.vary.add('Accept-Encoding')
+    resp.headers['Cache-Control'] = cache_control
+    return resp
+
+
+def cached_page(template, mimetype='text/html'):
+    if not page_cache_enabled:
+        return Response(render_template(template), mimetype=mimetype)
+    page = rendered_pages.get(template)
+    if page is None:
+        page = rendered_pages[template] = Payload(render_template(template).encode('utf-8'), mimetype)
+    # Revalidated every time: a deploy changes the fingerprinted asset URLs inside
+    return send_payload(page, 'public, no-cache')
+
 
 @app.route("/")
 def home():
-    return render_template("index.html")
+    return cached_page("index.html")
 
 @app.route("/generator")
 def generator():
-    return render_template("generator.html")
+    return cached_page("generator.html")
 
+# navbar/footer are also {% include %}d into every page server-side; these routes
+# remain for anything that still fetches the fragments on their own
 @app.route("/navbar.html")
 def navbar():
-    return render_template("navbar.html")
+    return cached_page("navbar.html")
 
 @app.route("/footer.html")
 def footer():
-    return render_template("footer.html")
+    return cached_page("footer.html")
 
 @app.route("/sitemap.xml")
 def sitemap():
-    return render_template("sitemap.xml")
+    return cached_page("sitemap.xml", mimetype='application/xml')
 
 @app.route("/robots.txt")
 def robots():
-    return send_from_directory(app.static_folder, "robots.txt")
+    return static_files("robots.txt")
 
 @app.route("/privacy")
 def privacy():
-    return render_template("privacy.html")
+    return cached_page("privacy.html")
 
 @app.route("/terms")
 def terms():
-    return render_template("terms.html")
+    return cached_page("terms.html")
 
 @app.route("/about")
 def about():
-    return render_template("about.html")
+    return cached_page("about.html")
+
+
+@app.url_defaults
+def fingerprint_static_urls(endpoint, values):
+    # url_for('static', filename='js/main.js') -> /static/js/main.<hash>.js
+    if endpoint == 'static' and 'filename' in values:
+        values['filename'] = static_assets.url_name(values['filename'])
 
 
-@app.route('/static/<path:filename>')
+@app.route('/static/<path:filename>', endpoint='static')
 def static_files(filename):
     # Serve static assets explicitly so deployments that route requests to the Flask app
     # (instead of a platform static handler) still return files like JS/CSS.
-    return send_from_directory(os.path.join(app.root_path, 'static'), filename)
+    # Fingerprinted names are cached for a year; plain names are revalidated by ETag.
+    asset, immutable = static_assets.lookup(filename)
+    if asset is None:
+        return send_from_directory(STATIC_DIR, filename)
+    return send_payload(asset, STATIC_IMMUTABLE_CACHE if immutable else 'public, no-cache')
 
-@app.route("/generate", methods=["POST"])
-def generate():
-    data = request.json or {}
-    # Strip leading/trailing spaces from all text fields
+REQUIRED_FIELDS = ('jobTitle', 'companyName', 'city', 'state', 'jobType', 'experienceLevel', 'salary', 'companyEmail')
+# Everything that ends up in the prompt
+PROMPT_FIELDS = REQUIRED_FIELDS + ('skillsKnown', 'additionalDetails')
+
+
+def field_text(value):
+    """A prompt field as text: lists (e.g. skills sent as a JSON array) are joined with ', ', numbers stringified."""
+    if isinstance(value, (list, tuple)):
+        return ', '.join(t for t in (field_text(v) for v in value) if t)
+    if value is None or isinstance(value, dict):
+        return ''
+    return str(value).strip()
+
+
+def strip_job_fields(data):
+    """Strip leading/trailing spaces from all text fields and coerce the prompt fields to text (in place)."""
     for key in data:
         if isinstance(data[key], str):
             data[key] = data[key].strip()
-    
-    for f in ('jobTitle','companyName','city','state','jobType','experienceLevel','salary','companyEmail'):
+        elif key in PROMPT_FIELDS and data[key] is not None:
+            data[key] = field_text(data[key])
+    return data
+
+
+def missing_job_field(data):
+    """Return the first required field that is empty, or None."""
+    for f in REQUIRED_FIELDS:
         if not data.get(f):
-            return jsonify(success=False,error=f"Missing {f}")
-
-    # Quick debug override: if caller passes ?force_local=1, skip external API
-    if request.args.get('force_local', '').lower() in ('1', 'true'):
-        jd = generate_local_job_description(data)
-        out = {
-            'success': True,
-            'jobDescription': jd,
-            'jobDetails': {
-                'title': (data.get('jobTitle') or '').title(),
-                'company': (data.get('companyName') or '').title(),
-                'location': f"{(data.get('city') or '').title()}, {(data.get('state') or '').title()}",
-                'jobType': (data.get('jobType') or '').replace('-', ' ').title(),
-                'experienceLevel': get_experience_label(data.get('experienceLevel', '')),
-                'salary': (data.get('salary') or ''),
-                'email': data.get('companyEmail') or ''
-            },
-            'metadata': {
-                'wordCount': len(jd.split()),
-                'fallbackUsed': True,
-                'modelAvailable': False,
-                'apiAttempted': False,
-                'apiError': 'force_local'
-            }
-        }
-        return jsonify(out)
-
-    # Quick debug override: if caller passes ?force_local=1, skip external API
-    if request.args.get('force_local', '').lower() in ('1', 'true'):
-        jd = generate_local_job_description(data)
-        out = {
-            'success': True,
-            'jobDescription': jd,
-            'jobDetails': {
-                'title': (data.get('jobTitle') or '').title(),
-                'company': (data.get('companyName') or '').title(),
-                'location': f"{(data.get('city') or '').title()}, {(data.get('state') or '').title()}",
-                'jobType': (data.get('jobType') or '').replace('-', ' ').title(),
-                'experienceLevel': get_experience_label(data.get('experienceLevel', '')),
-                'salary': (data.get('salary') or ''),
-                'email': data.get('companyEmail') or ''
-            },
-            'metadata': {
-                'wordCount': len(jd.split()),
-                'fallbackUsed': True,
-                'modelAvailable': False,
-                'apiAttempted': False,
-                'apiError': 'force_local'
-            }
-        }
-        return jsonify(out)
-    prompt = f"""Create a professional job description in PLAIN TEXT format (no markdown, no asterisks, no bold markers).
+            return f
+    return None
+
+
+def generation_cache_key(data):
+    """Hash of the prompt inputs (whitespace-normalised), model and temperature."""
+    fields = {f: ' '.join(str(data.get(f) or '').split()) for f in PROMPT_FIELDS}
+    return content_hash({'fields': fields, 'model': OPENROUTER_MODEL, 'temperature': OPENROUTER_TEMPERATURE})
+
+
+def build_prompt(data, target_words=None):
+    length = f"\nKeep the whole description to about {target_words} words.\n" if target_words else ''
+    return f"""Create a professional job description in PLAIN TEXT format (no markdown, no asterisks, no bold markers).
 
 Job Details:
 - Title: {data['jobTitle']}
@@ -158,516 +414,1153 @@ What We Offer:
 
 How to Apply:
 [Application instructions]
-
+{length}
 IMPORTANT: Use PLAIN TEXT only. Do NOT use markdown formatting, asterisks, or special characters. Use simple dashes (-) for bullet points."""
+
+
+def plan_generation(data):
+    """The prompt for ``data`` with its token budget (a token_budget.TokenPlan)."""
+    return generation_budget.plan(data, build_prompt)
+
+
+def record_token_usage(plan):
+    """Count the tokens a finished call reported and let the budget adapt to it."""
+    route = metrics.current_route.get()
+    generation_budget.observe(plan)
+    if plan.prompt_tokens:
+        UPSTREAM_TOKENS.inc(plan.prompt_tokens, route=route, kind='prompt')
+    if plan.completion_tokens:
+        UPSTREAM_TOKENS.inc(plan.completion_tokens, route=route, kind='completion')
+
+
+def build_job_details(data):
+    return {
+        'title': (data.get('jobTitle') or '').title(),
+        'company': (data.get('companyName') or '').title(),
+        'location': f"{(data.get('city') or '').title()}, {(data.get('state') or '').title()}",
+        'jobType': (data.get('jobType') or '').replace('-', ' ').title(),
+        'experienceLevel': get_experience_label(data.get('experienceLevel', '')),
+        'salary': (data.get('salary') or ''),
+        'email': data.get('companyEmail') or ''
+    }
+
+
+def build_generate_response(jd, data, fallback_used, model_available, api_attempted, api_error, **extra):
+    """Assemble the JSON body shared by /generate and its streaming variant.
+
+    ``sections`` is the description parsed once into the section model
+    (jd_text.parse_sections) so the client and /download_pdf needn't re-parse it.
+    """
+    metadata = {
+        'wordCount': len(jd.split()),
+        'fallbackUsed': fallback_used,
+        'modelAvailable': model_available,
+        'apiAttempted': api_attempted,
+        'apiError': api_error,
+        'cacheHit': False
+    }
+    metadata.update(extra)
+    return {
+        'success': True,
+        'jobDescription': jd,
+        'sections': parse_sections(jd),
+        'jobDetails': build_job_details(data),
+        'metadata': metadata
+    }
+
+
+def openrouter_headers(api_key=None):
+    return {
+        'Authorization': f'Bearer {api_key or OPENROUTER_API_KEY}',
+        'Content-Type': 'application/json',
+        'X-Title': 'AI Job Description Generator'
+    }
+
+
+def openrouter_payload(plan, stream=False, model=None):
+    payload = {
+        'model': model or OPENROUTER_MODEL,
+        'messages': [{'role': 'user', 'content': plan.prompt}],
+        'temperature': OPENROUTER_TEMPERATURE,
+        'max_tokens': plan.max_tokens
+    }
+    if stream:
+        payload['stream'] = True
+    return payload
+
+
+def openrouter_endpoint(base_url=None):
+    return f"{(base_url or OPENROUTER_BASE_URL).rstrip('/')}/v1/chat/completions"
+
+
+def estimate_request_tokens(payload):
+    """Rough token cost of a chat request for the tokens/min bucket: prompt estimate plus max_tokens."""
+    prompt = sum(estimate_tokens(m.get('content') or '') for m in payload.get('messages', []))
+    return prompt + payload.get('max_tokens', 0)
+
+
+def post_openrouter(payload, stream=False, base_url=None, api_key=None, max_retries=3, wait=True, timeout=None,
+                    cancel=None, limiter=None):
+    """Send a chat completion through the circuit breaker, shared limiter and retry loop.
+
+    A ``base_url`` other than OPENROUTER_BASE_URL (a hedge target) is a different
+    upstream, so it bypasses the breaker and limiter that guard OpenRouter.
+    ``wait=False`` raises RateLimited instead of queueing for the limiter.
+    ``cancel`` (an upstream.Abort) stops the call from another thread.
+    ``limiter`` replaces the shared upstream_limiter (the /diag probe uses its own).
+    """
+    kwargs = {'timeout': timeout} if timeout is not None else {}
+    if base_url and base_url != OPENROUTER_BASE_URL:
+        return upstream.post_with_retry(openrouter_endpoint(base_url), max_retries=1, cancel=cancel,
+                                        headers=openrouter_headers(api_key), json=payload, stream=stream, **kwargs)
+    upstream_breaker.before_call()
+    try:
+        resp = upstream.post_with_retry(openrouter_endpoint(), max_retries=max_retries,
+                                        limiter=limiter or upstream_limiter,
+                                        tokens=estimate_request_tokens(payload),
+                                        deadline=time.monotonic() + OPENROUTER_QUEUE_DEADLINE if wait else None,
+                                        cancel=cancel, headers=openrouter_headers(api_key), json=payload,
+                                        stream=stream, **kwargs)
+    except (RateLimited, upstream.Cancelled):
+        # Our own budget or a lost hedge race, not an upstream health signal
+        upstream_breaker.release()
+        raise
+    except Exception as e:
+        upstream_breaker.record_failure(timeout=upstream.is_timeout(e))
+        raise
+    record_upstream_status(resp.status_code)
+    return resp
+
+
+def record_upstream_status(status_code):
+    """Feed an OpenRouter response status to the circuit breaker (429s are our budget, not its health)."""
+    if status_code >= 500:
+        upstream_breaker.record_failure()
+    elif status_code == 429:
+        upstream_breaker.release()
+    else:
+        upstream_breaker.record_success()
+
+
+def completion_text(j):
+    """Cleaned text of a (non-streaming) completion body: ``(text, api_error)``."""
+    jd = None
+    api_error = None
+    log.event('upstream.response', keys=list(j.keys()) if isinstance(j, dict) else 'non-dict')
+    # Prefer the chat-style response structure
+    try:
+        jd = j.get('choices', [])[0].get('message', {}).get('content')
+    except Exception as parse_err:
+        log.event('upstream.parse_error', level='warning', error=str(parse_err))
+        jd = None
+    if not jd:
+        # fallback to other possible shapes
+        try:
+            jd = j.get('choices', [])[0].get('text')
+        except Exception:
+            jd = None
+
+    # Clean markdown formatting from response
+    with stage('markdown_cleanup'):
+        jd = clean_markdown(jd)
+
+    if not jd:
+        api_error = f'OpenRouter returned empty content. Response: {str(j)[:200]}'
+        log.event('upstream.empty_content', level='warning', error=api_error)
+    return jd, api_error
+
+
+def call_openrouter(plan):
+    """Run one (non-streaming) completion and return ``(text, api_error)``; usage goes on ``plan``."""
     jd = None
-    # No fallback: if OpenRouter fails or returns no content, return an error
-    # Diagnostics for API usage
-    model_available = openrouter_available
-    api_attempted = False
     api_error = None
+    try:
+        endpoint = openrouter_endpoint()
+        log.event('upstream.call', endpoint=endpoint, model=OPENROUTER_MODEL)
+        # Retries on 429 wait on the shared limiter, never past the queue deadline
+        resp = post_openrouter(openrouter_payload(plan))
+        if resp.ok:
+            j = resp.json()
+            jd, api_error = completion_text(j)
+            plan.record(*usage_of(j))
+        else:
+            api_error = f"HTTP {resp.status_code}: {resp.text[:500]}"
+            log.event('upstream.http_error', level='warning', status=resp.status_code, body=resp.text[:200])
+            jd = None
+    except Exception as e:
+        api_error = str(e)
+        log.event('upstream.failed', level='warning', error=api_error)
+        jd = None
+    return jd, api_error
+
+
+def collect_openrouter_stream(plan, cancel=None, on_first_token=None, model=None, base_url=None,
+                              api_key=None):
+    """Run a streaming completion to the end and return ``(text, api_error)``."""
+    outcome = new_stream_outcome()
+    for _ in stream_openrouter(plan, outcome, model=model, base_url=base_url, api_key=api_key,
+                               cancel=cancel, on_first_token=on_first_token):
+        pass
+    if outcome['api_error']:
+        return None, outcome['api_error']
+    with stage('markdown_cleanup'):
+        jd = clean_markdown(''.join(outcome['raw']))
+    return (jd, None) if jd else (None, 'OpenRouter returned empty content')
+
+
+def call_openrouter_hedged(plan):
+    """Race the primary model against the hedge target; returns ``(text, api_error, metadata)``."""
+    def primary(cancel, on_first_token):
+        return collect_openrouter_stream(plan, cancel, on_first_token)
+
+    def secondary(cancel, on_first_token):
+        return collect_openrouter_stream(plan, cancel, on_first_token,
+                                         model=OPENROUTER_HEDGE_MODEL or None,
+                                         base_url=OPENROUTER_HEDGE_BASE_URL or None,
+                                         api_key=OPENROUTER_HEDGE_API_KEY)
+
+    jd, api_error, info = hedger.race(primary, secondary)
+    return jd, api_error, hedge_metadata(info)
+
+
+def hedge_metadata(info):
+    """Response metadata for a finished hedger race."""
+    if info['hedged']:
+        log.event('upstream.hedged', delay=info['delay'], winner=info['winner'])
+    served_by = OPENROUTER_MODEL
+    if info['winner'] == 'secondary':
+        served_by = OPENROUTER_HEDGE_MODEL or OPENROUTER_MODEL
+    return {'hedged': info['hedged'], 'servedBy': served_by}
+
+
+def upstream_result(plan, jd, api_error, extra=None):
+    """Record ``plan``'s token usage and return the ``(text, api_error, metadata)`` a flight stores.
+
+    Every flight leader (plain or streamed, WSGI or ASGI) ends with this, so
+    a follower gets the same shape whichever kind of request it joined.
+    """
+    record_token_usage(plan)
+    extra = dict(extra or {})
+    extra['tokens'] = plan.metadata()
+    return jd, api_error, extra
+
+
+def fetch_generation(plan):
+    """One upstream generation (hedged when configured): ``(text, api_error, metadata)``."""
+    if hedging_enabled:
+        jd, api_error, extra = call_openrouter_hedged(plan)
+    else:
+        jd, api_error = call_openrouter(plan)
+        extra = None
+    return upstream_result(plan, jd, api_error, extra)
+
+
+def wants_flag(name):
+    return request.args.get(name, '').lower() in ('1', 'true')
+
+
+def run_generation(data, use_cache=True, force_local=False):
+    """Produce the /generate response body for already validated input.
 
+    Shared by /generate, /generate/batch and the job queue; never raises for
+    upstream problems, it falls back to the local generator instead.
+    """
+    cache_key, started, out = start_generation(data, use_cache, force_local)
+    if out is not None:
+        return out
+
+    with stage('prompt_build'):
+        plan = plan_generation(data)
+    result, coalesced = NO_UPSTREAM_RESULT, False
+    if openrouter_available:
+        try:
+            result, coalesced = upstream_flights.do(cache_key, lambda: fetch_generation(plan))
+        except Exception as e:
+            # Leader crashed or we timed out waiting for it
+            result = (None, str(e), {})
+    return end_generation(data, cache_key, started, result, coalesced)
+
+
+# What a generation that never reached a flight passes to end_generation
+NO_UPSTREAM_RESULT = (None, None, {})
+
+
+def start_generation(data, use_cache=True, force_local=False):
+    """The steps of a generation before the upstream call: ``(cache_key, started, out)``.
+
+    ``out`` is the finished (and recorded) body when no upstream call is
+    needed, else None. Used by run_generation here and in asgi.py.
+    """
+    # Background probes keep the breaker and hedge delay informed between requests
+    diag_prober.ensure_started()
+    started = time.perf_counter()
+    cache_key = generation_cache_key(data)
+    out = generation_without_upstream(data, cache_key, use_cache, force_local)
+    if out is not None:
+        record_history(data, out, started)
+    return cache_key, started, out
+
+
+def end_generation(data, cache_key, started, result, coalesced=False):
+    """The /generate body for a flight's ``(text, api_error, metadata)`` result, recorded in history."""
+    jd, api_error, extra = result
+    out = finish_generation(data, cache_key, jd, api_error, coalesced, extra)
+    record_history(data, out, started)
+    return out
+
+
+def record_history(data, out, started):
+    """Queue a finished generation for the history store (a no-op without HISTORY_DB)."""
+    if history_store is None:
+        return
+    meta = out['metadata']
+    history_store.record({
+        'company': data.get('companyName'),
+        'title': data.get('jobTitle'),
+        'model': meta.get('servedBy') or ('local' if meta.get('fallbackUsed') else OPENROUTER_MODEL),
+        'route': metrics.current_route.get(),
+        'latency_ms': round((time.perf_counter() - started) * 1000, 1),
+        'fallback_used': meta.get('fallbackUsed'),
+        'cache_hit': meta.get('cacheHit'),
+        'api_error': meta.get('apiError'),
+        'inputs': {f: data.get(f) for f in PROMPT_FIELDS},
+        'job_description': out['jobDescription'],
+        'metadata': meta,
+    })
+
+
+def generation_without_upstream(data, cache_key, use_cache=True, force_local=False):
+    """The /generate body when no upstream call is needed (force_local or a cache hit), else None."""
+    route = metrics.current_route.get()
+    # Quick debug override: skip external API
+    if force_local:
+        jd = local_fallback(data, 'force_local')
+        GENERATIONS.inc(route=route, outcome='local')
+        return build_generate_response(jd, data, True, False, False, 'force_local')
+
+    # use_cache=False (the Regenerate button) skips the lookup but still refreshes the entry
+    if use_cache:
+        cached = jd_cache.get(cache_key)
+        if cached:
+            GENERATIONS.inc(route=route, outcome='cache_hit')
+            return build_generate_response(cached, data, False, openrouter_available, False, None,
+                                           cacheHit=True)
+    return None
+
+
+def cache_generation(cache_key, jd, extra):
+    """Store an upstream answer under ``cache_key`` unless it should not be replayed as a cache hit.
+
+    The key is for OPENROUTER_MODEL, so an answer the hedge model won with is
+    served but not cached. Neither is one cut off at max_tokens; the next try
+    gets more headroom.
+    """
+    if extra.get('servedBy', OPENROUTER_MODEL) != OPENROUTER_MODEL:
+        return False
+    if extra.get('tokens', {}).get('truncated'):
+        return False
+    jd_cache.set(cache_key, jd)
+    return True
+
+
+def finish_generation(data, cache_key, jd, api_error, coalesced=False, extra=None):
+    """The /generate body after the upstream call (attempted only when a key is configured)."""
+    route = metrics.current_route.get()
+    # Diagnostics for API usage
+    model_available = openrouter_available
+    api_attempted = model_available
+    extra = extra or {}
     if not model_available:
         # Do not return HTTP 5xx — fall back to local generator instead so frontend still works
-        print('[generate] OPENROUTER_API_KEY not configured; falling back to local generator')
-        api_attempted = False
         api_error = 'OPENROUTER_API_KEY not configured'
-        jd = None
-    
-    if model_available:
-        api_attempted = True
+
+    if not jd:
+        # API failed or returned no content — fall back to local generator
+        log.event('generate.fallback', level='warning' if api_attempted else 'info', api_error=api_error)
+        jd = local_fallback(data, api_error)
+        GENERATIONS.inc(route=route, outcome='fallback')
+        return build_generate_response(jd, data, True, model_available, api_attempted, api_error,
+                                       coalesced=coalesced, **extra)
+
+    GENERATIONS.inc(route=route, outcome='api')
+    cache_generation(cache_key, jd, extra)
+    return build_generate_response(jd, data, False, model_available, api_attempted, api_error,
+                                   coalesced=coalesced, **extra)
+
+
+@app.route("/generate", methods=["POST"])
+def generate():
+    with stage('validation') as m:
+        data = strip_job_fields(request.json or {})
+        missing = missing_job_field(data)
+        if missing:
+            m['outcome'] = 'invalid'
+    if missing:
+        return jsonify(success=False, error=f"Missing {missing}")
+
+    # ?stream=1 is an alias for /generate/stream
+    if wants_flag('stream'):
+        return stream_generate_response(data)
+
+    return jsonify(run_generation(data, use_cache=not wants_flag('nocache'),
+                                  force_local=wants_flag('force_local')))
+
+
+def parse_batch_items():
+    """Read a batch body: a JSON array, ``{"items": [...]}`` or NDJSON (one object per line)."""
+    body = request.get_json(silent=True)
+    if isinstance(body, dict):
+        body = body.get('items')
+    if isinstance(body, list):
+        return body
+    items = []
+    for n, line in enumerate(request.get_data(as_text=True).splitlines(), 1):
+        line = line.strip()
+        if not line:
+            continue
         try:
-            headers = {
-                'Authorization': f'Bearer {OPENROUTER_API_KEY}',
-                'Content-Type': 'application/json',
-                'X-Title': 'AI Job Description Generator'
-            }
-            payload = {
-                'model': OPENROUTER_MODEL,
-                'messages': [{'role': 'user', 'content': prompt}],
-                'temperature': 0.7,
-                'max_tokens': 1500
-            }
-            endpoint = f"{OPENROUTER_BASE_URL.rstrip('/')}/v1/chat/completions"
-            print(f"[API] Calling OpenRouter at {endpoint} with model {OPENROUTER_MODEL}")
-            # Retry on 429 (rate limit) with exponential backoff a few times
-            max_retries = 3
-            backoff = 1
-            resp = None
-            last_exc = None
-            for attempt in range(1, max_retries + 1):
+            items.append(json.loads(line))
+        except ValueError:
+            raise ValueError(f'Invalid JSON on line {n}')
+    return items
+
+
+@app.route("/generate/batch", methods=["POST"])
+def generate_batch():
+    """Generate many descriptions at once, streamed back as NDJSON in completion order.
+
+    Each output line is the /generate body for one input plus its ``index``.
+    ``?concurrency=N`` caps the number of items generated in parallel.
+    """
+    try:
+        items = parse_batch_items()
+    except ValueError as e:
+        return jsonify(success=False, error=str(e)), 400
+    if not items:
+        return jsonify(success=False, error='No items in batch'), 400
+    if len(items) > BATCH_MAX_ITEMS:
+        return jsonify(success=False, error=f'Batch too large (max {BATCH_MAX_ITEMS} items)'), 400
+
+    try:
+        concurrency = int(request.args.get('concurrency', BATCH_CONCURRENCY))
+    except ValueError:
+        concurrency = BATCH_CONCURRENCY
+    concurrency = max(1, min(concurrency, BATCH_MAX_CONCURRENCY, len(items)))
+    use_cache = not wants_flag('nocache')
+    force_local = wants_flag('force_local')
+
+    def run_item(index, item):
+        if not isinstance(item, dict):
+            return {'index': index, 'success': False, 'error': 'Item must be a JSON object'}
+        data = strip_job_fields(dict(item))
+        missing = missing_job_field(data)
+        if missing:
+            return {'index': index, 'success': False, 'error': f"Missing {missing}"}
+        try:
+            out = run_generation(data, use_cache=use_cache, force_local=force_local)
+        except Exception as e:
+            log.event('batch.item_failed', level='error', index=index, error=str(e))
+            return {'index': index, 'success': False, 'error': str(e)}
+        return {'index': index, **out}
+
+    def lines():
+        pool = ThreadPoolExecutor(max_workers=concurrency, thread_name_prefix='batch')
+        try:
+            # copy_context keeps the request's route label on the worker threads' metrics
+            futures = [pool.submit(contextvars.copy_context().run, run_item, i, item)
+                       for i, item in enumerate(items)]
+            for fut in as_completed(futures):
+                yield json.dumps(fut.result()) + '\n'
+        finally:
+            # Client went away or we are done: drop anything not started yet
+            pool.shutdown(wait=False, cancel_futures=True)
+
+    return Response(stream_with_context(lines()), mimetype='application/x-ndjson',
+                    headers={'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'})
+
+
+def run_job(payload):
+    return run_generation(payload['data'], use_cache=payload.get('use_cache', True),
+                          force_local=payload.get('force_local', False))
+
+
+def notify_job_webhook(job):
+    url = (job['payload'] or {}).get('callbackUrl')
+    if not url:
+        return
+    try:
+        upstream.post(url, json=job_view(job), timeout=upstream.timeout(10)).close()
+    except Exception as e:
+        log.event('jobs.webhook_failed', level='warning', job_id=job['id'], error=str(e))
+
+
+def make_job_store():
+    if JOBS_DB:
+        try:
+            return SQLiteJobStore(JOBS_DB)
+        except Exception as e:
+            log.event('jobs.store_disabled', level='warning', path=JOBS_DB, error=str(e))
+    return MemoryJobStore()
+
+
+job_queue = JobQueue(run_job, workers=JOBS_WORKERS, max_depth=JOBS_MAX_DEPTH, result_ttl=JOBS_RESULT_TTL,
+                     store=make_job_store(), on_finish=notify_job_webhook if JOBS_WEBHOOKS else None)
+# Jobs a previous process left queued or running are picked up without waiting for a request
+job_queue.resume()
+
+
+@app.route("/jobs", methods=["POST"])
+def submit_job():
+    """Queue a generation and return its job id straight away (202).
+
+    Accepts the same body and query flags as /generate, plus an optional
+    ``callbackUrl`` that receives the finished job when JOBS_WEBHOOKS is on.
+    """
+    data = strip_job_fields(request.json or {})
+    callback_url = data.pop('callbackUrl', None)
+    missing = missing_job_field(data)
+    if missing:
+        return jsonify(success=False, error=f"Missing {missing}"), 400
+
+    payload = {'data': data, 'use_cache': not wants_flag('nocache'), 'force_local': wants_flag('force_local')}
+    if callback_url and JOBS_WEBHOOKS:
+        payload['callbackUrl'] = callback_url
+    try:
+        job = job_queue.submit(payload)
+    except QueueFull as e:
+        resp = jsonify(success=False, error=str(e))
+        resp.status_code = 429
+        resp.headers['Retry-After'] = '5'
+        return resp
+    out = {'success': True, **job_view(job), 'statusUrl': f"/jobs/{job['id']}"}
+    return jsonify(out), 202
+
+
+@app.route("/jobs/<job_id>", methods=["GET"])
+def get_job(job_id):
+    """Job status and, once done, the /generate body. ``?wait=N`` long-polls up to N seconds."""
+    try:
+        wait = min(float(request.args.get('wait', 0)), JOBS_MAX_WAIT)
+    except ValueError:
+        wait = 0
+    job = job_queue.get(job_id, wait=wait)
+    if job is None:
+        return jsonify(success=False, error='Unknown job id'), 404
+    return jsonify({'success': job['status'] != 'failed', **job_view(job)})
+
+
+HISTORY_CSV_FIELDS = ('id', 'createdAt', 'company', 'title', 'city', 'state', 'jobType', 'experienceLevel',
+                      'salary', 'model', 'route', 'latencyMs', 'fallbackUsed', 'cacheHit', 'apiError',
+                      'jobDescription')
+
+
+def parse_history_time(value):
+    """Epoch seconds or an ISO 8601 date/time (UTC unless it has an offset); ValueError if neither."""
+    if not value:
+        return None
+    try:
+        return float(value)
+    except ValueError:
+        pass
+    t = datetime.fromisoformat(value)
+    if t.tzinfo is None:
+        t = t.replace(tzinfo=timezone.utc)
+    return t.timestamp()
+
+
+def history_filters():
+    """Store filters from ``?company=&title=&since=&until=``; ValueError on a bad time."""
+    return {
+        'company': request.args.get('company', '').strip() or None,
+        'title': request.args.get('title', '').strip() or None,
+        'since': parse_history_time(request.args.get('since')),
+        'until': parse_history_time(request.args.get('until')),
+    }
+
+
+def history_item(entry):
+    """API view of a history entry; full entries also carry the inputs, text and metadata."""
+    item = {
+        'id': entry['id'],
+        'createdAt': datetime.fromtimestamp(entry['created'], timezone.utc).isoformat(timespec='seconds'),
+        'company': entry['company'],
+        'title': entry['title'],
+        'model': entry['model'],
+        'route': entry['route'],
+        'latencyMs': entry['latency_ms'],
+        'fallbackUsed': entry['fallback_used'],
+        'cacheHit': entry['cache_hit'],
+        'apiError': entry['api_error'],
+    }
+    if 'inputs' in entry:
+        item.update(inputs=entry['inputs'], jobDescription=entry['job_description'], metadata=entry['metadata'])
+    return item
+
+
+def history_csv(entries):
+    """CSV text for ``entries``, yielded in chunks of roughly 16 KB."""
+    buf = StringIO()
+    writer = csv.writer(buf)
+    writer.writerow(HISTORY_CSV_FIELDS)
+    for entry in entries:
+        item = history_item(entry)
+        row = dict(item['inputs'], **item)
+        writer.writerow([row.get(f) for f in HISTORY_CSV_FIELDS])
+        if buf.tell() >= 16384:
+            yield buf.getvalue()
+            buf.seek(0)
+            buf.truncate()
+    yield buf.getvalue()
+
+
+def history_disabled():
+    return jsonify(success=False, error='History is disabled (set HISTORY_DB)'), 404
+
+
+@app.route("/history", methods=["GET"])
+def history():
+    """Past generations, newest first, optionally filtered by ``company``, ``title`` (exact,
+    case-insensitive) and ``since``/``until``. ``?limit=`` sets the page size and
+    ``?cursor=`` continues from a previous page's ``nextCursor``.
+    """
+    if history_store is None:
+        return history_disabled()
+    try:
+        filters = history_filters()
+        limit = max(1, min(int(request.args.get('limit', 20)), HISTORY_PAGE_MAX))
+        cursor = int(request.args['cursor']) if request.args.get('cursor') else None
+    except ValueError as e:
+        return jsonify(success=False, error=f'Invalid query: {e}'), 400
+    entries, next_cursor = history_store.page(limit=limit, cursor=cursor, **filters)
+    return jsonify(success=True, items=[history_item(e) for e in entries], nextCursor=next_cursor)
+
+
+@app.route("/history/<int:entry_id>", methods=["GET"])
+def history_entry(entry_id):
+    """One past generation with the same jobDescription/sections/jobDetails fields as /generate."""
+    if history_store is None:
+        return history_disabled()
+    entry = history_store.get(entry_id)
+    if entry is None:
+        return jsonify(success=False, error='Unknown history id'), 404
+    item = history_item(entry)
+    return jsonify(success=True, sections=parse_sections(item['jobDescription']),
+                   jobDetails=build_job_details(item['inputs']), **item)
+
+
+@app.route("/history/export", methods=["GET"])
+def history_export():
+    """Every matching entry as NDJSON (default) or ``?format=csv``, streamed in batches from the store."""
+    if history_store is None:
+        return history_disabled()
+    fmt = request.args.get('format', 'ndjson').lower()
+    if fmt not in ('ndjson', 'csv'):
+        return jsonify(success=False, error="format must be 'ndjson' or 'csv'"), 400
+    try:
+        filters = history_filters()
+    except ValueError as e:
+        return jsonify(success=False, error=f'Invalid query: {e}'), 400
+    entries = history_store.iter_entries(**filters)
+    if fmt == 'csv':
+        body, mimetype = history_csv(entries), 'text/csv'
+    else:
+        body, mimetype = (json.dumps(history_item(e)) + '\n' for e in entries), 'application/x-ndjson'
+    return Response(stream_with_context(body), mimetype=mimetype,
+                    headers={'Content-Disposition': f'attachment; filename=history.{fmt}',
+                             'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'})
+
+
+def sse_event(event, payload):
+    return f"event: {event}\ndata: {json.dumps(payload)}\n\n"
+
+
+def stream_delta(event):
+    """Text carried by one streamed completion event ('' if none); raises on an error event."""
+    if event.get('error'):
+        raise Exception(str(event['error'])[:500])
+    try:
+        choice = event.get('choices', [])[0]
+    except (IndexError, AttributeError):
+        return ''
+    return (choice.get('delta') or {}).get('content') or choice.get('text') or ''
+
+
+def stream_openrouter(plan, outcome, model=None, base_url=None, api_key=None, cancel=None,
+                      on_first_token=None):
+    """Yield cleaned text chunks from a streaming completion.
+
+    ``outcome`` is filled in as the stream progresses: ``raw`` (list of raw
+    pieces), ``api_error`` and ``first_token_ms``. Setting ``cancel`` stops the
+    stream and closes the upstream connection; an upstream.Abort does so even
+    while the call is blocked waiting for headers or the next chunk. A stream
+    that runs to the end records its reported usage on ``plan``.
+    """
+    started = time.time()
+    cleaner = MarkdownStreamCleaner()
+    resp = None
+    try:
+        endpoint = openrouter_endpoint(base_url)
+        log.event('upstream.stream', endpoint=endpoint, model=model or OPENROUTER_MODEL)
+        resp = post_openrouter(openrouter_payload(plan, stream=True, model=model), stream=True,
+                               base_url=base_url, api_key=api_key, cancel=cancel)
+        if not resp.ok:
+            outcome['api_error'] = f"HTTP {resp.status_code}: {resp.text[:500]}"
+            log.event('upstream.http_error', level='warning', status=resp.status_code, body=resp.text[:200])
+            return
+        usage, finish_reason = None, None
+        for event in upstream.iter_sse_data(resp):
+            piece = stream_delta(event)
+            # Usage and finish_reason come with the last events
+            event_usage, event_finish = usage_of(event)
+            usage, finish_reason = event_usage or usage, event_finish or finish_reason
+            if cancel is not None and cancel.is_set():
+                outcome['api_error'] = 'cancelled'
+                return
+            if not piece:
+                continue
+            if on_first_token is not None and not outcome['raw']:
+                on_first_token()
+            outcome['raw'].append(piece)
+            text = cleaner.feed(piece)
+            if text:
+                if outcome['first_token_ms'] is None:
+                    outcome['first_token_ms'] = int((time.time() - started) * 1000)
+                yield text
+        if cancel is not None and cancel.is_set():
+            # The aborted socket ends the body early; that is not a complete answer
+            outcome['api_error'] = 'cancelled'
+            return
+        plan.record(usage, finish_reason)
+        tail = cleaner.finish()
+        if tail:
+            yield tail
+    except Exception as e:
+        outcome['api_error'] = str(e)
+        log.event('upstream.stream_failed', level='warning', error=outcome['api_error'])
+    finally:
+        if resp is not None:
+            upstream.close(resp)
+
+
+def stream_cache_hit(data, cached, started):
+    """The whole event stream for a cached description."""
+    GENERATIONS.inc(route=metrics.current_route.get(), outcome='cache_hit')
+    out = build_generate_response(cached, data, False, openrouter_available, False, None,
+                                  streamed=True, cacheHit=True)
+    record_history(data, out, started)
+    return [sse_event('delta', {'text': cached}), sse_event('done', out)]
+
+
+def stream_upstream_state(force_local):
+    """``(model_available, api_error)`` before a streamed generation starts."""
+    if force_local:
+        return False, 'force_local'
+    if not openrouter_available:
+        return False, 'OPENROUTER_API_KEY not configured'
+    return True, None
+
+
+def new_stream_outcome():
+    """The ``outcome`` dict stream_openrouter fills in."""
+    return {'raw': [], 'api_error': None, 'first_token_ms': None}
+
+
+# A stream leader that never finishes (client gone, server error) leaves this for its followers
+STREAM_ABORTED_RESULT = (None, 'Streaming request aborted before completion', {})
+
+
+def stream_result(plan, outcome):
+    """The flight result of a finished upstream stream: same shape as fetch_generation's."""
+    jd = None
+    api_error = outcome['api_error']
+    if not api_error:
+        with stage('markdown_cleanup'):
+            jd = clean_markdown(''.join(outcome['raw']))
+        if not jd:
+            api_error = 'OpenRouter returned empty content'
+    return upstream_result(plan, jd, api_error)
+
+
+def finish_stream(data, cache_key, jd, api_error, outcome, model_available, api_attempted, coalesced,
+                  force_local, extra=None, started=None):
+    """The closing SSE events of a streamed generation: the fallback (if needed) and ``done``."""
+    route = metrics.current_route.get()
+    extra = extra or {}
+    if not jd:
+        log.event('generate.fallback', level='warning' if api_attempted else 'info', api_error=api_error,
+                  streamed=True)
+        if outcome['raw']:
+            yield sse_event('reset', {})
+        jd = local_fallback(data, api_error)
+        GENERATIONS.inc(route=route, outcome='local' if force_local else 'fallback')
+        yield sse_event('delta', {'text': jd})
+        out = build_generate_response(jd, data, True, model_available, api_attempted, api_error,
+                                      streamed=True, coalesced=coalesced, **extra)
+    else:
+        GENERATIONS.inc(route=route, outcome='api')
+        cache_generation(cache_key, jd, extra)
+        out = build_generate_response(jd, data, False, model_available, api_attempted, api_error,
+                                      streamed=True, coalesced=coalesced,
+                                      firstTokenMs=outcome['first_token_ms'], **extra)
+    if started is not None:
+        record_history(data, out, started)
+    yield sse_event('done', out)
+
+
+def stream_generate_response(data):
+    """Stream a generation to the browser as Server-Sent Events.
+
+    Cleaned text is sent as ``delta`` events while the model produces it and
+    the stream ends with a ``done`` event carrying the same body /generate
+    returns. If the upstream fails part-way a ``reset`` event tells the client
+    to discard what it has and the local fallback is sent instead. Hedging is
+    not used here: the first token is already what the user is waiting for.
+    """
+    force_local = wants_flag('force_local')
+    cache_key = generation_cache_key(data)
+    cached = None
+    if not force_local and not wants_flag('nocache'):
+        cached = jd_cache.get(cache_key)
+
+    def events():
+        started = time.perf_counter()
+        if cached:
+            yield from stream_cache_hit(data, cached, started)
+            return
+
+        model_available, api_error = stream_upstream_state(force_local)
+        api_attempted = False
+        coalesced = False
+        jd = None
+        extra = {}
+        outcome = new_stream_outcome()
+
+        if model_available:
+            api_attempted = True
+            # Acquire inside the generator so a response that is never iterated
+            # cannot leave a flight open
+            call, leader = upstream_flights.acquire(cache_key)
+            if leader:
+                # A /generate follower may be waiting on this result
+                result = STREAM_ABORTED_RESULT
                 try:
-                    resp = requests.post(endpoint, headers=headers, json=payload, timeout=30)
-                    if resp.status_code == 429 and attempt < max_retries:
-                        print(f"[API] Rate limited (429). Retry {attempt}/{max_retries} after {backoff}s")
-                        time.sleep(backoff)
-                        backoff *= 2
-                        continue
-                    # break out on success or non-retriable status
-                    break
-                except Exception as e:
-                    last_exc = e
-                    print(f"[API] Request attempt {attempt} failed: {e}")
-                    if attempt < max_retries:
-                        time.sleep(backoff)
-                        backoff *= 2
-                        continue
-                    else:
-                        raise
-            if resp is None:
-                raise last_exc or Exception('No response from OpenRouter')
-            if resp.ok:
-                j = resp.json()
-                print(f"[API] Response received: {j.keys() if isinstance(j, dict) else 'non-dict'}")
-                # Prefer the chat-style response structure
+                    with stage('prompt_build'):
+                        plan = plan_generation(data)
+                    for text in stream_openrouter(plan, outcome):
+                        yield sse_event('delta', {'text': text})
+                    result = stream_result(plan, outcome)
+                finally:
+                    upstream_flights.release(cache_key, call, result=result)
+                jd, api_error, extra = result
+            else:
+                coalesced = True
                 try:
-                    jd = j.get('choices', [])[0].get('message', {}).get('content')
-                except Exception as parse_err:
-                    print(f"[API] Parse error: {parse_err}")
-                    jd = None
-                if not jd:
-                    # fallback to other possible shapes
-                    try:
-                        jd = j.get('choices', [])[0].get('text')
-                    except Exception:
-                        jd = None
-                
-                # Clean markdown formatting from response
+                    jd, api_error, extra = upstream_flights.wait(call)
+                except Exception as e:
+                    jd, api_error = None, str(e)
                 if jd:
-                    # Remove markdown bold markers (**text** or __text__)
-                    jd = jd.replace('**', '').replace('__', '')
-                    # Remove markdown headers (### or ##)
-                    import re
-                    jd = re.sub(r'^#{1,6}\s+', '', jd, flags=re.MULTILINE)
-                    # Clean up any extra whitespace
-                    jd = re.sub(r'\n\s*\n\s*\n+', '\n\n', jd)
-                    jd = jd.strip()
-                
-                if not jd:
-                    api_error = f'OpenRouter returned empty content. Response: {str(j)[:200]}'
-                    print(f'[API] Empty content error: {api_error}')
-            else:
-                api_error = f"HTTP {resp.status_code}: {resp.text[:500]}"
-                print(f'[API] HTTP error {resp.status_code}: {resp.text[:200]}')
-                jd = None
-        except Exception as e:
-            api_error = str(e)
-            print('OpenRouter request failed:', api_error)
-            jd = None
-    # If no content produced by OpenRouter, return an error response (no fallback)
-    if not jd:
-        # API failed or returned no content — fall back to local generator
-        print(f"[generate] OpenRouter failed or returned empty content. api_error={api_error}")
-        jd = generate_local_job_description(data)
-        fallback = True
-
-        out = {
-            'success': True,
-            'jobDescription': jd,
-            'jobDetails': {
-                'title': (data.get('jobTitle') or '').title(),
-                'company': (data.get('companyName') or '').title(),
-                'location': f"{(data.get('city') or '').title()}, {(data.get('state') or '').title()}",
-                'jobType': (data.get('jobType') or '').replace('-', ' ').title(),
-                'experienceLevel': get_experience_label(data.get('experienceLevel', '')),
-                'salary': (data.get('salary') or ''),
-                'email': data.get('companyEmail') or ''
-            },
-            'metadata': {
-                'wordCount': len(jd.split()),
-                'fallbackUsed': True,
-                'modelAvailable': model_available,
-                'apiAttempted': api_attempted,
-                'apiError': api_error
-            }
-        }
-
-        return jsonify(out)
-    out = {
-        'success': True,
-        'jobDescription': jd,
-        'jobDetails': {
-            'title': (data.get('jobTitle') or '').title(),
-            'company': (data.get('companyName') or '').title(),
-            'location': f"{(data.get('city') or '').title()}, {(data.get('state') or '').title()}",
-            'jobType': (data.get('jobType') or '').replace('-', ' ').title(),
-            'experienceLevel': get_experience_label(data.get('experienceLevel', '')),
-            'salary': (data.get('salary') or ''),
-            'email': data.get('companyEmail') or ''
-        },
-        'metadata': {
-            'wordCount': len(jd.split()),
-            'fallbackUsed': False,
-            'modelAvailable': model_available,
-            'apiAttempted': api_attempted,
-            'apiError': api_error
-        }
-    }
+                    yield sse_event('delta', {'text': jd})
+
+        yield from finish_stream(data, cache_key, jd, api_error, outcome, model_available, api_attempted,
+                                 coalesced, force_local, extra, started)
 
+    return Response(stream_with_context(events()), mimetype='text/event-stream',
+                    headers={'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'})
+
+
+@app.route("/generate/stream", methods=["POST"])
+def generate_stream():
+    with stage('validation') as m:
+        data = strip_job_fields(request.json or {})
+        missing = missing_job_field(data)
+        if missing:
+            m['outcome'] = 'invalid'
+    if missing:
+        return jsonify(success=False, error=f"Missing {missing}")
+    return stream_generate_response(data)
 
-    return jsonify(out)
 
 def get_experience_label(level):
     """Convert experience level to readable format"""
-    labels = {
-        'entry': 'Entry Level (0-2 years)',
-        'mid': 'Mid Level (3-5 years)', 
-        'senior': 'Senior Level (5-8 years)',
-        'lead': 'Lead/Principal (8+ years)'
-    }
-    return labels.get(level, level.title())
+    return experience_label(level)
 
 
 def generate_local_job_description(data: dict) -> str:
     """Simple deterministic job description generator used as a fallback when the API is unavailable.
 
     This produces a clean, well-structured job posting using the submitted fields. It's intentionally
-    simple and safe (no external calls) so it will work under quota conditions.
+    simple and safe (no external calls) so it will work under quota conditions. The layout is a
+    precompiled template (see local_templates.py); use ``local_templates.render_many`` for bulk work.
     """
-    title = (data.get('jobTitle') or 'Unknown Position').strip()
-    company = (data.get('companyName') or '').strip()
-    city = (data.get('city') or '').strip()
-    state = (data.get('state') or '').strip()
-    job_type = (data.get('jobType') or '').strip()
-    exp = get_experience_label(data.get('experienceLevel', ''))
-    degree = (data.get('degree') or 'Relevant degree').strip()
-    skills = (data.get('skillsKnown') or '').strip()
-    salary = (data.get('salary') or '').strip()
-    email = (data.get('companyEmail') or '').strip()
-    add = (data.get('additionalDetails') or '').strip()
-
-    # Build responsibilities using skills as hints
-    skills_list = [s.strip() for s in skills.split(',') if s.strip()]
-    responsibilities = [
-        f"Design, develop and maintain {title} features using {', '.join(skills_list) if skills_list else 'relevant technologies' }.",
-        "Collaborate with cross-functional teams to define, design, and ship new features.",
-        "Write clean, maintainable code and unit tests; participate in code reviews.",
-        "Troubleshoot, debug and optimize application performance and user experience.",
-        "Help document technical designs and contribute to team knowledge sharing."
-    ]
-
-    # Qualifications
-    required_quals = [
-        f"Bachelor's degree in {degree} or equivalent experience.",
-        f"{exp} experience level.",
-        f"Proven experience with {', '.join(skills_list)}." if skills_list else "Relevant technical skills.",
-    ]
-
-    preferred_quals = [
-        "Familiarity with version control (Git) and CI/CD pipelines.",
-        "Experience working in Agile teams.",
-        "Strong problem-solving and communication skills."
-    ]
-
-    offer = [
-        f"Salary: {salary}" if salary else "Competitive salary.",
-        "Opportunities for growth and professional development.",
-        "Supportive team environment and flexible working arrangements where applicable."
-    ]
-
-    # Assemble text
-    lines = []
-    lines.append(f"Job Overview:\n{title} at {company} — {city}, {state}\n")
-    lines.append(f"{title} at {company} is a {job_type} role targeted at {exp}. The successful candidate will work on building reliable, user-focused applications and collaborate across teams to deliver high-quality software.")
-    lines.append("\nKey Responsibilities:")
-    for r in responsibilities:
-        lines.append(f"- {r}")
-
-    lines.append("\nRequired Qualifications:")
-    for q in required_quals:
-        lines.append(f"- {q}")
-
-    lines.append("\nPreferred Qualifications:")
-    for q in preferred_quals:
-        lines.append(f"- {q}")
-
-    if add:
-        lines.append("\nAdditional Details:")
-        lines.append(f"{add}")
-
-    lines.append("\nWhat We Offer:")
-    for o in offer:
-        lines.append(f"- {o}")
-
-    lines.append("\nHow to Apply:")
-    if email:
-        lines.append(f"Please send your resume and a brief cover letter to {email} with the subject '{title} Application'.")
-    else:
-        lines.append("Please apply through the company's careers page or contact the hiring team for application instructions.")
+    return local_templates.render(data)
 
-    return "\n".join(lines)
 
-
-@app.route('/download_pdf', methods=['POST'])
-def download_pdf():
-    """Generate a simple PDF from posted jobDetails and jobDescription and return it."""
-    data = request.json or {}
+def parse_pdf_request(data):
+    """``(jobDetails, jobDescription, sections, cache key)`` from a /download_pdf body; ValueError if invalid."""
     jobDetails = data.get('jobDetails') or {}
     jobDescription = data.get('jobDescription') or ''
+    sections = data.get('sections')
+    if sections is not None:
+        if not valid_sections(sections):
+            raise ValueError('Invalid sections')
+        jobDescription = ''
+    key = content_hash({'layout': PDF_LAYOUT_VERSION, 'jobDetails': jobDetails,
+                        'jobDescription': jobDescription, 'sections': sections})
+    return jobDetails, jobDescription, sections, key
 
-    # Create PDF in memory
-    buffer = BytesIO()
-    c = canvas.Canvas(buffer, pagesize=A4)
-    # Create PDF in memory
-    buffer = BytesIO()
-    c = canvas.Canvas(buffer, pagesize=A4)
-    width, height = A4
-    margin = 48
 
-    title = (jobDetails.get('title') or 'Job Description')
-    company = jobDetails.get('company', '')
-    location = jobDetails.get('location', '')
-
-    max_width = width - margin * 2
-
-    # Helper: draw page border and header area. Call after creating a new page.
-    def draw_decorations():
-        # Outer formal border
-        border_pad = 18
-        c.setStrokeColorRGB(0.85, 0.78, 0.60)  # soft-gold
-        c.setLineWidth(2)
-        # sharp-corner outer border (formal look)
-        c.rect(border_pad, border_pad, width - border_pad * 2, height - border_pad * 2, stroke=1, fill=0)
-
-        # Header box (light cream background with soft gold border)
-        header_h = 92
-        header_x = margin
-        header_y_top = height - margin
-        header_w = width - margin * 2
-        header_y = header_y_top - header_h
-        c.setFillColorRGB(0.99, 0.97, 0.93)  # light cream
-        c.setStrokeColorRGB(0.91, 0.76, 0.33)  # soft gold border
-        c.setLineWidth(0.8)
-        # sharp-corner header box to match outer border
-        c.rect(header_x, header_y, header_w, header_h, stroke=1, fill=1)
-
-        # Badge circle (left)
-        badge_r = 26
-        badge_cx = header_x + 20 + badge_r
-        badge_cy = header_y + header_h / 2
-        c.setFillColorRGB(0.88, 0.12, 0.2)
-        c.circle(badge_cx, badge_cy, badge_r, stroke=0, fill=1)
-        # initial letter
-        initial = (company or 'U')[:1].upper()
-        c.setFillColorRGB(1, 1, 1)
-        c.setFont('Helvetica-Bold', 20)
-        c.drawCentredString(badge_cx, badge_cy - 7, initial)
-
-        # Title and subtitle (wrap long text so full names display)
-        text_x = badge_cx + badge_r + 12
-        title_y = header_y + header_h - 18
-        c.setFillColorRGB(0.1, 0.08, 0.08)
-        c.setFont('Helvetica-Bold', 18)
-        # compute available width for text (leave room for salary pill)
-        text_max_width = header_x + header_w - text_x - 120
-        wrapped_title = simpleSplit(title, 'Helvetica-Bold', 18, text_max_width)
-        cur_y = title_y
-        for line in wrapped_title:
-            c.drawString(text_x, cur_y, line)
-            cur_y -= 20
-
-        # subtitle (company — location), allow wrapping into one or two small lines
-        c.setFont('Helvetica', 10)
-        c.setFillColorRGB(0.2, 0.2, 0.2)
-        sub_text = f"{company} — {location}"
-        wrapped_sub = simpleSplit(sub_text, 'Helvetica', 10, text_max_width)
-        for sline in wrapped_sub:
-            c.drawString(text_x, cur_y, sline)
-            cur_y -= 14
-
-        # Chips (jobType + experience) below title
-        chip_y = title_y - 38
-        chip_x = text_x
-        chip_colors = [(0.86,0.1,0.13),(0.93,0.76,0.33)]
-        chips = [jobDetails.get('jobType',''), jobDetails.get('experienceLevel','')]
-        c.setFont('Helvetica', 9)
-        for i, ch in enumerate(chips):
-            if not ch: continue
-            tw = c.stringWidth(ch, 'Helvetica', 9) + 12
-            c.setFillColorRGB(*chip_colors[i % len(chip_colors)])
-            c.roundRect(chip_x, chip_y - 6, tw, 16, 6, stroke=0, fill=1)
-            c.setFillColorRGB(1,1,1)
-            c.drawString(chip_x + 6, chip_y, ch)
-            chip_x += tw + 8
-
-        # Salary pill aligned right in header
-        salary = jobDetails.get('salary','')
-        if salary:
-            pill_w = c.stringWidth(salary, 'Helvetica-Bold', 10) + 28
-            pill_x = header_x + header_w - pill_w - 18
-            pill_y = badge_cy - 12
-            c.setFillColorRGB(0.09, 0.61, 0.35)  # green
-            c.roundRect(pill_x, pill_y, pill_w, 24, 12, stroke=0, fill=1)
-            c.setFillColorRGB(1,1,1)
-            c.setFont('Helvetica-Bold', 10)
-            c.drawCentredString(pill_x + pill_w/2, pill_y + 6, salary)
-
-        # Return y start for body text below header
-        return header_y - 12
-
-    # Initialize first page decorations and starting y
-    y = draw_decorations()
-
-    # Body: parse lines and format sections (headers, bullets, paragraphs)
-    # Helper to draw text with control over char spacing and leading
-    def draw_text_line(x, y_pos, text, fontname='Helvetica', fontsize=11, charspace=0):
-        ta = c.beginText()
-        ta.setTextOrigin(x, y_pos)
-        ta.setFont(fontname, fontsize)
-        try:
-            if charspace:
-                ta.setCharSpace(charspace)
-        except Exception:
-            pass
-        ta.textLine(text)
-        c.drawText(ta)
-
-    c.setFillColorRGB(0.2,0.2,0.2)
-    base_font = 'Helvetica'
-    base_size = 11
-    leading = 15
-    header_size = 14
-    header_leading = 18
-
-    for raw in jobDescription.split('\n'):
-        line = raw.strip()
-        if not line:
-            y -= int(leading * 0.4)
-            continue
+@app.route('/download_pdf', methods=['POST'])
+def download_pdf():
+    """Generate a simple PDF from posted jobDetails and jobDescription and return it.
 
-        # Section header
-        if line.endswith(':') or (len(line) < 60 and line.upper() == line and ' ' in line):
-            h = line.rstrip(':')
-            if y < margin + 20:
-                c.showPage(); y = draw_decorations();
-            c.setFillColorRGB(0.55, 0.08, 0.08)
-            wrapped = simpleSplit(h, 'Helvetica-Bold', header_size, max_width)
-            for wline in wrapped:
-                draw_text_line(margin, y, wline, fontname='Helvetica-Bold', fontsize=header_size, charspace=0.2)
-                y -= header_leading
-            c.setFillColorRGB(0.2,0.2,0.2)
-            y -= 4
-            continue
+    Finished PDFs are cached under a hash of the posted content. The hash is
+    also the ETag, so a repeat Preview/Download that sends If-None-Match gets
+    a 304 without rendering anything. Fresh renders go through a spooled temp
+    file and are streamed back in chunks rather than copied into the response.
 
-        # Bullet lines
-        if line.startswith('- '):
-            btext = line[2:].strip()
-            wrap = simpleSplit(btext, base_font, base_size, max_width - 36)
-            if y < margin + 20:
-                c.showPage(); y = draw_decorations();
-            # draw bullet and wrapped lines
-            bullet_x = margin + 6
-            text_x = margin + 20
-            # bullet dot
-            c.circle(bullet_x, y + 4, 2.5, stroke=0, fill=1)
-            first = True
-            for wline in wrap:
-                if first:
-                    draw_text_line(text_x, y, wline, fontname=base_font, fontsize=base_size, charspace=0.15)
-                    first = False
-                else:
-                    y -= int(base_size * 1.1)
-                    if y < margin + 20:
-                        c.showPage(); y = draw_decorations();
-                    draw_text_line(text_x, y, wline, fontname=base_font, fontsize=base_size, charspace=0.15)
-            y -= int(base_size * 1.35)
-            continue
+    Instead of ``jobDescription`` the body may carry ``sections`` (the model
+    returned by /generate), which is laid out as-is without re-parsing text.
+    """
+    try:
+        jobDetails, jobDescription, sections, key = parse_pdf_request(request.json or {})
+    except ValueError as e:
+        return jsonify(success=False, error=str(e)), 400
+    etag = key[:32]
+    if etag in request.if_none_match:
+        resp = Response(status=304)
+        resp.set_etag(etag)
+        return resp
+
+    from pdf_render import render_job_pdf, pdf_filename
+    pdf = pdf_cache.get(key)
+    if pdf is not None:
+        body, size = BytesIO(pdf), len(pdf)
+    else:
+        body = render_job_pdf(jobDetails, jobDescription, sections=sections,
+                              out=SpooledTemporaryFile(max_size=PDF_SPOOL_MAX_MEMORY))
+        size = body.tell()
+        body.seek(0)
+        if size <= PDF_SPOOL_MAX_MEMORY:
+            pdf_cache.set(key, body.read())
+            body.seek(0)
 
-        # Normal paragraph
-        wrapped = simpleSplit(line, base_font, base_size, max_width)
-        for wline in wrapped:
-            if y < margin + 20:
-                c.showPage(); y = draw_decorations();
-            draw_text_line(margin, y, wline, fontname=base_font, fontsize=base_size, charspace=0.1)
-            y -= leading
+    title = (jobDetails.get('title') or 'Job Description')
+    filename = pdf_filename(title)
+    resp = send_file(body, mimetype='application/pdf', as_attachment=True, download_name=filename,
+                     etag=etag)
+    resp.content_length = size
+    resp.headers['Cache-Control'] = 'private, no-cache'
+    return resp
+
+
+@app.route('/download_pdf/batch', methods=['POST'])
+def download_pdf_batch():
+    """Render many postings and stream them back as a ZIP of PDFs (default) or,
+    with ``?format=pdf``, as one merged PDF.
+
+    The body is a JSON array, ``{"items": [...]}`` or NDJSON, each item being
+    ``{"jobDetails": {...}, "jobDescription": "..."}`` (or ``"sections"``) as for
+    /download_pdf.
+    Output keeps the input order and is written as each posting is rendered.
+    """
+    try:
+        items = parse_batch_items()
+    except ValueError as e:
+        return jsonify(success=False, error=str(e)), 400
+    if not items:
+        return jsonify(success=False, error='No items in batch'), 400
+    if len(items) > PDF_BATCH_MAX_ITEMS:
+        return jsonify(success=False, error=f'Batch too large (max {PDF_BATCH_MAX_ITEMS} items)'), 400
+    for i, item in enumerate(items):
+        if not isinstance(item, dict) or not isinstance(item.get('jobDetails') or {}, dict):
+            return jsonify(success=False, error=f'Item {i} must be an object with jobDetails and jobDescription'), 400
+        if item.get('sections') is not None and not valid_sections(item['sections']):
+            return jsonify(success=False, error=f'Item {i} has invalid sections'), 400
+
+    fmt = request.args.get('format', 'zip').lower()
+    if fmt not in ('zip', 'pdf'):
+        return jsonify(success=False, error="format must be 'zip' or 'pdf'"), 400
+
+    import pdf_batch
+    pool = pdf_batch.get_pool(min(PDF_BATCH_WORKERS, len(items)), PDF_BATCH_START_METHOD)
+    results = pdf_batch.render_all(items, pool, window=max(2, PDF_BATCH_WORKERS * 2))
+    if fmt == 'pdf':
+        body, mimetype, filename = pdf_batch.merged_pdf_stream(results), 'application/pdf', 'job_descriptions.pdf'
+    else:
+        body, mimetype, filename = pdf_batch.zip_stream(results), 'application/zip', 'job_descriptions.zip'
+    return Response(stream_with_context(body), mimetype=mimetype,
+                    headers={'Content-Disposition': f'attachment; filename={filename}',
+                             'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'})
 
-    c.showPage()
-    c.save()
 
-    buffer.seek(0)
-    filename = f"{title.replace(' ', '_').lower()}_job_description.pdf"
-    return send_file(buffer, mimetype='application/pdf', as_attachment=True, download_name=filename)
+@app.route('/metrics', methods=['GET'])
+def metrics_endpoint():
+    """Counters and latency histograms in the Prometheus text format."""
+    return Response(metrics.registry.render(), mimetype='text/plain; version=0.0.4')
 
 
 @app.route('/debug', methods=['GET'])
 def debug_status():
     """Return lightweight diagnostics about generative API availability (does not return keys)."""
+    diag_prober.ensure_started()
     return jsonify({
         'openrouter_key_present': bool(OPENROUTER_API_KEY),
         'model_available': openrouter_available,
         'model_name': OPENROUTER_MODEL,
         'model_init_error': openrouter_init_error,
-        'base_url': OPENROUTER_BASE_URL
+        'base_url': OPENROUTER_BASE_URL,
+        'http_pool': upstream.pool_stats(),
+        'jd_cache': jd_cache.stats(),
+        'pdf_cache': pdf_cache.stats(),
+        'static_assets': static_assets.stats(),
+        'rendered_pages': sorted(rendered_pages),
+        'pdf_batch_pool': dict(sys.modules['pdf_batch'].pool_stats() if 'pdf_batch' in sys.modules
+                               else {'loaded': False}, workers=PDF_BATCH_WORKERS),
+        'prewarm': dict(prewarm_state),
+        'singleflight': upstream_flights.stats(),
+        'rate_limiter': upstream_limiter.stats(),
+        'probe_limiter': probe_limiter.stats(),
+        'circuit_breaker': upstream_breaker.stats(),
+        'jobs': job_queue.stats(),
+        'history': history_store.stats() if history_store is not None else None,
+        'probes': diag_prober.stats(),
+        'event_log': log.stats(),
+        'token_budget': generation_budget.stats(),
+        'hedging': dict(hedger.stats(), enabled=hedging_enabled,
+                        hedge_model=OPENROUTER_HEDGE_MODEL or None,
+                        hedge_base_url=OPENROUTER_HEDGE_BASE_URL or None)
     })
 
+def probe_dns():
+    # DNS check via public DNS-over-HTTPS (Google) as a lightweight alternative
+    dns_resp = upstream.get('https://dns.google/resolve?name=openrouter.ai', timeout=upstream.timeout(5))
+    if not dns_resp.ok:
+        return {'status': f'HTTP {dns_resp.status_code}'}
+    j = dns_resp.json()
+    answers = j.get('Answer') or j.get('answer') or []
+    ips = [a.get('data') for a in answers if isinstance(a, dict) and a.get('type') in (1,)]
+    return {'status': 'OK', 'ips': ips}
+
+
+def probe_https():
+    # HTTPS connectivity check using requests
+    r = upstream.get('https://openrouter.ai', timeout=upstream.timeout(5))
+    return {
+        'status': 'OK' if r.ok else f'HTTP {r.status_code}',
+        'response_code': r.status_code,
+        'headers_preview': dict(list(r.headers.items())[:5])
+    }
+
+
+def probe_api():
+    """A tiny real completion. Goes through post_openrouter, so it counts towards the
+    circuit breaker (and acts as its half-open probe); it takes its permit from
+    probe_limiter and never waits for it."""
+    if not OPENROUTER_API_KEY:
+        return {'status': 'SKIPPED', 'reason': 'OPENROUTER_API_KEY not set'}
+    payload = {
+        'model': OPENROUTER_MODEL,
+        'messages': [{'role': 'user', 'content': 'Hello'}],
+        'temperature': 0.2,
+        'max_tokens': 10
+    }
+    try:
+        resp = post_openrouter(payload, max_retries=1, wait=False, timeout=upstream.timeout(10),
+                               limiter=probe_limiter)
+    except (RateLimited, CircuitOpen) as e:
+        return {'status': 'SKIPPED', 'reason': str(e)}
+    out = {
+        'status': 'OK' if resp.ok else f'HTTP {resp.status_code}',
+        'response_code': resp.status_code,
+        'has_content': len(resp.text) > 0
+    }
+    if not resp.ok:
+        out['error_preview'] = resp.text[:200]
+    return out
+
+
+def record_probe(name, result):
+    # A healthy API probe is a (slightly pessimistic) first-token latency sample, so the
+    # hedge delay is warm before real traffic arrives
+    if name == 'api' and result.get('status') == 'OK':
+        hedger.observe(result['latency_ms'] / 1000.0)
+
+
+# /diag serves the latest probe results; the probes run in the background every
+# DIAG_PROBE_INTERVAL seconds (0 = only on ?refresh=1), at most one run at a time.
+# The first scheduled run also waits an interval (plus jitter), so a cold instance
+# does not spend quota on a probe the moment its first /generate arrives.
+diag_prober = Prober({'dns': probe_dns, 'https': probe_https, 'api': probe_api},
+                     interval=float(os.getenv('DIAG_PROBE_INTERVAL', '300')),
+                     min_refresh_interval=float(os.getenv('DIAG_REFRESH_MIN_INTERVAL', '30')),
+                     on_result=record_probe)
+
+
 @app.route('/diag', methods=['GET'])
 def diag():
-    """Diagnostic endpoint: test DNS, connectivity, and API health.
+    """Diagnostic endpoint: DNS, connectivity, and API health.
 
-    This version avoids using the low-level `socket` module so it can run
-    in environments where raw socket operations are restricted.
+    Returns the latest background probe results immediately (each with its
+    latency and time). ``?refresh=1`` re-runs the probes first; concurrent
+    refreshes share one run and refreshes within DIAG_REFRESH_MIN_INTERVAL
+    seconds of the last run just return the cached results.
     """
-    import sys
-    results = {
+    diag_prober.ensure_started()
+    refresh = None
+    if wants_flag('refresh'):
+        refresh = diag_prober.refresh()
+    return jsonify(diag_report(refresh))
+
+
+def diag_report(refresh=None):
+    """The /diag body from the latest probe snapshot."""
+    snap = diag_prober.snapshot()
+    checks = snap.pop('checks')
+    return {
         'timestamp': str(__import__('datetime').datetime.now()),
         'python_version': sys.version,
-        'dns_checks': {},
-        'connectivity_checks': {},
-        'api_status': None
+        'dns_checks': {'openrouter.ai': checks['dns']} if 'dns' in checks else {},
+        'connectivity_checks': {'openrouter_https': checks['https']} if 'https' in checks else {},
+        'api_status': checks.get('api'),
+        'probes': dict(snap, refresh=refresh),
+        'circuit_breaker': upstream_breaker.stats()
     }
 
-    # DNS check via public DNS-over-HTTPS (Google) as a lightweight alternative
-    try:
-        dns_resp = requests.get('https://dns.google/resolve?name=openrouter.ai', timeout=5)
-        if dns_resp.ok:
-            j = dns_resp.json()
-            answers = j.get('Answer') or j.get('answer') or []
-            ips = [a.get('data') for a in answers if isinstance(a, dict) and a.get('type') in (1,)]
-            results['dns_checks']['openrouter.ai'] = {'status': 'OK', 'ips': ips}
-        else:
-            results['dns_checks']['openrouter.ai'] = {'status': f'HTTP {dns_resp.status_code}'}
-    except Exception as e:
-        results['dns_checks']['openrouter.ai'] = {'status': 'FAILED', 'error': str(e)}
 
-    # HTTPS connectivity check using requests
-    try:
-        r = requests.get('https://openrouter.ai', timeout=5)
-        results['connectivity_checks']['openrouter_https'] = {
-            'status': 'OK' if r.ok else f'HTTP {r.status_code}',
-            'response_code': r.status_code,
-            'headers_preview': dict(list(r.headers.items())[:5])
-        }
-    except Exception as e:
-        results['connectivity_checks']['openrouter_https'] = {'status': 'FAILED', 'error': str(e)}
+# PREWARM=pdf,http,assets does the work deferred at import in a background thread
+# straight away, so the first PDF, OpenRouter call or compressed asset doesn't wait for it.
+PREWARM = [p.strip() for p in os.getenv('PREWARM', '').split(',') if p.strip()]
+prewarm_state = {}
 
-    # API quick health check (keeps same behavior but uses requests only)
-    if OPENROUTER_API_KEY:
+
+def prewarm(parts=('pdf', 'http', 'assets')):
+    """Load the PDF stack, create the HTTP session and compress the static assets now.
+
+    Each part's time (ms) or error ends up in /debug under ``prewarm``.
+    """
+    for part in parts:
+        t = time.perf_counter()
         try:
-            headers = {
-                'Authorization': f'Bearer {OPENROUTER_API_KEY}',
-                'Content-Type': 'application/json'
-            }
-            payload = {
-                'model': OPENROUTER_MODEL,
-                'messages': [{'role': 'user', 'content': 'Hello'}],
-                'temperature': 0.2,
-                'max_tokens': 10
-            }
-            endpoint = f"{OPENROUTER_BASE_URL.rstrip('/')}/v1/chat/completions"
-            resp = requests.post(endpoint, headers=headers, json=payload, timeout=10)
-            results['api_status'] = {
-                'status': 'OK' if resp.ok else f'HTTP {resp.status_code}',
-                'response_code': resp.status_code,
-                'has_content': len(resp.text) > 0
-            }
-            if not resp.ok:
-                results['api_status']['error_preview'] = resp.text[:200]
+            if part == 'pdf':
+                from pdf_render import render_job_pdf
+                # A throwaway render also loads reportlab's fonts and metrics
+                render_job_pdf({'title': 'Warm-up'}, 'Job Overview:\nWarm-up.')
+            elif part == 'http':
+                upstream.get_session()
+            elif part == 'assets':
+                static_assets.prewarm()
+            else:
+                raise ValueError(f'unknown part {part!r}')
+            prewarm_state[part] = round((time.perf_counter() - t) * 1000, 1)
         except Exception as e:
-            results['api_status'] = {'status': 'FAILED', 'error': str(e)}
-    else:
-        results['api_status'] = {'status': 'SKIPPED', 'reason': 'OPENROUTER_API_KEY not set'}
+            prewarm_state[part] = f'error: {e}'
+            log.event('prewarm.failed', level='warning', part=part, error=str(e))
+
+
+if PREWARM:
+    threading.Thread(target=prewarm, args=(PREWARM,), name='prewarm', daemon=True).start()
+
 
-    return jsonify(results)
 @app.route('/favicon.ico')
 def favicon():
     """Return a tiny SVG favicon to avoid 404s in access logs."""
@@ -683,6 +1576,9 @@ if __name__ == "__main__":
     # Use PORT from environment (Vercel provides this) and bind to 0.0.0.0
     try:
         port = int(os.environ.get('PORT', 5000))
+        # Local development: pick up edits to static files without restarting
+        static_assets.auto_reload = True
+        page_cache_enabled = False
         app.run(host='0.0.0.0', port=port, debug=True)
     except Exception as e:
         # Print full traceback to logs so Vercel shows details for debugging
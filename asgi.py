@@ -0,0 +1,609 @@
+"""ASGI entry point: ``uvicorn asgi:app`` serves the same site with async generations.
+
+Nearly all of a generation is spent waiting on OpenRouter. In the WSGI app
+each waiting request holds a worker thread (and ``time.sleep``s through its
+retries). Here /generate, /generate/stream, /download_pdf and /diag are
+coroutines instead:
+
+* the OpenRouter call goes through upstream_async (httpx);
+* the limiter, single-flight and hedger waits are awaited;
+* PDF rendering runs on a small thread pool (ASGI_PDF_THREADS).
+
+So one process can hold hundreds of in-flight generations. Caching,
+fallback, limiter, breaker and metrics are the objects from app.py, shared
+with the threaded routes.
+
+Every other route is the Flask app from app.py, run on a bounded thread
+pool (ASGI_WSGI_THREADS). The WSGI ``app.app`` is unchanged and is still
+what Vercel serves.
+
+Needs ``httpx`` and an ASGI server: ``pip install -r requirements-asgi.txt``.
+"""
+import asyncio
+import contextvars
+import json
+import os
+import sys
+import time
+import unicodedata
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import aclosing
+from tempfile import SpooledTemporaryFile
+from urllib.parse import parse_qs, quote
+
+from werkzeug.http import dump_options_header, parse_etags
+
+import app as main
+import log
+import metrics
+import upstream_async
+from metrics import stage
+from ratelimit import RateLimited
+from breaker import CircuitOpen
+from jd_text import clean_markdown, MarkdownStreamCleaner
+from token_budget import usage_of
+
+ASGI_WSGI_THREADS = int(os.getenv('ASGI_WSGI_THREADS', '32'))
+ASGI_PDF_THREADS = int(os.getenv('ASGI_PDF_THREADS', '4'))
+
+pdf_executor = ThreadPoolExecutor(max_workers=ASGI_PDF_THREADS, thread_name_prefix='asgi-pdf')
+
+SSE_HEADERS = (('Cache-Control', 'no-cache'), ('X-Accel-Buffering', 'no'))
+
+
+class Request:
+    """The little of an HTTP request the native routes need."""
+
+    def __init__(self, scope, body):
+        self.scope = scope
+        self.method = scope['method']
+        self.path = scope['path']
+        self.body = body
+        self.args = {k: v[0] for k, v in parse_qs(scope.get('query_string', b'').decode('latin-1')).items()}
+        self.headers = {k.decode('latin-1').lower(): v.decode('latin-1') for k, v in scope.get('headers', [])}
+
+    def flag(self, name):
+        return self.args.get(name, '').lower() in ('1', 'true')
+
+    def json(self):
+        """The body as a JSON object, or None."""
+        try:
+            body = json.loads(self.body or b'null')
+        except ValueError:
+            return None
+        return body if isinstance(body, dict) else None
+
+    def etag_matches(self, etag):
+        return etag in parse_etags(self.headers.get('if-none-match'))
+
+
+async def read_body(receive):
+    chunks = []
+    while True:
+        message = await receive()
+        if message['type'] != 'http.request':
+            break
+        chunks.append(message.get('body', b''))
+        if not message.get('more_body'):
+            break
+    return b''.join(chunks)
+
+
+def encode_headers(headers):
+    return [(k.lower().encode('latin-1'), v.encode('latin-1')) for k, v in headers]
+
+
+async def send_response(send, status, body=b'', content_type=None, headers=()):
+    out = [('Content-Length', str(len(body)))]
+    if content_type:
+        out.append(('Content-Type', content_type))
+    await send({'type': 'http.response.start', 'status': status, 'headers': encode_headers(out + list(headers))})
+    await send({'type': 'http.response.body', 'body': body})
+
+
+async def send_json(send, obj, status=200):
+    await send_response(send, status, json.dumps(obj).encode('utf-8'), 'application/json')
+
+
+async def send_stream(send, receive, chunks, content_type, headers=()):
+    """Send an async iterator of str chunks; stop it (and its upstream call) if the client leaves."""
+    async def pump():
+        await send({'type': 'http.response.start', 'status': 200,
+                    'headers': encode_headers([('Content-Type', content_type)] + list(headers))})
+        async with aclosing(chunks) as it:
+            async for chunk in it:
+                await send({'type': 'http.response.body', 'body': chunk.encode('utf-8'), 'more_body': True})
+        await send({'type': 'http.response.body', 'body': b''})
+
+    await cancel_on_disconnect(receive, pump())
+
+
+async def cancel_on_disconnect(receive, coro):
+    """Run ``coro``, cancelling it if the client disconnects first."""
+    task = asyncio.ensure_future(coro)
+
+    async def watch():
+        while (await receive())['type'] != 'http.disconnect':
+            pass
+        task.cancel()
+
+    watcher = asyncio.ensure_future(watch())
+    try:
+        await task
+    except asyncio.CancelledError:
+        if not watcher.done():
+            raise
+    finally:
+        watcher.cancel()
+
+
+# -- OpenRouter -------------------------------------------------------------
+
+async def post_openrouter(payload, stream=False, base_url=None, api_key=None, max_retries=3, wait=True,
+                          timeout=None, limiter=None):
+    """app.post_openrouter on the async client (same breaker, limiter and hedge-target rules)."""
+    if base_url and base_url != main.OPENROUTER_BASE_URL:
+        return await upstream_async.post_with_retry(main.openrouter_endpoint(base_url), max_retries=1,
+                                                    headers=main.openrouter_headers(api_key), json=payload,
+                                                    stream=stream, timeout=timeout)
+    main.upstream_breaker.before_call()
+    try:
+        resp = await upstream_async.post_with_retry(
+            main.openrouter_endpoint(), max_retries=max_retries, limiter=limiter or main.upstream_limiter,
+            tokens=main.estimate_request_tokens(payload),
+            deadline=time.monotonic() + main.OPENROUTER_QUEUE_DEADLINE if wait else None,
+            headers=main.openrouter_headers(api_key), json=payload, stream=stream, timeout=timeout)
+    except (RateLimited, asyncio.CancelledError):
+        # Our own budget or our own client leaving, not an upstream health signal
+        main.upstream_breaker.release()
+        raise
+    except Exception as e:
+        main.upstream_breaker.record_failure(timeout=upstream_async.is_timeout(e))
+        raise
+    main.record_upstream_status(resp.status_code)
+    return resp
+
+
+async def call_openrouter(plan):
+    """Run one (non-streaming) completion and return ``(text, api_error)``; usage goes on ``plan``."""
+    try:
+        log.event('upstream.call', endpoint=main.openrouter_endpoint(), model=main.OPENROUTER_MODEL)
+        resp = await post_openrouter(main.openrouter_payload(plan))
+        if resp.is_success:
+            j = resp.json()
+            plan.record(*usage_of(j))
+            return main.completion_text(j)
+        log.event('upstream.http_error', level='warning', status=resp.status_code, body=resp.text[:200])
+        return None, f"HTTP {resp.status_code}: {resp.text[:500]}"
+    except Exception as e:
+        log.event('upstream.failed', level='warning', error=str(e))
+        return None, str(e)
+
+
+async def stream_openrouter(plan, outcome, model=None, base_url=None, api_key=None, on_first_token=None):
+    """app.stream_openrouter as an async generator; cancel the consuming task to stop it."""
+    started = time.time()
+    cleaner = MarkdownStreamCleaner()
+    resp = None
+    try:
+        log.event('upstream.stream', endpoint=main.openrouter_endpoint(base_url), model=model or main.OPENROUTER_MODEL)
+        resp = await post_openrouter(main.openrouter_payload(plan, stream=True, model=model), stream=True,
+                                     base_url=base_url, api_key=api_key)
+        if not resp.is_success:
+            await resp.aread()
+            outcome['api_error'] = f"HTTP {resp.status_code}: {resp.text[:500]}"
+            log.event('upstream.http_error', level='warning', status=resp.status_code, body=resp.text[:200])
+            return
+        usage, finish_reason = None, None
+        async for event in upstream_async.iter_sse_data(resp):
+            piece = main.stream_delta(event)
+            event_usage, event_finish = usage_of(event)
+            usage, finish_reason = event_usage or usage, event_finish or finish_reason
+            if not piece:
+                continue
+            if on_first_token is not None and not outcome['raw']:
+                on_first_token()
+            outcome['raw'].append(piece)
+            text = cleaner.feed(piece)
+            if text:
+                if outcome['first_token_ms'] is None:
+                    outcome['first_token_ms'] = int((time.time() - started) * 1000)
+                yield text
+        plan.record(usage, finish_reason)
+        tail = cleaner.finish()
+        if tail:
+            yield tail
+    except Exception as e:
+        outcome['api_error'] = str(e)
+        log.event('upstream.stream_failed', level='warning', error=outcome['api_error'])
+    finally:
+        if resp is not None:
+            await upstream_async.close(resp)
+
+
+async def collect_openrouter_stream(plan, on_first_token=None, model=None, base_url=None, api_key=None):
+    outcome = main.new_stream_outcome()
+    async with aclosing(stream_openrouter(plan, outcome, model=model, base_url=base_url, api_key=api_key,
+                                          on_first_token=on_first_token)) as chunks:
+        async for _ in chunks:
+            pass
+    if outcome['api_error']:
+        return None, outcome['api_error']
+    with stage('markdown_cleanup'):
+        jd = clean_markdown(''.join(outcome['raw']))
+    return (jd, None) if jd else (None, 'OpenRouter returned empty content')
+
+
+async def call_openrouter_hedged(plan):
+    async def primary(on_first_token):
+        return await collect_openrouter_stream(plan, on_first_token)
+
+    async def secondary(on_first_token):
+        return await collect_openrouter_stream(plan, on_first_token,
+                                               model=main.OPENROUTER_HEDGE_MODEL or None,
+                                               base_url=main.OPENROUTER_HEDGE_BASE_URL or None,
+                                               api_key=main.OPENROUTER_HEDGE_API_KEY)
+
+    jd, api_error, info = await main.hedger.race_async(primary, secondary)
+    return jd, api_error, main.hedge_metadata(info)
+
+
+async def fetch_generation(plan):
+    if main.hedging_enabled:
+        jd, api_error, extra = await call_openrouter_hedged(plan)
+    else:
+        jd, api_error = await call_openrouter(plan)
+        extra = None
+    return main.upstream_result(plan, jd, api_error, extra)
+
+
+async def run_generation(data, use_cache=True, force_local=False):
+    """app.run_generation without holding a thread while OpenRouter works."""
+    cache_key, started, out = main.start_generation(data, use_cache, force_local)
+    if out is not None:
+        return out
+
+    with stage('prompt_build'):
+        plan = main.plan_generation(data)
+    result, coalesced = main.NO_UPSTREAM_RESULT, False
+    if main.openrouter_available:
+        try:
+            result, coalesced = await main.upstream_flights.do_async(cache_key, lambda: fetch_generation(plan))
+        except Exception as e:
+            result = (None, str(e), {})
+    return main.end_generation(data, cache_key, started, result, coalesced)
+
+
+async def stream_events(req, data):
+    """app.stream_generate_response's SSE events as an async generator."""
+    force_local = req.flag('force_local')
+    started = time.perf_counter()
+    cache_key = main.generation_cache_key(data)
+    cached = None
+    if not force_local and not req.flag('nocache'):
+        cached = main.jd_cache.get(cache_key)
+    if cached:
+        for event in main.stream_cache_hit(data, cached, started):
+            yield event
+        return
+
+    model_available, api_error = main.stream_upstream_state(force_local)
+    api_attempted = False
+    coalesced = False
+    jd = None
+    extra = {}
+    outcome = main.new_stream_outcome()
+
+    if model_available:
+        api_attempted = True
+        call, leader = main.upstream_flights.acquire(cache_key)
+        if leader:
+            result = main.STREAM_ABORTED_RESULT
+            try:
+                with stage('prompt_build'):
+                    plan = main.plan_generation(data)
+                async with aclosing(stream_openrouter(plan, outcome)) as chunks:
+                    async for text in chunks:
+                        yield main.sse_event('delta', {'text': text})
+                result = main.stream_result(plan, outcome)
+            finally:
+                main.upstream_flights.release(cache_key, call, result=result)
+            jd, api_error, extra = result
+        else:
+            coalesced = True
+            try:
+                jd, api_error, extra = await main.upstream_flights.wait_async(call)
+            except Exception as e:
+                jd, api_error = None, str(e)
+            if jd:
+                yield main.sse_event('delta', {'text': jd})
+
+    for event in main.finish_stream(data, cache_key, jd, api_error, outcome, model_available, api_attempted,
+                                    coalesced, force_local, extra, started):
+        yield event
+
+
+# -- Native routes ----------------------------------------------------------
+
+def validated_job(req):
+    """``(data, error)`` for a /generate body."""
+    with stage('validation') as m:
+        data = main.strip_job_fields(req.json() or {})
+        missing = main.missing_job_field(data)
+        if missing:
+            m['outcome'] = 'invalid'
+    return data, (f"Missing {missing}" if missing else None)
+
+
+async def generate(req, send, receive):
+    data, error = validated_job(req)
+    if error:
+        return await send_json(send, {'success': False, 'error': error})
+    if req.flag('stream'):
+        return await send_stream(send, receive, stream_events(req, data), 'text/event-stream', SSE_HEADERS)
+    # Not cancelled when the client leaves: the result still lands in the cache
+    out = await run_generation(data, use_cache=not req.flag('nocache'), force_local=req.flag('force_local'))
+    await send_json(send, out)
+
+
+async def generate_stream(req, send, receive):
+    data, error = validated_job(req)
+    if error:
+        return await send_json(send, {'success': False, 'error': error})
+    await send_stream(send, receive, stream_events(req, data), 'text/event-stream', SSE_HEADERS)
+
+
+def content_disposition(filename):
+    try:
+        filename.encode('ascii')
+        names = {'filename': filename}
+    except UnicodeEncodeError:
+        names = {'filename': unicodedata.normalize('NFKD', filename).encode('ascii', 'ignore').decode('ascii'),
+                 'filename*': f"UTF-8''{quote(filename, safe='!#$&+^`|~')}"}
+    return dump_options_header('attachment', names)
+
+
+def render_pdf(jobDetails, jobDescription, sections):
+    # pdf_render (and reportlab) is first imported here, on an executor thread, not in the loop
+    from pdf_render import render_job_pdf
+    return render_job_pdf(jobDetails, jobDescription, sections=sections)
+
+
+async def download_pdf(req, send, receive):
+    """app.download_pdf with the render on pdf_executor."""
+    try:
+        jobDetails, jobDescription, sections, key = main.parse_pdf_request(req.json() or {})
+    except ValueError as e:
+        return await send_json(send, {'success': False, 'error': str(e)}, 400)
+    etag = key[:32]
+    headers = [('ETag', f'"{etag}"'), ('Cache-Control', 'private, no-cache')]
+    if req.etag_matches(etag):
+        return await send_response(send, 304, headers=headers)
+
+    pdf = main.pdf_cache.get(key)
+    if pdf is None:
+        loop = asyncio.get_running_loop()
+        # copy_context keeps the route label on the render's stage metrics
+        pdf = await loop.run_in_executor(pdf_executor, contextvars.copy_context().run, render_pdf,
+                                         jobDetails, jobDescription, sections)
+        if len(pdf) <= main.PDF_SPOOL_MAX_MEMORY:
+            main.pdf_cache.set(key, pdf)
+    from pdf_render import pdf_filename
+    filename = pdf_filename(jobDetails.get('title') or 'Job Description')
+    headers.append(('Content-Disposition', content_disposition(filename)))
+    await send_response(send, 200, pdf, 'application/pdf', headers)
+
+
+async def probe_dns():
+    dns_resp = await upstream_async.get('https://dns.google/resolve?name=openrouter.ai', timeout=5)
+    if not dns_resp.is_success:
+        return {'status': f'HTTP {dns_resp.status_code}'}
+    j = dns_resp.json()
+    answers = j.get('Answer') or j.get('answer') or []
+    ips = [a.get('data') for a in answers if isinstance(a, dict) and a.get('type') in (1,)]
+    return {'status': 'OK', 'ips': ips}
+
+
+async def probe_https():
+    r = await upstream_async.get('https://openrouter.ai', timeout=5)
+    return {
+        'status': 'OK' if r.is_success else f'HTTP {r.status_code}',
+        'response_code': r.status_code,
+        'headers_preview': dict(list(r.headers.items())[:5])
+    }
+
+
+async def probe_api():
+    """app.probe_api on the async client."""
+    if not main.OPENROUTER_API_KEY:
+        return {'status': 'SKIPPED', 'reason': 'OPENROUTER_API_KEY not set'}
+    payload = {
+        'model': main.OPENROUTER_MODEL,
+        'messages': [{'role': 'user', 'content': 'Hello'}],
+        'temperature': 0.2,
+        'max_tokens': 10
+    }
+    try:
+        resp = await post_openrouter(payload, max_retries=1, wait=False, timeout=10, limiter=main.probe_limiter)
+    except (RateLimited, CircuitOpen) as e:
+        return {'status': 'SKIPPED', 'reason': str(e)}
+    out = {
+        'status': 'OK' if resp.is_success else f'HTTP {resp.status_code}',
+        'response_code': resp.status_code,
+        'has_content': len(resp.text) > 0
+    }
+    if not resp.is_success:
+        out['error_preview'] = resp.text[:200]
+    return out
+
+
+ASYNC_PROBES = {'dns': probe_dns, 'https': probe_https, 'api': probe_api}
+
+
+async def diag(req, send, receive):
+    """app.diag; ``?refresh=1`` runs the probes on the event loop."""
+    main.diag_prober.ensure_started()
+    refresh = None
+    if req.flag('refresh'):
+        refresh = await main.diag_prober.refresh_async(ASYNC_PROBES)
+    await send_json(send, main.diag_report(refresh))
+
+
+ROUTES = {
+    ('POST', '/generate'): generate,
+    ('POST', '/generate/stream'): generate_stream,
+    ('POST', '/download_pdf'): download_pdf,
+    ('GET', '/diag'): diag,
+}
+
+
+# -- Everything else: the Flask app -----------------------------------------
+
+class WSGIBridge:
+    """Run a WSGI app for ASGI requests, one pool thread per request.
+
+    The whole request, including iterating a streamed body, stays on one
+    thread, because Flask's stream_with_context needs that.
+    """
+
+    def __init__(self, wsgi_app, threads):
+        self.wsgi_app = wsgi_app
+        self.executor = ThreadPoolExecutor(max_workers=threads, thread_name_prefix='asgi-wsgi')
+
+    async def __call__(self, scope, receive, send):
+        loop = asyncio.get_running_loop()
+        with SpooledTemporaryFile(max_size=65536) as body:
+            while True:
+                message = await receive()
+                if message['type'] != 'http.request':
+                    return
+                body.write(message.get('body', b''))
+                if not message.get('more_body'):
+                    break
+            body.seek(0)
+
+            def send_sync(message):
+                asyncio.run_coroutine_threadsafe(send(message), loop).result()
+
+            await loop.run_in_executor(self.executor, self.run, self.environ(scope, body), send_sync)
+
+    def run(self, environ, send_sync):
+        start = {}
+
+        def start_response(status, headers, exc_info=None):
+            start['message'] = {'type': 'http.response.start', 'status': int(status.split(' ', 1)[0]),
+                                'headers': encode_headers(headers)}
+
+        result = self.wsgi_app(environ, start_response)
+        started = False
+        try:
+            for chunk in result:
+                if not chunk:
+                    continue
+                if not started:
+                    started = True
+                    send_sync(start['message'])
+                send_sync({'type': 'http.response.body', 'body': chunk, 'more_body': True})
+        finally:
+            close = getattr(result, 'close', None)
+            if close is not None:
+                close()
+        if not started:
+            send_sync(start['message'])
+        send_sync({'type': 'http.response.body', 'body': b''})
+
+    @staticmethod
+    def environ(scope, body):
+        script_name = scope.get('root_path', '').encode('utf-8').decode('latin-1')
+        path_info = scope['path'].encode('utf-8').decode('latin-1')
+        if path_info.startswith(script_name):
+            path_info = path_info[len(script_name):]
+        server = scope.get('server') or ('localhost', 80)
+        environ = {
+            'REQUEST_METHOD': scope['method'],
+            'SCRIPT_NAME': script_name,
+            'PATH_INFO': path_info,
+            'QUERY_STRING': scope.get('query_string', b'').decode('ascii'),
+            'SERVER_PROTOCOL': f"HTTP/{scope.get('http_version', '1.1')}",
+            'SERVER_NAME': server[0],
+            'SERVER_PORT': str(server[1]),
+            'wsgi.version': (1, 0),
+            'wsgi.url_scheme': scope.get('scheme', 'http'),
+            'wsgi.input': body,
+            'wsgi.errors': sys.stderr,
+            'wsgi.multithread': True,
+            'wsgi.multiprocess': True,
+            'wsgi.run_once': False,
+        }
+        if scope.get('client'):
+            environ['REMOTE_ADDR'] = scope['client'][0]
+        for name, value in scope.get('headers', []):
+            name = name.decode('latin-1')
+            value = value.decode('latin-1')
+            if name == 'content-length':
+                key = 'CONTENT_LENGTH'
+            elif name == 'content-type':
+                key = 'CONTENT_TYPE'
+            else:
+                key = 'HTTP_' + name.upper().replace('-', '_')
+            environ[key] = f'{environ[key]},{value}' if key in environ else value
+        return environ
+
+
+wsgi = WSGIBridge(main.app, ASGI_WSGI_THREADS)
+
+
+async def lifespan(receive, send):
+    while True:
+        message = await receive()
+        if message['type'] == 'lifespan.startup':
+            main.diag_prober.ensure_started()
+            log.event('asgi.started', sample=1, native_routes=[f'{m} {p}' for m, p in ROUTES],
+                      wsgi_threads=ASGI_WSGI_THREADS)
+            await send({'type': 'lifespan.startup.complete'})
+        elif message['type'] == 'lifespan.shutdown':
+            await upstream_async.aclose()
+            pdf_executor.shutdown(wait=False)
+            wsgi.executor.shutdown(wait=False)
+            await send({'type': 'lifespan.shutdown.complete'})
+            return
+
+
+async def app(scope, receive, send):
+    if scope['type'] == 'lifespan':
+        return await lifespan(receive, send)
+    if scope['type'] != 'http':
+        return
+    handler = ROUTES.get((scope['method'], scope['path']))
+    if handler is None:
+        return await wsgi(scope, receive, send)
+
+    started = time.perf_counter()
+    metrics.current_route.set(scope['path'])
+    status = {}
+
+    async def send_and_record(message):
+        if message['type'] == 'http.response.start':
+            status['code'] = message['status']
+        await send(message)
+
+    req = Request(scope, await read_body(receive))
+    try:
+        await handler(req, send_and_record, receive)
+    except Exception as e:
+        log.event('asgi.unhandled', level='error', path=scope['path'], error=str(e))
+        if 'code' in status:
+            raise
+        await send_and_record({'type': 'http.response.start', 'status': 500,
+                               'headers': encode_headers([('Content-Type', 'application/json')])})
+        await send_and_record({'type': 'http.response.body',
+                               'body': json.dumps({'success': False, 'error': 'Internal server error'}).encode()})
+    finally:
+        code = status.get('code', 500)
+        main.REQUEST_SECONDS.observe(time.perf_counter() - started, route=scope['path'], method=scope['method'],
+                                     status=f'{code // 100}xx')
+
+
+if __name__ == '__main__':
+    import uvicorn
+    uvicorn.run('asgi:app', host='0.0.0.0', port=int(os.environ.get('PORT', 5000)))
@@ -0,0 +1,181 @@
+"""Fingerprinted, precompressed static assets.
+
+Every file under ``static/`` is read once at startup and hashed. Text files
+are compressed (gzip, plus brotli when the optional ``brotli`` package is
+installed) the first time a client asks for that encoding, so a cold start
+only pays for reading and hashing; ``AssetManifest.prewarm()`` compresses
+everything up front instead. Templates keep using ``url_for('static', filename='js/main.js')``;
+app.py rewrites that to ``/static/js/main.<hash>.js``, which is served from
+memory with a strong ETag and an immutable, year-long Cache-Control, so a
+browser never asks for it again until the content (and so the URL) changes.
+Plain, unfingerprinted paths (robots.txt, old links) still work but are
+revalidated.
+
+``Payload`` is the in-memory body + variants + ETag on its own; app.py also
+uses it for pre-rendered HTML pages.
+"""
+import gzip
+import hashlib
+import mimetypes
+import os
+import threading
+
+import log
+
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+COMPRESSIBLE_TYPES = ('text/', 'application/javascript', 'application/json', 'application/xml', 'image/svg+xml')
+ENCODINGS = ('br', 'gzip') if brotli is not None else ('gzip',)
+
+
+def compress(data, encoding):
+    if encoding == 'br':
+        return brotli.compress(data, quality=11)
+    return gzip.compress(data, compresslevel=9, mtime=0)
+
+
+class Payload:
+    """A response body kept in memory with its compressed variants and ETag.
+
+    Variants are built on first use of each encoding and kept.
+    """
+
+    def __init__(self, data, mimetype, min_size=512):
+        self.data = data
+        self.mimetype = mimetype
+        self.digest = hashlib.sha256(data).hexdigest()
+        self.etag = self.digest[:32]
+        compressible = len(data) >= min_size and mimetype.startswith(COMPRESSIBLE_TYPES)
+        # Encodings worth offering; variant() drops one if it turns out not to save bytes
+        self.encodings = ENCODINGS if compressible else ()
+        self._variants = {}
+
+    def variant(self, encoding):
+        """Compressed body for ``encoding`` (None if not available or not smaller)."""
+        if encoding not in self.encodings:
+            return None
+        try:
+            return self._variants[encoding]
+        except KeyError:
+            pass
+        # Racing threads may both compress; the results are identical
+        body = compress(self.data, encoding)
+        self._variants[encoding] = body if len(body) < len(self.data) else None
+        return self._variants[encoding]
+
+    @property
+    def variants(self):
+        """The variants built so far."""
+        return {enc: body for enc, body in self._variants.items() if body is not None}
+
+    def prewarm(self):
+        for enc in self.encodings:
+            self.variant(enc)
+
+    def body(self, encoding):
+        """``(bytes, etag)`` for a negotiated encoding (None = identity)."""
+        variant = self.variant(encoding)
+        if variant is not None:
+            return variant, f'{self.etag}-{encoding}'
+        return self.data, self.etag
+
+
+class Asset(Payload):
+    """A file under the static root, plus its fingerprinted name."""
+
+    def __init__(self, name, data, mtime, min_size):
+        super().__init__(data, mimetypes.guess_type(name)[0] or 'application/octet-stream', min_size)
+        stem, ext = os.path.splitext(name)
+        self.name = name
+        self.url_name = f'{stem}.{self.digest[:12]}{ext}'
+        self.mtime = mtime
+
+
+class AssetManifest:
+    """Logical name <-> fingerprinted name for everything under ``root``."""
+
+    def __init__(self, root, min_size=512, auto_reload=False):
+        self.root = root
+        self.min_size = min_size
+        self.auto_reload = auto_reload
+        self._by_name = {}
+        self._by_url = {}
+        self._lock = threading.Lock()
+        self.load()
+
+    def load(self):
+        if not os.path.isdir(self.root):
+            return
+        for dirpath, dirnames, filenames in os.walk(self.root):
+            dirnames[:] = [d for d in dirnames if not d.startswith('.')]
+            for fn in filenames:
+                if fn.startswith('.'):
+                    continue
+                name = os.path.relpath(os.path.join(dirpath, fn), self.root).replace(os.sep, '/')
+                self._load_file(name)
+
+    def _load_file(self, name):
+        path = os.path.join(self.root, name)
+        try:
+            mtime = os.path.getmtime(path)
+            with open(path, 'rb') as f:
+                data = f.read()
+        except OSError as e:
+            log.event('assets.read_failed', level='warning', name=name, error=str(e))
+            return None
+        asset = Asset(name, data, mtime, self.min_size)
+        with self._lock:
+            old = self._by_name.get(name)
+            if old is not None:
+                self._by_url.pop(old.url_name, None)
+            self._by_name[name] = asset
+            self._by_url[asset.url_name] = asset
+        return asset
+
+    def _fresh(self, asset):
+        if not self.auto_reload:
+            return asset
+        try:
+            if os.path.getmtime(os.path.join(self.root, asset.name)) != asset.mtime:
+                return self._load_file(asset.name)
+        except OSError:
+            pass
+        return asset
+
+    def url_name(self, name):
+        """Fingerprinted file name to put in URLs (``name`` itself if unknown)."""
+        asset = self._by_name.get(name)
+        if asset is None and self.auto_reload:
+            asset = self._load_file(name) if os.path.isfile(os.path.join(self.root, name)) else None
+        if asset is None:
+            return name
+        return self._fresh(asset).url_name
+
+    def lookup(self, url_name):
+        """``(asset, immutable)`` for a requested path; ``(None, False)`` if unknown."""
+        asset = self._by_url.get(url_name)
+        if asset is not None:
+            return asset, True
+        asset = self._by_name.get(url_name)
+        if asset is not None:
+            return self._fresh(asset), False
+        return None, False
+
+    def prewarm(self):
+        """Build every compressed variant now rather than on first request."""
+        for asset in list(self._by_name.values()):
+            asset.prewarm()
+
+    def stats(self):
+        files = list(self._by_name.values())
+        return {
+            'files': len(files),
+            'bytes': sum(len(a.data) for a in files),
+            'compressed': {enc: sum(len(a.variants[enc]) for a in files if enc in a.variants)
+                           for enc in ('br', 'gzip')},
+            'compressed_files': sum(1 for a in files if a.variants),
+            'brotli_available': brotli is not None,
+        }
@@ -0,0 +1,403 @@
+"""Load and latency benchmark for the HTTP endpoints, fully offline.
+
+Runs bench/openrouter_stub.py in this process and starts the app in a
+separate one (Flask's threaded server, or the ASGI app under uvicorn), so
+the CPU and memory measured are the server's own. Each endpoint is then
+driven in turn through a load profile and reported on:
+
+* throughput, and latency p50/p90/p99/max (streams also time to first byte);
+* errors, and how many answers were local fallbacks;
+* CPU seconds per request and peak RSS of the server process, from /proc
+  (Linux only).
+
+Load is open-loop: requests are sent on a fixed schedule whether or not
+earlier ones have finished, and latency is measured from the scheduled send
+time. A slow server therefore shows up as latency rather than as a lower
+send rate.
+
+    python bench/load_bench.py [--profile steady|burst|soak] [--server wsgi|asgi]
+        [--endpoints generate,generate_local,generate_stream,download_pdf]
+        [--scale 0.2] [--output results.json] [--baseline bench/baseline.json]
+        [--stub-latency-ms 800 --stub-rate-429 0.05 ...] [--env OPENROUTER_RPM=20]
+
+``--output`` writes the report as JSON. ``--baseline`` compares against a
+saved report and exits with status 1 when an endpoint got slower, used more
+CPU or memory, or lost throughput by more than ``--tolerance`` (default 20%).
+bench/baseline.json is the reference run (``--profile steady --scale 0.5``);
+regenerate it on the machine you compare on.
+"""
+import argparse
+import http.client
+import json
+import os
+import platform
+import subprocess
+import sys
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timezone
+
+BENCH_DIR = os.path.dirname(os.path.abspath(__file__))
+ROOT = os.path.join(BENCH_DIR, '..')
+sys.path.insert(0, ROOT)
+sys.path.insert(0, BENCH_DIR)
+
+import openrouter_stub  # noqa: E402
+
+# (seconds, requests per second) phases; --scale stretches or shrinks the durations
+PROFILES = {
+    'steady': [(30, 20)],
+    'burst': [(10, 2), (3, 60), (10, 2), (3, 60), (10, 2)],
+    'soak': [(600, 10)],
+}
+
+FORM = dict(openrouter_stub.FORM)
+
+ENDPOINTS = {
+    # name: (path, body builder); bodies vary per request so no cache answers for us
+    'generate': ('/generate?nocache=1', lambda i: dict(FORM, jobTitle=f"{FORM['jobTitle']} {i}")),
+    'generate_local': ('/generate?force_local=1', lambda i: dict(FORM, jobTitle=f"{FORM['jobTitle']} {i}")),
+    'generate_stream': ('/generate/stream?nocache=1', lambda i: dict(FORM, jobTitle=f"{FORM['jobTitle']} {i}")),
+    'download_pdf': ('/download_pdf', lambda i: {
+        'jobDetails': {'title': f"{FORM['jobTitle']} {i}", 'company': FORM['companyName'],
+                       'location': f"{FORM['city']}, {FORM['state']}", 'jobType': FORM['jobType'],
+                       'experienceLevel': 'Senior Level (5-8 years)', 'salary': FORM['salary'],
+                       'email': FORM['companyEmail']},
+        'jobDescription': openrouter_stub.COMPLETION}),
+}
+
+# The limiter's default 20 requests/min would turn almost every /generate into a local
+# fallback; benchmark the app itself unless told otherwise (--env overrides these)
+SERVER_ENV = {
+    'OPENROUTER_API_KEY': 'bench',
+    'OPENROUTER_RPM': '0',
+    'OPENROUTER_MAX_CONCURRENCY': '64',
+    'DIAG_PROBE_INTERVAL': '0',
+    'LOG_SAMPLE_RATE': '0',
+}
+
+SERVERS = {
+    'wsgi': lambda port: [sys.executable, '-c',
+                          'import app; from werkzeug.serving import run_simple; '
+                          f"run_simple('127.0.0.1', {port}, app.app, threaded=True)"],
+    'asgi': lambda port: [sys.executable, '-m', 'uvicorn', 'asgi:app', '--host', '127.0.0.1',
+                          '--port', str(port), '--log-level', 'warning', '--backlog', '2048'],
+}
+
+CLK_TCK = os.sysconf('SC_CLK_TCK') if hasattr(os, 'sysconf') else 100
+
+
+def free_port():
+    import socket
+    with socket.socket() as s:
+        s.bind(('127.0.0.1', 0))
+        return s.getsockname()[1]
+
+
+def proc_sample(pid):
+    """``(cpu seconds, rss bytes)`` of a process, or None where /proc is unavailable."""
+    try:
+        with open(f'/proc/{pid}/stat') as f:
+            fields = f.read().rsplit(')', 1)[1].split()
+        with open(f'/proc/{pid}/status') as f:
+            rss = next(int(line.split()[1]) * 1024 for line in f if line.startswith('VmRSS:'))
+    except (OSError, StopIteration, IndexError, ValueError):
+        return None
+    # utime and stime are fields 14 and 15 of stat, i.e. 11 and 12 after the command name
+    return (int(fields[11]) + int(fields[12])) / CLK_TCK, rss
+
+
+class ProcMonitor:
+    """Samples a process's CPU time and RSS in the background."""
+
+    def __init__(self, pid, interval=0.25):
+        self.pid = pid
+        self.interval = interval
+        self.samples = []
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, daemon=True)
+
+    def _run(self):
+        while not self._stop.is_set():
+            s = proc_sample(self.pid)
+            if s is not None:
+                self.samples.append((time.perf_counter(), *s))
+            self._stop.wait(self.interval)
+
+    def __enter__(self):
+        s = proc_sample(self.pid)
+        if s is not None:
+            self.samples.append((time.perf_counter(), *s))
+        self._thread.start()
+        return self
+
+    def __exit__(self, *exc):
+        self._stop.set()
+        self._thread.join()
+        s = proc_sample(self.pid)
+        if s is not None:
+            self.samples.append((time.perf_counter(), *s))
+
+    def summary(self, requests):
+        if len(self.samples) < 2:
+            return None
+        (t0, cpu0, rss0), (t1, cpu1, rss1) = self.samples[0], self.samples[-1]
+        cpu = cpu1 - cpu0
+        return {
+            'cpu_s': round(cpu, 3),
+            'cpu_ms_per_req': round(cpu / requests * 1000, 3) if requests else None,
+            'cpu_percent': round(cpu / (t1 - t0) * 100, 1) if t1 > t0 else None,
+            'rss_mb_start': round(rss0 / 2 ** 20, 1),
+            'rss_mb_peak': round(max(s[2] for s in self.samples) / 2 ** 20, 1),
+            'rss_mb_end': round(rss1 / 2 ** 20, 1),
+        }
+
+
+def percentiles(values):
+    if not values:
+        return None
+    values = sorted(values)
+
+    def pct(p):
+        # Nearest rank
+        return values[min(len(values) - 1, max(0, int(round(p / 100.0 * len(values) + 0.5)) - 1))]
+
+    return {'p50': round(pct(50) * 1000, 2), 'p90': round(pct(90) * 1000, 2), 'p99': round(pct(99) * 1000, 2),
+            'max': round(values[-1] * 1000, 2), 'mean': round(sum(values) / len(values) * 1000, 2)}
+
+
+class Client:
+    """One keep-alive connection per load thread."""
+
+    def __init__(self, host, port, timeout):
+        self.host = host
+        self.port = port
+        self.timeout = timeout
+        self._local = threading.local()
+
+    def _conn(self):
+        conn = getattr(self._local, 'conn', None)
+        if conn is None:
+            conn = self._local.conn = http.client.HTTPConnection(self.host, self.port, timeout=self.timeout)
+        return conn
+
+    def post(self, path, body, scheduled):
+        """``(ok, latency, ttfb, fallback)``; times are from ``scheduled`` (a perf_counter value)."""
+        data = json.dumps(body).encode('utf-8')
+        conn = self._conn()
+        try:
+            conn.request('POST', path, body=data, headers={'Content-Type': 'application/json'})
+            resp = conn.getresponse()
+            first = resp.read1(65536)
+            ttfb = time.perf_counter() - scheduled
+            rest = resp.read()
+            latency = time.perf_counter() - scheduled
+        except (OSError, http.client.HTTPException):
+            conn.close()
+            self._local.conn = None
+            return False, time.perf_counter() - scheduled, None, False
+        payload = first + rest
+        ok = resp.status == 200
+        if resp.getheader('Content-Type', '').startswith('application/json'):
+            try:
+                j = json.loads(payload)
+            except ValueError:
+                j = {}
+            ok = ok and j.get('success', True) is not False
+            fallback = bool((j.get('metadata') or {}).get('fallbackUsed'))
+        else:
+            fallback = b'"fallbackUsed": true' in payload
+        return ok, latency, ttfb, fallback
+
+
+def run_endpoint(client, name, phases, max_inflight):
+    path, make_body = ENDPOINTS[name]
+    results = []
+    lock = threading.Lock()
+
+    def one(i, scheduled):
+        out = client.post(path, make_body(i), scheduled)
+        with lock:
+            results.append(out)
+
+    pool = ThreadPoolExecutor(max_workers=max_inflight, thread_name_prefix='load')
+    start = time.perf_counter()
+    at = start
+    i = 0
+    for seconds, rate in phases:
+        end = at + seconds
+        interval = 1.0 / rate
+        while at < end:
+            delay = at - time.perf_counter()
+            if delay > 0:
+                time.sleep(delay)
+            pool.submit(one, i, at)
+            i += 1
+            at += interval
+        at = end
+    pool.shutdown(wait=True)
+    elapsed = time.perf_counter() - start
+    ok = [r for r in results if r[0]]
+    report = {
+        'requests': len(results),
+        'errors': len(results) - len(ok),
+        'fallbacks': sum(1 for r in ok if r[3]),
+        'seconds': round(elapsed, 2),
+        'throughput_rps': round(len(ok) / elapsed, 2) if elapsed else 0.0,
+        'latency_ms': percentiles([r[1] for r in ok]),
+    }
+    if name == 'generate_stream':
+        report['ttfb_ms'] = percentiles([r[2] for r in ok if r[2] is not None])
+    return report
+
+
+def wait_ready(port, proc, timeout=30):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        if proc.poll() is not None:
+            raise SystemExit(f'server exited with status {proc.returncode}')
+        try:
+            conn = http.client.HTTPConnection('127.0.0.1', port, timeout=1)
+            conn.request('GET', '/robots.txt')
+            if conn.getresponse().status == 200:
+                return
+        except OSError:
+            pass
+        time.sleep(0.2)
+    raise SystemExit('server did not come up')
+
+
+def print_report(report):
+    meta = report['meta']
+    print(f"profile={meta['profile']} server={meta['server']} scale={meta['scale']} "
+          f"stub={meta['stub']['latency_ms']}ms 429={meta['stub']['rate_429']} err={meta['stub']['error_rate']}")
+    print(f"{'endpoint':<16} {'req':>6} {'err':>4} {'fb':>5} {'rps':>7} {'p50':>8} {'p90':>8} {'p99':>8} "
+          f"{'max':>8} {'cpu/req':>8} {'cpu%':>6} {'rss MB':>7}")
+    for name, r in report['endpoints'].items():
+        lat = r['latency_ms'] or {}
+        srv = r.get('server') or {}
+        print(f"{name:<16} {r['requests']:>6} {r['errors']:>4} {r['fallbacks']:>5} {r['throughput_rps']:>7} "
+              f"{lat.get('p50', '-'):>8} {lat.get('p90', '-'):>8} {lat.get('p99', '-'):>8} {lat.get('max', '-'):>8} "
+              f"{srv.get('cpu_ms_per_req', '-'):>8} {srv.get('cpu_percent', '-'):>6} {srv.get('rss_mb_peak', '-'):>7}")
+        if r.get('ttfb_ms'):
+            print(f"{'  first byte':<16} {'':>6} {'':>4} {'':>5} {'':>7} {r['ttfb_ms']['p50']:>8} "
+                  f"{r['ttfb_ms']['p90']:>8} {r['ttfb_ms']['p99']:>8} {r['ttfb_ms']['max']:>8}")
+
+
+# (path in the endpoint report, True if higher is better)
+COMPARED = [
+    (('throughput_rps',), True),
+    (('latency_ms', 'p50'), False),
+    (('latency_ms', 'p99'), False),
+    (('ttfb_ms', 'p50'), False),
+    (('server', 'cpu_ms_per_req'), False),
+    (('server', 'rss_mb_peak'), False),
+]
+
+
+def compare(report, baseline, tolerance):
+    """Print the change against ``baseline``; returns the list of regressions."""
+    regressions = []
+    print(f"\nvs baseline ({baseline['meta'].get('created')}, tolerance {tolerance:.0%})")
+    for name, r in report['endpoints'].items():
+        base = baseline['endpoints'].get(name)
+        if base is None:
+            continue
+        for path, higher_better in COMPARED:
+            new, old = r, base
+            for key in path:
+                new = (new or {}).get(key)
+                old = (old or {}).get(key)
+            if not isinstance(new, (int, float)) or not isinstance(old, (int, float)) or not old:
+                continue
+            change = (new - old) / old
+            worse = -change if higher_better else change
+            flag = 'REGRESSION' if worse > tolerance else ''
+            print(f"  {name:<16} {'.'.join(path):<22} {old:>10} -> {new:>10} ({change:+.1%}) {flag}")
+            if flag:
+                regressions.append(f"{name} {'.'.join(path)}")
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--profile', choices=sorted(PROFILES), default='steady')
+    parser.add_argument('--scale', type=float, default=1.0, help='multiply phase durations (0.2 = quick run)')
+    parser.add_argument('--server', choices=sorted(SERVERS), default='wsgi')
+    parser.add_argument('--endpoints', default=','.join(ENDPOINTS))
+    parser.add_argument('--max-inflight', type=int, default=256, help='load threads (open requests at most)')
+    parser.add_argument('--timeout', type=float, default=60)
+    parser.add_argument('--env', action='append', default=[], metavar='KEY=VALUE',
+                        help='extra environment for the server process')
+    parser.add_argument('--output', help='write the report as JSON')
+    parser.add_argument('--baseline', help='compare with a saved report')
+    parser.add_argument('--tolerance', type=float, default=0.2)
+    stub_group = parser.add_argument_group('OpenRouter stub')
+    openrouter_stub.add_arguments(stub_group, prefix='stub-')
+    args = parser.parse_args()
+
+    endpoints = [e.strip() for e in args.endpoints.split(',') if e.strip()]
+    unknown = [e for e in endpoints if e not in ENDPOINTS]
+    if unknown:
+        parser.error(f"unknown endpoints: {', '.join(unknown)}")
+    phases = [(seconds * args.scale, rate) for seconds, rate in PROFILES[args.profile]]
+
+    stub_config = openrouter_stub.config_from_args(args)
+    stub, stub_url = openrouter_stub.start(stub_config)
+    port = free_port()
+    env = dict(os.environ, **SERVER_ENV, OPENROUTER_BASE_URL=f'{stub_url}/api')
+    for item in args.env:
+        key, _, value = item.partition('=')
+        env[key] = value
+    server = subprocess.Popen(SERVERS[args.server](port), cwd=ROOT, env=env,
+                              stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+    report = {
+        'meta': {
+            'created': datetime.now(timezone.utc).isoformat(timespec='seconds'),
+            'profile': args.profile,
+            'phases': phases,
+            'scale': args.scale,
+            'server': args.server,
+            'stub': stub_config.as_dict(),
+            'server_env': {k: env[k] for k in sorted(set(SERVER_ENV) | {i.partition('=')[0] for i in args.env})},
+            'python': platform.python_version(),
+            'platform': platform.platform(),
+            'cpus': os.cpu_count(),
+        },
+        'endpoints': {},
+    }
+    try:
+        wait_ready(port, server)
+        client = Client('127.0.0.1', port, args.timeout)
+        for name in endpoints:
+            # Warm up imports, pools and caches outside the measurement
+            for i in range(3):
+                client.post(ENDPOINTS[name][0], ENDPOINTS[name][1](-1 - i), time.perf_counter())
+            with ProcMonitor(server.pid) as monitor:
+                result = run_endpoint(client, name, phases, args.max_inflight)
+            result['server'] = monitor.summary(result['requests'])
+            report['endpoints'][name] = result
+            print(f'  {name}: {result["requests"]} requests in {result["seconds"]}s', file=sys.stderr)
+    finally:
+        server.terminate()
+        server.wait(10)
+        stub.shutdown()
+    report['meta']['stub_counts'] = dict(stub_config.counts)
+
+    print_report(report)
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump(report, f, indent=2)
+            f.write('\n')
+    if args.baseline:
+        with open(args.baseline) as f:
+            baseline = json.load(f)
+        regressions = compare(report, baseline, args.tolerance)
+        if regressions:
+            print(f"\n{len(regressions)} regression(s): {', '.join(regressions)}")
+            sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,146 @@
+"""Microbenchmark for the local job-description generator.
+
+Compares the original list/f-string implementation (kept here as the
+baseline) with the precompiled template in local_templates.py, for single
+records and for bulk rendering.
+
+    python bench/local_templates_bench.py [--records 10000] [--repeat 5]
+"""
+import argparse
+import os
+import random
+import sys
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+import local_templates  # noqa: E402
+
+
+def legacy_experience_label(level):
+    labels = {
+        'entry': 'Entry Level (0-2 years)',
+        'mid': 'Mid Level (3-5 years)',
+        'senior': 'Senior Level (5-8 years)',
+        'lead': 'Lead/Principal (8+ years)'
+    }
+    return labels.get(level, level.title())
+
+
+def legacy_generate(data):
+    """The generator as it was before the template was precompiled."""
+    title = (data.get('jobTitle') or 'Unknown Position').strip()
+    company = (data.get('companyName') or '').strip()
+    city = (data.get('city') or '').strip()
+    state = (data.get('state') or '').strip()
+    job_type = (data.get('jobType') or '').strip()
+    exp = legacy_experience_label(data.get('experienceLevel', ''))
+    degree = (data.get('degree') or 'Relevant degree').strip()
+    skills = (data.get('skillsKnown') or '').strip()
+    salary = (data.get('salary') or '').strip()
+    email = (data.get('companyEmail') or '').strip()
+    add = (data.get('additionalDetails') or '').strip()
+    skills_list = [s.strip() for s in skills.split(',') if s.strip()]
+    responsibilities = [
+        f"Design, develop and maintain {title} features using {', '.join(skills_list) if skills_list else 'relevant technologies' }.",
+        "Collaborate with cross-functional teams to define, design, and ship new features.",
+        "Write clean, maintainable code and unit tests; participate in code reviews.",
+        "Troubleshoot, debug and optimize application performance and user experience.",
+        "Help document technical designs and contribute to team knowledge sharing."
+    ]
+    required_quals = [
+        f"Bachelor's degree in {degree} or equivalent experience.",
+        f"{exp} experience level.",
+        f"Proven experience with {', '.join(skills_list)}." if skills_list else "Relevant technical skills.",
+    ]
+    preferred_quals = [
+        "Familiarity with version control (Git) and CI/CD pipelines.",
+        "Experience working in Agile teams.",
+        "Strong problem-solving and communication skills."
+    ]
+    offer = [
+        f"Salary: {salary}" if salary else "Competitive salary.",
+        "Opportunities for growth and professional development.",
+        "Supportive team environment and flexible working arrangements where applicable."
+    ]
+    lines = []
+    lines.append(f"Job Overview:\n{title} at {company} — {city}, {state}\n")
+    lines.append(f"{title} at {company} is a {job_type} role targeted at {exp}. The successful candidate will work on building reliable, user-focused applications and collaborate across teams to deliver high-quality software.")
+    lines.append("\nKey Responsibilities:")
+    for r in responsibilities:
+        lines.append(f"- {r}")
+    lines.append("\nRequired Qualifications:")
+    for q in required_quals:
+        lines.append(f"- {q}")
+    lines.append("\nPreferred Qualifications:")
+    for q in preferred_quals:
+        lines.append(f"- {q}")
+    if add:
+        lines.append("\nAdditional Details:")
+        lines.append(f"{add}")
+    lines.append("\nWhat We Offer:")
+    for o in offer:
+        lines.append(f"- {o}")
+    lines.append("\nHow to Apply:")
+    if email:
+        lines.append(f"Please send your resume and a brief cover letter to {email} with the subject '{title} Application'.")
+    else:
+        lines.append("Please apply through the company's careers page or contact the hiring team for application instructions.")
+    return "\n".join(lines)
+
+
+def make_records(n, seed=42):
+    rng = random.Random(seed)
+    titles = ['Backend Engineer', 'Data Analyst', 'Product Designer', 'Site Reliability Engineer']
+    skills = ['Python, Flask, SQL', 'Go, Kubernetes', 'Figma, UX research', '', 'React, TypeScript, GraphQL']
+    return [{
+        'jobTitle': rng.choice(titles),
+        'companyName': f'Company {rng.randint(1, 200)}',
+        'city': 'Chennai',
+        'state': 'Tamil Nadu',
+        'jobType': rng.choice(['full-time', 'contract', 'part-time']),
+        'experienceLevel': rng.choice(['entry', 'mid', 'senior', 'lead']),
+        'degree': 'Computer Science',
+        'skillsKnown': rng.choice(skills),
+        'salary': rng.choice(['', '12 LPA', '$120k']),
+        'companyEmail': rng.choice(['', 'jobs@example.com']),
+        'additionalDetails': rng.choice(['', 'Hybrid, 3 days in office.']),
+    } for _ in range(n)]
+
+
+def best_of(repeat, fn):
+    best = float('inf')
+    for _ in range(repeat):
+        t = time.perf_counter()
+        fn()
+        best = min(best, time.perf_counter() - t)
+    return best
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--records', type=int, default=10000)
+    parser.add_argument('--repeat', type=int, default=5)
+    args = parser.parse_args()
+
+    records = make_records(args.records)
+    columns = {k: [r[k] for r in records] for k in records[0]}
+    assert [legacy_generate(r) for r in records[:200]] == local_templates.render_many(records[:200])
+
+    cases = [
+        ('legacy per-record', lambda: [legacy_generate(r) for r in records]),
+        ('compiled per-record', lambda: [local_templates.render(r) for r in records]),
+        ('compiled render_many', lambda: local_templates.render_many(records)),
+        ('compiled render_columns', lambda: local_templates.render_columns(columns)),
+    ]
+    print(f'{args.records} records, best of {args.repeat}')
+    baseline = None
+    for name, fn in cases:
+        secs = best_of(args.repeat, fn)
+        per = secs / args.records * 1e6
+        baseline = baseline or per
+        print(f'  {name:<26} {per:8.2f} us/record  ({baseline / per:4.1f}x)')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,215 @@
+"""Local stand-in for OpenRouter's ``/v1/chat/completions``, for offline benchmarks.
+
+Point the app at it with ``OPENROUTER_BASE_URL=http://127.0.0.1:<port>/api``.
+Every response is a fixed, realistic job description (plain or streamed as
+SSE chunks) after a configurable delay, cut short at the request's
+``max_tokens`` (finish_reason ``length``), with ``usage`` counted at about
+four characters per token. A configurable share of requests
+gets a 429 (with Retry-After) or a 500 instead. Randomness is seeded, so a
+run is reproducible.
+
+    python bench/openrouter_stub.py [--port 8001] [--latency-ms 800] [--jitter-ms 200]
+        [--rate-429 0.05] [--error-rate 0.01] [--chunk-chars 12] [--chunk-delay-ms 15]
+
+load_bench.py starts it automatically; the first line it prints is the
+``http://host:port`` it listens on.
+"""
+import argparse
+import json
+import os
+import random
+import sys
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+import local_templates  # noqa: E402
+
+FORM = {
+    'jobTitle': 'Senior Site Reliability Engineer', 'companyName': 'Acme Cloud Services',
+    'city': 'Chennai', 'state': 'Tamil Nadu', 'jobType': 'Full Time', 'experienceLevel': 'senior',
+    'skillsKnown': 'Kubernetes, Terraform, Go, Prometheus', 'salary': '30-40 LPA',
+    'companyEmail': 'jobs@example.com', 'additionalDetails': 'Hybrid, three days a week in office.',
+}
+# Models sprinkle markdown into "plain text" answers; keep some so the cleanup path is exercised
+COMPLETION = local_templates.render(FORM).replace('Job Overview:', '**Job Overview:**', 1)
+
+
+def completion_for(payload):
+    """``(text, finish_reason, usage)`` for a request, honouring its ``max_tokens``."""
+    text = COMPLETION
+    finish_reason = 'stop'
+    max_tokens = payload.get('max_tokens')
+    if max_tokens and len(text) > max_tokens * 4:
+        text, finish_reason = text[:max_tokens * 4], 'length'
+    prompt = sum(len(m.get('content') or '') for m in payload.get('messages') or [] if isinstance(m, dict))
+    usage = {'prompt_tokens': prompt // 4, 'completion_tokens': len(text) // 4}
+    usage['total_tokens'] = usage['prompt_tokens'] + usage['completion_tokens']
+    return text, finish_reason, usage
+
+
+class StubConfig:
+
+    def __init__(self, latency_ms=800, jitter_ms=200, rate_429=0.0, error_rate=0.0, chunk_chars=12,
+                 chunk_delay_ms=15, retry_after=1, seed=1):
+        self.latency_ms = latency_ms
+        self.jitter_ms = jitter_ms
+        self.rate_429 = rate_429
+        self.error_rate = error_rate
+        self.chunk_chars = max(1, chunk_chars)
+        self.chunk_delay_ms = chunk_delay_ms
+        self.retry_after = retry_after
+        self._rng = random.Random(seed)
+        self._lock = threading.Lock()
+        self.counts = {'requests': 0, 'ok': 0, '429': 0, 'error': 0, 'streamed': 0}
+
+    def draw(self):
+        """``(outcome, delay seconds)`` for the next request."""
+        with self._lock:
+            r = self._rng.random()
+            delay = max(0.0, self.latency_ms + self._rng.uniform(-self.jitter_ms, self.jitter_ms)) / 1000.0
+            self.counts['requests'] += 1
+            if r < self.rate_429:
+                outcome = '429'
+            elif r < self.rate_429 + self.error_rate:
+                outcome = 'error'
+            else:
+                outcome = 'ok'
+            self.counts[outcome] += 1
+        return outcome, delay
+
+    def as_dict(self):
+        return {'latency_ms': self.latency_ms, 'jitter_ms': self.jitter_ms, 'rate_429': self.rate_429,
+                'error_rate': self.error_rate, 'chunk_chars': self.chunk_chars,
+                'chunk_delay_ms': self.chunk_delay_ms}
+
+
+def make_handler(config):
+
+    class Handler(BaseHTTPRequestHandler):
+        protocol_version = 'HTTP/1.1'
+
+        def log_message(self, *args):
+            pass
+
+        def send_json(self, status, obj, headers=()):
+            body = json.dumps(obj).encode('utf-8')
+            self.send_response(status)
+            self.send_header('Content-Type', 'application/json')
+            self.send_header('Content-Length', str(len(body)))
+            for k, v in headers:
+                self.send_header(k, v)
+            self.end_headers()
+            self.wfile.write(body)
+
+        def do_GET(self):
+            if self.path.rstrip('/') == '/stats':
+                return self.send_json(200, dict(config.counts, config=config.as_dict()))
+            self.send_json(404, {'error': 'not found'})
+
+        def do_POST(self):
+            body = self.rfile.read(int(self.headers.get('Content-Length') or 0))
+            if not self.path.endswith('/v1/chat/completions'):
+                return self.send_json(404, {'error': {'message': 'not found'}})
+            try:
+                payload = json.loads(body or b'{}')
+            except ValueError:
+                return self.send_json(400, {'error': {'message': 'invalid JSON'}})
+            outcome, delay = config.draw()
+            if outcome == '429':
+                # Rate limits are answered fast, as OpenRouter does
+                return self.send_json(429, {'error': {'message': 'Rate limit exceeded', 'code': 429}},
+                                      headers=[('Retry-After', str(config.retry_after))])
+            time.sleep(delay)
+            if outcome == 'error':
+                return self.send_json(500, {'error': {'message': 'Internal error (stub)', 'code': 500}})
+            text, finish_reason, usage = completion_for(payload)
+            if payload.get('stream'):
+                return self.stream(text, finish_reason, usage)
+            self.send_json(200, {'id': 'stub', 'model': payload.get('model'), 'usage': usage,
+                                 'choices': [{'message': {'role': 'assistant', 'content': text},
+                                              'finish_reason': finish_reason}]})
+
+        def stream(self, text, finish_reason, usage):
+            with config._lock:
+                config.counts['streamed'] += 1
+            self.send_response(200)
+            self.send_header('Content-Type', 'text/event-stream')
+            self.send_header('Transfer-Encoding', 'chunked')
+            self.end_headers()
+
+            def chunk(data):
+                self.wfile.write(b'%x\r\n%s\r\n' % (len(data), data))
+                self.wfile.flush()
+
+            chunk(b': OPENROUTER PROCESSING\n\n')
+            step = config.chunk_chars
+            for i in range(0, len(text), step):
+                event = {'choices': [{'delta': {'content': text[i:i + step]}}]}
+                chunk(f'data: {json.dumps(event)}\n\n'.encode('utf-8'))
+                if config.chunk_delay_ms:
+                    time.sleep(config.chunk_delay_ms / 1000.0)
+            # OpenRouter sends finish_reason and usage with the last chunk
+            event = {'choices': [{'delta': {}, 'finish_reason': finish_reason}], 'usage': usage}
+            chunk(f'data: {json.dumps(event)}\n\n'.encode('utf-8'))
+            chunk(b'data: [DONE]\n\n')
+            self.wfile.write(b'0\r\n\r\n')
+
+    return Handler
+
+
+class StubServer(ThreadingHTTPServer):
+    daemon_threads = True
+    request_queue_size = 1024
+
+    def handle_error(self, request, client_address):
+        # Pooled keep-alive connections are reset when the app under test exits
+        if not isinstance(sys.exc_info()[1], (ConnectionResetError, BrokenPipeError)):
+            super().handle_error(request, client_address)
+
+
+def start(config, host='127.0.0.1', port=0):
+    """Serve ``config`` on a background thread; returns ``(server, base_url)``."""
+    server = StubServer((host, port), make_handler(config))
+    threading.Thread(target=server.serve_forever, name='openrouter-stub', daemon=True).start()
+    return server, f'http://{host}:{server.server_port}'
+
+
+def add_arguments(parser, prefix=''):
+    """Stub options; load_bench.py adds them as ``--stub-latency-ms`` etc."""
+    def add(name, **kwargs):
+        parser.add_argument(f'--{prefix}{name}', dest=name.replace('-', '_'), **kwargs)
+
+    add('latency-ms', type=float, default=800, help='mean time to answer (default 800)')
+    add('jitter-ms', type=float, default=200, help='uniform +/- jitter on the latency')
+    add('rate-429', type=float, default=0.0, help='share of requests answered with 429')
+    add('error-rate', type=float, default=0.0, help='share of requests answered with 500')
+    add('chunk-chars', type=int, default=12, help='characters per streamed SSE event')
+    add('chunk-delay-ms', type=float, default=15, help='delay between streamed events')
+    add('seed', type=int, default=1)
+
+
+def config_from_args(args):
+    return StubConfig(latency_ms=args.latency_ms, jitter_ms=args.jitter_ms, rate_429=args.rate_429,
+                      error_rate=args.error_rate, chunk_chars=args.chunk_chars,
+                      chunk_delay_ms=args.chunk_delay_ms, seed=args.seed)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=8001, help='0 picks a free port')
+    add_arguments(parser)
+    args = parser.parse_args()
+    server, url = start(config_from_args(args), args.host, args.port)
+    print(url, flush=True)
+    try:
+        threading.Event().wait()
+    except KeyboardInterrupt:
+        server.shutdown()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,74 @@
+"""PDF export benchmark: render time and output size for short and long postings.
+
+Compares redrawing the border/header on every page with the shared form
+XObject, for a 1-page and a 10-page document.
+
+    python bench/pdf_bench.py [--repeat 20]
+"""
+import argparse
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+import local_templates  # noqa: E402
+from pdf_render import render_job_pdf  # noqa: E402
+
+JOB_DETAILS = {
+    'title': 'Senior Site Reliability Engineer',
+    'company': 'Acme Cloud Services',
+    'location': 'Chennai, Tamil Nadu',
+    'jobType': 'Full Time',
+    'experienceLevel': 'Senior Level (5-8 years)',
+    'salary': '₹30-40 LPA',
+    'email': 'jobs@example.com',
+}
+
+FORM = {
+    'jobTitle': 'Senior Site Reliability Engineer', 'companyName': 'Acme Cloud Services',
+    'city': 'Chennai', 'state': 'Tamil Nadu', 'jobType': 'Full Time', 'experienceLevel': 'senior',
+    'skillsKnown': 'Kubernetes, Terraform, Go, Prometheus', 'salary': '₹30-40 LPA',
+    'companyEmail': 'jobs@example.com', 'additionalDetails': 'Hybrid, three days a week in office.',
+}
+
+
+def document(pages):
+    """A description long enough to fill roughly ``pages`` pages."""
+    one = local_templates.render(FORM)
+    if pages <= 1:
+        return one
+    return '\n\n'.join([one] * (pages * 3 // 2))
+
+
+def best_of(repeat, fn):
+    best = float('inf')
+    out = None
+    for _ in range(repeat):
+        t = time.perf_counter()
+        out = fn()
+        best = min(best, time.perf_counter() - t)
+    return best, out
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--repeat', type=int, default=20)
+    args = parser.parse_args()
+
+    print(f'best of {args.repeat}')
+    for pages in (1, 10):
+        text = document(pages)
+        results = {}
+        for label, reuse in (('per-page redraw', False), ('form xobject', True)):
+            secs, pdf = best_of(args.repeat, lambda: render_job_pdf(JOB_DETAILS, text, reuse_decorations=reuse))
+            results[label] = (secs, len(pdf), pdf.count(b'/Type /Page\n'))
+        base_secs, base_size, _ = results['per-page redraw']
+        for label, (secs, size, n_pages) in results.items():
+            print(f'  {pages:>2}-page target ({n_pages} pages) {label:<16} '
+                  f'{secs * 1000:7.2f} ms  {size:7d} bytes  '
+                  f'({base_secs / secs:4.2f}x time, {size / base_size:4.2f}x size)')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,173 @@
+"""Cold-start cost of the app: import time, first responses and a per-module import profile.
+
+Every run is a fresh interpreter, as on a serverless cold start. It measures
+``import app``, then the first request to /, /generate (local template, no
+network) and /download_pdf through Flask's test client, peak RSS, and
+whether reportlab was loaded by the import alone.
+
+    python bench/startup_bench.py [--runs 10] [--profile] [--top 20] [--ref HEAD~1]
+        [--env PREWARM=pdf]
+
+``--profile`` adds a per-module report parsed from ``python -X importtime``:
+self time summed per top-level package, and the slowest modules by
+cumulative time (medians over the runs). ``--ref`` runs the same
+measurements against a git revision exported to a temp dir with
+``git archive``, to show before/after numbers side by side.
+"""
+import argparse
+import json
+import os
+import shutil
+import statistics
+import subprocess
+import sys
+import tempfile
+
+ROOT = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..')
+
+# No key, so /generate answers from the local template; no probes or sampled logs
+CHILD_ENV = {'OPENROUTER_API_KEY': '', 'DIAG_PROBE_INTERVAL': '0', 'LOG_SAMPLE_RATE': '0'}
+
+CHILD = r'''
+import json, resource, sys, time
+t = time.perf_counter()
+import app as main
+out = {'import_ms': (time.perf_counter() - t) * 1000, 'reportlab_at_import': 'reportlab' in sys.modules}
+client = main.app.test_client()
+form = {'jobTitle': 'Backend Engineer', 'companyName': 'Acme', 'city': 'Chennai', 'state': 'Tamil Nadu',
+        'jobType': 'Full Time', 'experienceLevel': 'mid', 'skillsKnown': 'Python, SQL', 'salary': '12 LPA',
+        'companyEmail': 'jobs@example.com'}
+pdf = {'jobDetails': {'title': 'Backend Engineer', 'company': 'Acme'},
+       'jobDescription': 'Job Overview:\nBuild services.\n\nKey Responsibilities:\n- Ship features\n- Review code'}
+for name, path, body in (('index', '/', None), ('generate', '/generate', form), ('download_pdf', '/download_pdf', pdf)):
+    t = time.perf_counter()
+    r = client.post(path, json=body) if body is not None else client.get(path)
+    r.get_data()
+    out[name + '_ms'] = (time.perf_counter() - t) * 1000
+    if r.status_code != 200:
+        out[name + '_status'] = r.status_code
+out['rss_mb'] = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+print(json.dumps(out))
+'''
+
+METRICS = ('import_ms', 'index_ms', 'generate_ms', 'download_pdf_ms', 'rss_mb')
+
+
+def child_env(extra):
+    env = dict(os.environ, **CHILD_ENV)
+    env.update(extra)
+    return env
+
+
+def run_once(tree, env):
+    proc = subprocess.run([sys.executable, '-c', CHILD], cwd=tree, env=env, capture_output=True, text=True)
+    if proc.returncode != 0:
+        raise SystemExit(f'child failed in {tree}:\n{proc.stderr}')
+    return json.loads(proc.stdout.strip().splitlines()[-1])
+
+
+def measure(tree, runs, env):
+    """Median of each metric over ``runs`` cold starts (after one discarded run that writes .pyc files)."""
+    run_once(tree, env)
+    samples = [run_once(tree, env) for _ in range(runs)]
+    result = {m: round(statistics.median(s[m] for s in samples), 2) for m in METRICS}
+    result['import_ms_min'] = round(min(s['import_ms'] for s in samples), 2)
+    result['reportlab_at_import'] = any(s['reportlab_at_import'] for s in samples)
+    errors = {k: v for s in samples for k, v in s.items() if k.endswith('_status')}
+    if errors:
+        result['errors'] = errors
+    return result
+
+
+def importtime(tree, env):
+    """``{module: (self_us, cumulative_us)}`` from one ``python -X importtime -c 'import app'``."""
+    proc = subprocess.run([sys.executable, '-X', 'importtime', '-c', 'import app'], cwd=tree, env=env,
+                          capture_output=True, text=True)
+    modules = {}
+    for line in proc.stderr.splitlines():
+        if not line.startswith('import time:') or 'self [us]' in line:
+            continue
+        self_us, cumulative_us, name = line[len('import time:'):].split('|')
+        modules[name.strip()] = (int(self_us), int(cumulative_us))
+    return modules
+
+
+def profile(tree, runs, env):
+    """Median self/cumulative ms per module, and self ms summed per top-level package."""
+    importtime(tree, env)
+    samples = [importtime(tree, env) for _ in range(runs)]
+    modules = {}
+    for name in samples[-1]:
+        values = [s[name] for s in samples if name in s]
+        modules[name] = (statistics.median(v[0] for v in values) / 1000,
+                         statistics.median(v[1] for v in values) / 1000)
+    packages = {}
+    for name, (self_ms, _) in modules.items():
+        root = name.split('.')[0]
+        packages[root] = packages.get(root, 0.0) + self_ms
+    total = sum(v[0] for v in modules.values())
+    return {'total_ms': round(total, 1), 'modules': modules, 'packages': packages}
+
+
+def print_profile(label, report, top):
+    print(f'\n{label}: {len(report["modules"])} modules, {report["total_ms"]:.1f} ms total import time')
+    print(f'  {"package (self time summed)":<40} {"ms":>8}')
+    for name, ms in sorted(report['packages'].items(), key=lambda kv: -kv[1])[:top]:
+        print(f'  {name:<40} {ms:>8.1f}')
+    print(f'\n  {"module (slowest cumulative)":<48} {"self ms":>8} {"cum ms":>8}')
+    for name, (self_ms, cum_ms) in sorted(report['modules'].items(), key=lambda kv: -kv[1][1])[:top]:
+        print(f'  {name[:48]:<48} {self_ms:>8.1f} {cum_ms:>8.1f}')
+
+
+def print_results(results):
+    labels = list(results)
+    print(f'\n{"metric (median)":<22}' + ''.join(f'{label:>16}' for label in labels))
+    for m in METRICS + ('import_ms_min', 'reportlab_at_import'):
+        print(f'{m:<22}' + ''.join(f'{str(results[label][m]):>16}' for label in labels))
+    for label, r in results.items():
+        if r.get('errors'):
+            print(f'{label}: non-200 responses {r["errors"]}')
+
+
+def export_ref(ref):
+    tree = tempfile.mkdtemp(prefix='jd-startup-')
+    archive = subprocess.run(['git', 'archive', ref], cwd=ROOT, capture_output=True, check=True).stdout
+    subprocess.run(['tar', '-x', '-C', tree], input=archive, check=True)
+    return tree
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--runs', type=int, default=10, help='cold starts per tree (default 10)')
+    parser.add_argument('--profile', action='store_true', help='per-module import-time report')
+    parser.add_argument('--top', type=int, default=20, help='rows in the profile tables')
+    parser.add_argument('--ref', help='also measure this git revision (e.g. HEAD~1)')
+    parser.add_argument('--env', action='append', default=[], help='KEY=VALUE for the app, repeatable')
+    parser.add_argument('--json', action='store_true', help='print the results as JSON')
+    args = parser.parse_args()
+    env = child_env(dict(e.split('=', 1) for e in args.env))
+
+    trees = {'current': os.path.abspath(ROOT)}
+    if args.ref:
+        trees = {args.ref: export_ref(args.ref), **trees}
+    try:
+        results = {label: measure(tree, args.runs, env) for label, tree in trees.items()}
+        profiles = {label: profile(tree, min(args.runs, 5), env) for label, tree in trees.items()} \
+            if args.profile else {}
+    finally:
+        if args.ref:
+            shutil.rmtree(trees[args.ref], ignore_errors=True)
+
+    if args.json:
+        print(json.dumps({'results': results,
+                          'profiles': {k: {'total_ms': v['total_ms'], 'packages': v['packages']}
+                                       for k, v in profiles.items()}}, indent=2))
+        return
+    print(f'{args.runs} cold starts per tree, python {sys.version.split()[0]}')
+    print_results(results)
+    for label, report in profiles.items():
+        print_profile(label, report, args.top)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,147 @@
+"""Circuit breaker for the OpenRouter call.
+
+closed     calls go through; outcomes are recorded in a sliding time window.
+           The breaker opens when, with at least ``min_calls`` in the window,
+           the failure rate or the timeout rate crosses its threshold.
+open       calls are refused straight away (``CircuitOpen``) until
+           ``open_seconds`` have passed.
+half_open  up to ``half_open_probes`` calls are let through as probes. A
+           successful probe closes the breaker; a failed one re-opens it for
+           another ``open_seconds``.
+"""
+import threading
+import time
+from collections import deque
+
+import log
+
+CLOSED = 'closed'
+OPEN = 'open'
+HALF_OPEN = 'half_open'
+
+
+class CircuitOpen(Exception):
+    """The breaker refused the call."""
+
+
+class CircuitBreaker:
+
+    def __init__(self, window_seconds=60, min_calls=5, failure_rate=0.5, timeout_rate=0.3,
+                 open_seconds=30, half_open_probes=1):
+        self.window_seconds = window_seconds
+        self.min_calls = min_calls
+        self.failure_rate = failure_rate
+        self.timeout_rate = timeout_rate
+        self.open_seconds = open_seconds
+        self.half_open_probes = half_open_probes
+        self._lock = threading.Lock()
+        self._outcomes = deque()  # (monotonic time, 'success' | 'failure' | 'timeout')
+        self._state = CLOSED
+        self._opened_at = 0.0
+        self._probes = 0
+        self._reason = None
+        self.opened_count = 0
+        self.short_circuited = 0
+        # Times each state was entered
+        self.transitions = {CLOSED: 0, OPEN: 0, HALF_OPEN: 0}
+
+    @property
+    def state(self):
+        with self._lock:
+            self._maybe_half_open(time.monotonic())
+            return self._state
+
+    def before_call(self):
+        """Raise ``CircuitOpen`` unless the call may proceed."""
+        with self._lock:
+            now = time.monotonic()
+            self._maybe_half_open(now)
+            if self._state == CLOSED:
+                return
+            if self._state == HALF_OPEN and self._probes < self.half_open_probes:
+                self._probes += 1
+                return
+            self.short_circuited += 1
+            retry_in = max(0.0, self._opened_at + self.open_seconds - now)
+            raise CircuitOpen(f'Circuit breaker open ({self._reason}); retrying upstream in {retry_in:.0f}s')
+
+    def record_success(self):
+        self._record('success')
+
+    def record_failure(self, timeout=False):
+        self._record('timeout' if timeout else 'failure')
+
+    def release(self):
+        """Give back a half-open probe slot without recording an outcome."""
+        with self._lock:
+            if self._state == HALF_OPEN and self._probes:
+                self._probes -= 1
+
+    def _record(self, outcome):
+        with self._lock:
+            now = time.monotonic()
+            if self._state == HALF_OPEN:
+                if outcome == 'success':
+                    self._state = CLOSED
+                    self._outcomes.clear()
+                    self._reason = None
+                    self.transitions[CLOSED] += 1
+                    log.event('breaker.closed', sample=1)
+                else:
+                    self._open(now, f'half-open probe {outcome}')
+                return
+            if self._state == OPEN:
+                # Late result of a call that started before the breaker opened
+                return
+            self._outcomes.append((now, outcome))
+            self._trim(now)
+            total = len(self._outcomes)
+            if total < self.min_calls or outcome == 'success':
+                return
+            failures = sum(1 for _, o in self._outcomes if o != 'success')
+            timeouts = sum(1 for _, o in self._outcomes if o == 'timeout')
+            if timeouts / total >= self.timeout_rate:
+                self._open(now, f'{timeouts}/{total} calls timed out')
+            elif failures / total >= self.failure_rate:
+                self._open(now, f'{failures}/{total} calls failed')
+
+    def _open(self, now, reason):
+        self._state = OPEN
+        self._opened_at = now
+        self._probes = 0
+        self._reason = reason
+        self.opened_count += 1
+        self.transitions[OPEN] += 1
+        log.event('breaker.opened', level='warning', reason=reason, open_seconds=self.open_seconds)
+
+    def _maybe_half_open(self, now):
+        if self._state == OPEN and now - self._opened_at >= self.open_seconds:
+            self._state = HALF_OPEN
+            self._probes = 0
+            self.transitions[HALF_OPEN] += 1
+
+    def _trim(self, now):
+        cutoff = now - self.window_seconds
+        while self._outcomes and self._outcomes[0][0] < cutoff:
+            self._outcomes.popleft()
+
+    def stats(self):
+        with self._lock:
+            now = time.monotonic()
+            self._maybe_half_open(now)
+            self._trim(now)
+            total = len(self._outcomes)
+            failures = sum(1 for _, o in self._outcomes if o != 'success')
+            timeouts = sum(1 for _, o in self._outcomes if o == 'timeout')
+            return {
+                'state': self._state,
+                'reason': self._reason,
+                'window_calls': total,
+                'failure_rate': round(failures / total, 3) if total else 0.0,
+                'timeout_rate': round(timeouts / total, 3) if total else 0.0,
+                'open_for_s': round(max(0.0, self._opened_at + self.open_seconds - now), 1)
+                if self._state == OPEN else 0.0,
+                'opened_count': self.opened_count,
+                'short_circuited': self.short_circuited,
+                'transitions': dict(self.transitions),
+            }
@@ -0,0 +1,186 @@
+"""Small in-process caches used by app.py.
+
+``LRUCache`` is a thread-safe LRU with optional TTL and byte budget.
+``SQLiteCache`` is an on-disk tier that survives restarts, and
+``TieredCache`` puts the two together: reads check memory first and promote
+disk hits, writes go to both.
+"""
+import hashlib
+import json
+import os
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+
+import log
+
+
+def content_hash(obj):
+    """Stable sha256 hex digest of a JSON-serialisable object."""
+    raw = json.dumps(obj, sort_keys=True, separators=(',', ':'), ensure_ascii=False)
+    return hashlib.sha256(raw.encode('utf-8')).hexdigest()
+
+
+class LRUCache:
+    """Least-recently-used cache bounded by entry count and optionally bytes."""
+
+    def __init__(self, max_entries=256, ttl=None, max_bytes=None, sizeof=len):
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self.max_bytes = max_bytes
+        self._sizeof = sizeof
+        self._data = OrderedDict()  # key -> (expires_at, size, value)
+        self._bytes = 0
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def get(self, key):
+        with self._lock:
+            item = self._data.get(key)
+            if item is None:
+                self.misses += 1
+                return None
+            expires_at, size, value = item
+            if expires_at is not None and expires_at <= time.time():
+                del self._data[key]
+                self._bytes -= size
+                self.misses += 1
+                return None
+            self._data.move_to_end(key)
+            self.hits += 1
+            return value
+
+    def set(self, key, value):
+        size = self._sizeof(value) if self.max_bytes else 0
+        if self.max_bytes and size > self.max_bytes:
+            # Never let a single oversized value flush the whole cache
+            return False
+        expires_at = time.time() + self.ttl if self.ttl else None
+        with self._lock:
+            old = self._data.pop(key, None)
+            if old is not None:
+                self._bytes -= old[1]
+            self._data[key] = (expires_at, size, value)
+            self._bytes += size
+            while self._data and (len(self._data) > self.max_entries
+                                  or (self.max_bytes and self._bytes > self.max_bytes)):
+                _, (_, old_size, _) = self._data.popitem(last=False)
+                self._bytes -= old_size
+                self.evictions += 1
+        return True
+
+    def clear(self):
+        with self._lock:
+            self._data.clear()
+            self._bytes = 0
+
+    def __len__(self):
+        return len(self._data)
+
+    def stats(self):
+        return {
+            'entries': len(self._data),
+            'bytes': self._bytes if self.max_bytes else None,
+            'max_entries': self.max_entries,
+            'max_bytes': self.max_bytes,
+            'ttl': self.ttl,
+            'hits': self.hits,
+            'misses': self.misses,
+            'evictions': self.evictions,
+        }
+
+
+class SQLiteCache:
+    """Key/value cache stored in a single SQLite table.
+
+    Expired rows are ignored on read and pruned, together with the oldest
+    rows beyond ``max_rows``, every ``prune_every`` writes.
+    """
+
+    def __init__(self, path, table='cache', ttl=None, max_rows=10000, prune_every=100):
+        self.path = path
+        self.table = table
+        self.ttl = ttl
+        self.max_rows = max_rows
+        self.prune_every = prune_every
+        self._writes = 0
+        self._lock = threading.Lock()
+        directory = os.path.dirname(os.path.abspath(path))
+        os.makedirs(directory, exist_ok=True)
+        self._conn = sqlite3.connect(path, check_same_thread=False, isolation_level=None)
+        self._conn.execute('PRAGMA journal_mode=WAL')
+        self._conn.execute(
+            f'CREATE TABLE IF NOT EXISTS {table} (key TEXT PRIMARY KEY, value BLOB, created REAL)')
+        self._conn.execute(f'CREATE INDEX IF NOT EXISTS {table}_created ON {table} (created)')
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, key):
+        with self._lock:
+            row = self._conn.execute(
+                f'SELECT value, created FROM {self.table} WHERE key = ?', (key,)).fetchone()
+            if row is None or (self.ttl and row[1] + self.ttl <= time.time()):
+                self.misses += 1
+                return None
+            self.hits += 1
+            return row[0]
+
+    def set(self, key, value):
+        with self._lock:
+            self._conn.execute(
+                f'INSERT OR REPLACE INTO {self.table} (key, value, created) VALUES (?, ?, ?)',
+                (key, value, time.time()))
+            self._writes += 1
+            if self._writes % self.prune_every == 0:
+                self._prune()
+        return True
+
+    def _prune(self):
+        if self.ttl:
+            self._conn.execute(f'DELETE FROM {self.table} WHERE created <= ?',
+                               (time.time() - self.ttl,))
+        if self.max_rows:
+            self._conn.execute(
+                f'DELETE FROM {self.table} WHERE key NOT IN '
+                f'(SELECT key FROM {self.table} ORDER BY created DESC LIMIT ?)', (self.max_rows,))
+
+    def stats(self):
+        with self._lock:
+            rows = self._conn.execute(f'SELECT COUNT(*) FROM {self.table}').fetchone()[0]
+        return {'path': self.path, 'rows': rows, 'max_rows': self.max_rows,
+                'ttl': self.ttl, 'hits': self.hits, 'misses': self.misses}
+
+
+class TieredCache:
+    """Memory LRU in front of an optional ``SQLiteCache``."""
+
+    def __init__(self, memory, disk=None):
+        self.memory = memory
+        self.disk = disk
+
+    def get(self, key):
+        value = self.memory.get(key)
+        if value is None and self.disk is not None:
+            try:
+                value = self.disk.get(key)
+            except sqlite3.Error as e:
+                log.event('cache.disk_read_failed', level='warning', error=str(e))
+                value = None
+            if value is not None:
+                self.memory.set(key, value)
+        return value
+
+    def set(self, key, value):
+        self.memory.set(key, value)
+        if self.disk is not None:
+            try:
+                self.disk.set(key, value)
+            except sqlite3.Error as e:
+                log.event('cache.disk_write_failed', level='warning', error=str(e))
+
+    def stats(self):
+        return {'memory': self.memory.stats(),
+                'disk': self.disk.stats() if self.disk is not None else None}
@@ -0,0 +1,223 @@
+"""Hedged requests: race a backup call against a slow primary.
+
+``Hedger.race`` starts the primary call and waits up to ``delay()`` seconds
+for its first token. If none arrives (or the primary fails outright) the
+secondary call is started too, the first successful result wins and the
+other call is cancelled. The delay tracks a percentile of recent primary
+first-token latencies, so hedges fire only for the slow tail.
+
+Calls are ``fn(cancel, on_first_token) -> (result, error)``: they should
+stop early once ``cancel`` is set and call ``on_first_token()`` as soon as
+output starts arriving. ``cancel`` is a ``threading.Event`` unless the
+hedger is given another ``make_cancel`` (app.py uses upstream.Abort, which
+interrupts a blocked read as soon as it is set). ``race_async`` takes coroutine functions
+``fn(on_first_token)`` instead and cancels the losing task.
+"""
+import asyncio
+import threading
+import time
+from collections import deque
+
+PRIMARY = 'primary'
+SECONDARY = 'secondary'
+
+
+class Hedger:
+
+    def __init__(self, percentile=95, initial_delay=3.0, min_delay=0.5, max_delay=15.0,
+                 window=200, min_samples=20, make_cancel=threading.Event):
+        self.percentile = percentile
+        self.make_cancel = make_cancel
+        self.initial_delay = initial_delay
+        self.min_delay = min_delay
+        self.max_delay = max_delay
+        self.min_samples = min_samples
+        self._samples = deque(maxlen=window)
+        self._lock = threading.Lock()
+        self.races = 0
+        self.fired = 0
+        self.secondary_wins = 0
+        self.primary_wins = 0
+        self.both_failed = 0
+
+    def observe(self, seconds):
+        """Record a primary first-token latency."""
+        with self._lock:
+            self._samples.append(seconds)
+
+    def delay(self):
+        with self._lock:
+            samples = sorted(self._samples)
+        if len(samples) < self.min_samples:
+            return self.initial_delay
+        idx = min(len(samples) - 1, int(round(self.percentile / 100.0 * (len(samples) - 1))))
+        return max(self.min_delay, min(self.max_delay, samples[idx]))
+
+    def race(self, primary, secondary):
+        """Run the race; returns ``(result, error, info)``.
+
+        ``info`` has ``hedged`` (whether the secondary was started),
+        ``winner`` and ``delay``.
+        """
+        delay = self.delay()
+        cond = threading.Condition()
+        first_token = {}
+        finished = {}
+        cancel = {PRIMARY: self.make_cancel(), SECONDARY: self.make_cancel()}
+        started_at = time.monotonic()
+
+        def run(name, fn):
+            def on_first_token():
+                with cond:
+                    if name not in first_token:
+                        first_token[name] = time.monotonic() - started_at
+                        cond.notify_all()
+            try:
+                outcome = fn(cancel[name], on_first_token)
+            except Exception as e:
+                outcome = (None, str(e))
+            with cond:
+                finished[name] = outcome
+                cond.notify_all()
+
+        def start(name, fn):
+            threading.Thread(target=run, args=(name, fn), name=f'hedge-{name}', daemon=True).start()
+
+        with self._lock:
+            self.races += 1
+        start(PRIMARY, primary)
+        with cond:
+            cond.wait_for(lambda: PRIMARY in first_token or PRIMARY in finished, timeout=delay)
+            hedge = PRIMARY not in first_token and not (PRIMARY in finished and finished[PRIMARY][0])
+
+        if not hedge:
+            with cond:
+                cond.wait_for(lambda: PRIMARY in finished)
+                result, error = finished[PRIMARY]
+                ttft = first_token.get(PRIMARY)
+            if ttft is not None:
+                self.observe(ttft)
+            with self._lock:
+                self.primary_wins += 1
+            return result, error, {'hedged': False, 'winner': PRIMARY, 'delay': round(delay, 3)}
+
+        with self._lock:
+            self.fired += 1
+        start(SECONDARY, secondary)
+        with cond:
+            cond.wait_for(lambda: any(r[0] for r in finished.values()) or len(finished) == 2)
+            winner = next((n for n in (PRIMARY, SECONDARY) if n in finished and finished[n][0]), None)
+            ttft = first_token.get(PRIMARY)
+            primary_pending = PRIMARY not in finished
+        if ttft is not None:
+            self.observe(ttft)
+        elif primary_pending:
+            # Censored sample: the primary was at least this slow
+            self.observe(time.monotonic() - started_at)
+        for name, ev in cancel.items():
+            if name != winner:
+                ev.set()
+
+        with self._lock:
+            if winner == SECONDARY:
+                self.secondary_wins += 1
+            elif winner == PRIMARY:
+                self.primary_wins += 1
+            else:
+                self.both_failed += 1
+        info = {'hedged': True, 'winner': winner, 'delay': round(delay, 3)}
+        if winner is None:
+            errors = [finished[n][1] for n in (PRIMARY, SECONDARY) if finished.get(n) and finished[n][1]]
+            return None, '; '.join(errors) or 'Hedged calls returned no content', info
+        result, error = finished[winner]
+        return result, error, info
+
+    async def race_async(self, primary, secondary):
+        """``race`` for coroutine calls; same ``(result, error, info)`` and the same statistics."""
+        delay = self.delay()
+        first_token = {}
+        got_primary_token = asyncio.Event()
+        started_at = time.monotonic()
+
+        async def run(name, fn):
+            def on_first_token():
+                if name not in first_token:
+                    first_token[name] = time.monotonic() - started_at
+                    if name == PRIMARY:
+                        got_primary_token.set()
+            try:
+                return await fn(on_first_token)
+            except Exception as e:
+                return None, str(e)
+
+        with self._lock:
+            self.races += 1
+        tasks = {PRIMARY: asyncio.ensure_future(run(PRIMARY, primary))}
+        try:
+            token_wait = asyncio.ensure_future(got_primary_token.wait())
+            await asyncio.wait((tasks[PRIMARY], token_wait), timeout=delay,
+                               return_when=asyncio.FIRST_COMPLETED)
+            token_wait.cancel()
+            primary_done = tasks[PRIMARY].done()
+            hedge = PRIMARY not in first_token and not (primary_done and tasks[PRIMARY].result()[0])
+
+            if not hedge:
+                result, error = await tasks[PRIMARY]
+                ttft = first_token.get(PRIMARY)
+                if ttft is not None:
+                    self.observe(ttft)
+                with self._lock:
+                    self.primary_wins += 1
+                return result, error, {'hedged': False, 'winner': PRIMARY, 'delay': round(delay, 3)}
+
+            with self._lock:
+                self.fired += 1
+            tasks[SECONDARY] = asyncio.ensure_future(run(SECONDARY, secondary))
+            finished = {}
+            winner = None
+            pending = set(tasks.values())
+            while pending and winner is None:
+                done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+                for name, task in tasks.items():
+                    if task in done:
+                        finished[name] = task.result()
+                winner = next((n for n in (PRIMARY, SECONDARY) if n in finished and finished[n][0]), None)
+        finally:
+            # Cancels the loser, or both if our own caller was cancelled
+            for task in tasks.values():
+                task.cancel()
+
+        ttft = first_token.get(PRIMARY)
+        if ttft is not None:
+            self.observe(ttft)
+        elif PRIMARY not in finished:
+            # Censored sample: the primary was at least this slow
+            self.observe(time.monotonic() - started_at)
+        with self._lock:
+            if winner == SECONDARY:
+                self.secondary_wins += 1
+            elif winner == PRIMARY:
+                self.primary_wins += 1
+            else:
+                self.both_failed += 1
+        info = {'hedged': True, 'winner': winner, 'delay': round(delay, 3)}
+        if winner is None:
+            errors = [finished[n][1] for n in (PRIMARY, SECONDARY) if finished.get(n) and finished[n][1]]
+            return None, '; '.join(errors) or 'Hedged calls returned no content', info
+        result, error = finished[winner]
+        return result, error, info
+
+    def stats(self):
+        delay = self.delay()
+        with self._lock:
+            return {
+                'races': self.races,
+                'hedges_fired': self.fired,
+                'fire_rate': round(self.fired / self.races, 3) if self.races else 0.0,
+                'secondary_wins': self.secondary_wins,
+                'primary_wins': self.primary_wins,
+                'both_failed': self.both_failed,
+                'samples': len(self._samples),
+                'current_delay_s': round(delay, 3),
+                'percentile': self.percentile,
+            }
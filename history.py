@@ -0,0 +1,177 @@
+"""Append-only history of generated job descriptions, in SQLite.
+
+``HistoryStore.record`` only puts the entry on a bounded queue; a writer
+thread serialises it and inserts it in batches, so /generate never waits on
+the disk (when the queue is full entries are dropped and counted). Reads use
+their own connection, which WAL lets run alongside the writer.
+
+Entries are indexed by company, title (both case-insensitive) and time.
+``page`` pages newest-first with an id cursor, and ``iter_entries`` walks
+every match the same way in fixed-size batches, so an export streams rows
+rather than loading them all.
+"""
+import atexit
+import json
+import os
+import queue
+import sqlite3
+import threading
+import time
+
+import log
+
+SUMMARY_COLUMNS = ('id', 'created', 'company', 'title', 'model', 'route', 'latency_ms', 'fallback_used',
+                   'cache_hit', 'api_error')
+COLUMNS = SUMMARY_COLUMNS + ('inputs', 'job_description', 'metadata')
+
+
+class HistoryStore:
+
+    def __init__(self, path, queue_size=1000, batch_size=100):
+        self.path = path
+        self.batch_size = batch_size
+        os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        self._write_conn = sqlite3.connect(path, check_same_thread=False, isolation_level=None)
+        self._write_conn.execute('PRAGMA journal_mode=WAL')
+        self._write_conn.execute(
+            'CREATE TABLE IF NOT EXISTS history (id INTEGER PRIMARY KEY AUTOINCREMENT, created REAL NOT NULL, '
+            'company TEXT COLLATE NOCASE, title TEXT COLLATE NOCASE, model TEXT, route TEXT, latency_ms REAL, '
+            'fallback_used INTEGER, cache_hit INTEGER, api_error TEXT, inputs TEXT, job_description TEXT, '
+            'metadata TEXT)')
+        self._write_conn.execute('CREATE INDEX IF NOT EXISTS history_company ON history (company, id)')
+        self._write_conn.execute('CREATE INDEX IF NOT EXISTS history_title ON history (title, id)')
+        self._write_conn.execute('CREATE INDEX IF NOT EXISTS history_created ON history (created)')
+        self._read_conn = sqlite3.connect(path, check_same_thread=False, isolation_level=None)
+        self._read_lock = threading.Lock()
+        self._queue = queue.Queue(maxsize=queue_size)
+        self._thread = None
+        self._start_lock = threading.Lock()
+        self.queued = 0
+        self.written = 0
+        self.dropped = 0
+        self.failed = 0
+        atexit.register(self.flush)
+
+    def _ensure_started(self):
+        # The writer starts on first use so importing the app never spawns threads
+        if self._thread is not None:
+            return
+        with self._start_lock:
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._run, name='history-writer', daemon=True)
+                self._thread.start()
+
+    def record(self, entry):
+        """Queue one entry (a dict with the COLUMNS fields, minus ``id``); never blocks."""
+        self._ensure_started()
+        entry.setdefault('created', time.time())
+        try:
+            self._queue.put_nowait(entry)
+            self.queued += 1
+        except queue.Full:
+            self.dropped += 1
+
+    def _run(self):
+        while True:
+            batch = [self._queue.get()]
+            while len(batch) < self.batch_size:
+                try:
+                    batch.append(self._queue.get_nowait())
+                except queue.Empty:
+                    break
+            try:
+                self._write(batch)
+                self.written += len(batch)
+            except Exception as e:
+                self.failed += len(batch)
+                log.event('history.write_failed', level='error', entries=len(batch), error=str(e))
+            finally:
+                for _ in batch:
+                    self._queue.task_done()
+
+    def _write(self, batch):
+        rows = [(e['created'], e.get('company'), e.get('title'), e.get('model'), e.get('route'),
+                 e.get('latency_ms'), int(bool(e.get('fallback_used'))), int(bool(e.get('cache_hit'))),
+                 e.get('api_error'), json.dumps(e.get('inputs') or {}), e.get('job_description'),
+                 json.dumps(e.get('metadata') or {}, default=str))
+                for e in batch]
+        with self._write_conn:
+            self._write_conn.execute('BEGIN')
+            self._write_conn.executemany(
+                'INSERT INTO history (created, company, title, model, route, latency_ms, fallback_used, '
+                'cache_hit, api_error, inputs, job_description, metadata) '
+                'VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)', rows)
+
+    def flush(self, timeout=2.0):
+        """Wait up to ``timeout`` seconds for queued entries to be written; True if none are left."""
+        deadline = time.monotonic() + timeout
+        while self._queue.unfinished_tasks and self._thread is not None:
+            if time.monotonic() >= deadline:
+                return False
+            time.sleep(0.01)
+        return True
+
+    @staticmethod
+    def _where(company=None, title=None, since=None, until=None, before=None):
+        clauses, params = [], []
+        for column, value in (('company', company), ('title', title)):
+            if value:
+                clauses.append(f'{column} = ?')
+                params.append(value)
+        if since is not None:
+            clauses.append('created >= ?')
+            params.append(since)
+        if until is not None:
+            clauses.append('created < ?')
+            params.append(until)
+        if before is not None:
+            clauses.append('id < ?')
+            params.append(before)
+        return (' WHERE ' + ' AND '.join(clauses)) if clauses else '', params
+
+    def _select(self, columns, limit, **filters):
+        where, params = self._where(**filters)
+        with self._read_lock:
+            rows = self._read_conn.execute(
+                f'SELECT {", ".join(columns)} FROM history{where} ORDER BY id DESC LIMIT ?',
+                params + [limit]).fetchall()
+        return [self._to_entry(columns, row) for row in rows]
+
+    @staticmethod
+    def _to_entry(columns, row):
+        entry = dict(zip(columns, row))
+        for key in ('fallback_used', 'cache_hit'):
+            entry[key] = bool(entry[key])
+        for key in ('inputs', 'metadata'):
+            if key in entry:
+                entry[key] = json.loads(entry[key]) if entry[key] else {}
+        return entry
+
+    def page(self, limit=20, cursor=None, **filters):
+        """``(entries, next_cursor)``: up to ``limit`` summaries older than ``cursor`` (an id), newest first."""
+        entries = self._select(SUMMARY_COLUMNS, limit + 1, before=cursor, **filters)
+        more = len(entries) > limit
+        entries = entries[:limit]
+        return entries, (entries[-1]['id'] if more and entries else None)
+
+    def get(self, entry_id):
+        with self._read_lock:
+            row = self._read_conn.execute(f'SELECT {", ".join(COLUMNS)} FROM history WHERE id = ?',
+                                          (entry_id,)).fetchone()
+        return self._to_entry(COLUMNS, row) if row else None
+
+    def iter_entries(self, batch_size=500, **filters):
+        """Every matching entry with all columns, newest first, read ``batch_size`` rows at a time."""
+        cursor = None
+        while True:
+            entries = self._select(COLUMNS, batch_size, before=cursor, **filters)
+            yield from entries
+            if len(entries) < batch_size:
+                return
+            cursor = entries[-1]['id']
+
+    def stats(self):
+        with self._read_lock:
+            rows = self._read_conn.execute('SELECT COUNT(*) FROM history').fetchone()[0]
+        return {'path': self.path, 'rows': rows, 'queued': self.queued, 'written': self.written,
+                'pending': self._queue.qsize(), 'dropped': self.dropped, 'failed': self.failed}
@@ -0,0 +1,213 @@
+"""Text helpers for model-generated job descriptions.
+
+The model is asked for plain text but regularly slips in markdown bold
+markers and headers. ``clean_markdown`` strips them from a finished
+response; ``MarkdownStreamCleaner`` applies the same cleanup to a token
+stream so cleaned text can be forwarded to the browser as it arrives.
+``parse_sections`` turns a finished description into the section model
+shared by /generate, the PDF export and the results panel.
+"""
+import re
+from functools import lru_cache
+
+HEADER_RE = re.compile(r'^#{1,6}\s+', re.MULTILINE)
+BLANK_LINES_RE = re.compile(r'\n\s*\n\s*\n+')
+# A line that may still turn into a markdown header once more text arrives
+PARTIAL_HEADER_RE = re.compile(r'#{1,6}[ \t]*')
+_HOLD_CHARS = frozenset('*_ \t\r\n')
+
+
+def clean_markdown(text):
+    """Remove markdown bold markers and headers and collapse blank lines."""
+    if not text:
+        return text
+    # Remove markdown bold markers (**text** or __text__)
+    text = text.replace('**', '').replace('__', '')
+    # Remove markdown headers (### or ##)
+    text = HEADER_RE.sub('', text)
+    # Clean up any extra whitespace
+    text = BLANK_LINES_RE.sub('\n\n', text)
+    return text.strip()
+
+
+class MarkdownStreamCleaner:
+    """Incremental version of ``clean_markdown``.
+
+    ``feed`` returns the part of the stream that can no longer be changed by
+    later chunks. Trailing ``*``/``_``/whitespace and a line that so far only
+    holds ``#`` characters are held back until the next chunk (or ``finish``)
+    shows whether they form a marker.
+    """
+
+    def __init__(self):
+        self._pending = ''
+        self._at_line_start = True
+        self._started = False
+
+    def feed(self, chunk):
+        if not chunk:
+            return ''
+        self._pending += chunk
+        cut = len(self._pending)
+        while cut and self._pending[cut - 1] in _HOLD_CHARS:
+            cut -= 1
+        if not cut:
+            return ''
+        # Hold a trailing partial line that could still become a header
+        line_start = self._pending.rfind('\n', 0, cut) + 1
+        if line_start or self._at_line_start:
+            partial = self._pending[line_start:cut].replace('**', '').replace('__', '')
+            if PARTIAL_HEADER_RE.fullmatch(partial):
+                cut = line_start
+        if not cut:
+            return ''
+        segment, self._pending = self._pending[:cut], self._pending[cut:]
+        return self._emit(segment)
+
+    def finish(self):
+        """Flush whatever is still held back at the end of the stream."""
+        segment, self._pending = self._pending, ''
+        return self._emit(segment).rstrip()
+
+    def _emit(self, segment):
+        segment = segment.replace('**', '').replace('__', '')
+        if self._at_line_start:
+            segment = HEADER_RE.sub('', segment)
+        else:
+            # The segment starts mid-line: only strip headers after its first newline
+            nl = segment.find('\n')
+            if nl != -1:
+                segment = segment[:nl + 1] + HEADER_RE.sub('', segment[nl + 1:])
+        segment = BLANK_LINES_RE.sub('\n\n', segment)
+        if not self._started:
+            segment = segment.lstrip()
+            if not segment:
+                return ''
+            self._started = True
+        self._at_line_start = segment.endswith('\n')
+        return segment
+
+
+# --- Section model -------------------------------------------------------
+#
+# A description is parsed once into the sections the results panel shows
+# (in this fixed order) and the blocks each one holds:
+#
+#     {'sections': [{'title': 'Key Responsibilities',
+#                    'blocks': [['bullet', 'Design ...'], ['blank', ''], ...]}, ...]}
+#
+# Block kinds are 'header' (a sub-heading inside a section, without its
+# colon), 'bullet' (without the '- '), 'paragraph' and 'blank'. /generate
+# returns this next to the text, and /download_pdf can take it instead of
+# the text.
+
+SECTION_ORDER = ('Job Overview', 'Key Responsibilities', 'Required Qualifications',
+                 'Preferred Qualifications', 'What We Offer', 'How to Apply')
+SECTION_ALIASES = {
+    'job overview': 'Job Overview', 'overview': 'Job Overview',
+    'key responsibilities': 'Key Responsibilities', 'responsibilities': 'Key Responsibilities',
+    'required qualifications': 'Required Qualifications', 'required': 'Required Qualifications',
+    'preferred qualifications': 'Preferred Qualifications', 'preferred': 'Preferred Qualifications',
+    'what we offer': 'What We Offer', 'what we offer.': 'What We Offer', 'what we offer:': 'What We Offer',
+    'how to apply': 'How to Apply', 'apply': 'How to Apply'
+}
+BLOCK_KINDS = frozenset(('header', 'bullet', 'paragraph', 'blank'))
+NUMBER_PREFIX_RE = re.compile(r'^\d+\.\s*')
+SECTION_HEADING_RE = re.compile(r'^([A-Za-z ][A-Za-z ]{2,}):$')
+LINE_SPLIT_RE = re.compile(r'\r?\n')
+
+
+def classify_line(line):
+    """``[kind, text]`` for one stripped line (the rules the PDF layout has always used)."""
+    if not line:
+        return ['blank', '']
+    if line.endswith(':') or (len(line) < 60 and line.upper() == line and ' ' in line):
+        return ['header', line.rstrip(':')]
+    if line.startswith('- '):
+        return ['bullet', line[2:].strip()]
+    return ['paragraph', line]
+
+
+def classify_lines(text):
+    """Blocks for plain text, without grouping into sections."""
+    return [classify_line(raw.strip()) for raw in (text or '').split('\n')]
+
+
+def section_title(line):
+    """The canonical section a heading line starts, or None."""
+    low = NUMBER_PREFIX_RE.sub('', line).replace('**', '').lower()
+    title = SECTION_ALIASES.get(low)
+    if title is None:
+        m = SECTION_HEADING_RE.match(line)
+        if m:
+            title = SECTION_ALIASES.get(m.group(1).lower())
+    return title
+
+
+def parse_sections(text):
+    """Parse a description into the section model (a fresh copy each call, safe to modify).
+
+    Text before the first recognised heading belongs to 'Job Overview';
+    unrecognised headings stay inside the current section as 'header' blocks.
+    """
+    return {'sections': [{'title': title, 'blocks': [list(block) for block in blocks]}
+                         for title, blocks in _parse_sections(text)]}
+
+
+@lru_cache(maxsize=512)
+def _parse_sections(text):
+    # Memoised as tuples so no caller can change what later calls get
+    grouped = {title: [] for title in SECTION_ORDER}
+    current = grouped['Job Overview']
+    for raw in LINE_SPLIT_RE.split(text or ''):
+        line = raw.strip()
+        if line:
+            title = section_title(line)
+            if title is not None:
+                current = grouped[title]
+                continue
+        current.append(tuple(classify_line(line)))
+    return tuple((title, tuple(grouped[title])) for title in SECTION_ORDER if grouped[title])
+
+
+def valid_sections(model):
+    """True if ``model`` looks like a section model (e.g. one posted back by the client)."""
+    if not isinstance(model, dict) or not isinstance(model.get('sections'), list):
+        return False
+    for section in model['sections']:
+        if not isinstance(section, dict) or not isinstance(section.get('title'), str):
+            return False
+        blocks = section.get('blocks')
+        if not isinstance(blocks, list):
+            return False
+        for block in blocks:
+            if (not isinstance(block, (list, tuple)) or len(block) != 2
+                    or block[0] not in BLOCK_KINDS or not isinstance(block[1], str)):
+                return False
+    return True
+
+
+def section_blocks(model):
+    """Flatten a section model into layout blocks: each title as a header, a blank between sections."""
+    out = []
+    for i, section in enumerate(model['sections']):
+        if i:
+            out.append(['blank', ''])
+        out.append(['header', section['title']])
+        out.extend(section['blocks'])
+    while out and out[-1][0] == 'blank':
+        out.pop()
+    return out
+
+
+def sections_to_text(model):
+    """Plain text for a section model (what the client used to rebuild before export)."""
+    lines = []
+    for kind, text in section_blocks(model):
+        if kind == 'header':
+            lines.append(text + ':')
+        elif kind == 'bullet':
+            lines.append('- ' + text)
+        else:
+            lines.append(text)
+    return '\n'.join(lines)
@@ -0,0 +1,291 @@
+"""Background job queue for long-running generations.
+
+``JobQueue.submit`` stores a job and returns straight away; a small pool of
+worker threads runs the handler and records the result. Jobs live in a
+``MemoryJobStore`` by default or a ``SQLiteJobStore`` when they should
+survive a restart: queued and interrupted jobs are re-queued when the
+queue starts (``resume`` at app start-up, or the first ``get``/``submit``),
+the ones beyond ``max_depth`` as workers free up room.
+Queue depth is bounded: ``submit`` raises ``QueueFull`` instead of letting
+the backlog grow without limit.
+"""
+import collections
+import json
+import os
+import queue
+import sqlite3
+import threading
+import time
+import uuid
+
+import log
+
+QUEUED = 'queued'
+RUNNING = 'running'
+DONE = 'done'
+FAILED = 'failed'
+FINISHED = (DONE, FAILED)
+
+
+class QueueFull(Exception):
+    """The queue already holds ``max_depth`` pending jobs."""
+
+
+class MemoryJobStore:
+
+    def __init__(self):
+        self._jobs = {}
+        self._lock = threading.Lock()
+
+    def save(self, job):
+        with self._lock:
+            self._jobs[job['id']] = dict(job)
+
+    def load(self, job_id):
+        with self._lock:
+            job = self._jobs.get(job_id)
+            return dict(job) if job else None
+
+    def prune(self, finished_before):
+        with self._lock:
+            stale = [k for k, j in self._jobs.items()
+                     if j['status'] in FINISHED and (j['finished'] or 0) < finished_before]
+            for k in stale:
+                del self._jobs[k]
+        return len(stale)
+
+    def unfinished(self):
+        return []
+
+
+class SQLiteJobStore:
+
+    _COLUMNS = ('id', 'status', 'payload', 'result', 'error', 'created', 'started', 'finished')
+
+    def __init__(self, path):
+        os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        self._conn = sqlite3.connect(path, check_same_thread=False, isolation_level=None)
+        self._conn.execute('PRAGMA journal_mode=WAL')
+        self._conn.execute(
+            'CREATE TABLE IF NOT EXISTS jobs (id TEXT PRIMARY KEY, status TEXT, payload TEXT, '
+            'result TEXT, error TEXT, created REAL, started REAL, finished REAL)')
+        self._conn.execute('CREATE INDEX IF NOT EXISTS jobs_status ON jobs (status, created)')
+        self._lock = threading.Lock()
+
+    def save(self, job):
+        row = (job['id'], job['status'], json.dumps(job['payload']),
+               json.dumps(job['result']) if job['result'] is not None else None,
+               job['error'], job['created'], job['started'], job['finished'])
+        with self._lock:
+            self._conn.execute(
+                'INSERT OR REPLACE INTO jobs (id, status, payload, result, error, created, started, finished) '
+                'VALUES (?, ?, ?, ?, ?, ?, ?, ?)', row)
+
+    def _to_job(self, row):
+        job = dict(zip(self._COLUMNS, row))
+        job['payload'] = json.loads(job['payload']) if job['payload'] else None
+        job['result'] = json.loads(job['result']) if job['result'] else None
+        return job
+
+    def load(self, job_id):
+        with self._lock:
+            row = self._conn.execute(
+                'SELECT id, status, payload, result, error, created, started, finished FROM jobs WHERE id = ?',
+                (job_id,)).fetchone()
+        return self._to_job(row) if row else None
+
+    def prune(self, finished_before):
+        with self._lock:
+            cur = self._conn.execute('DELETE FROM jobs WHERE status IN (?, ?) AND finished < ?',
+                                     (DONE, FAILED, finished_before))
+        return cur.rowcount
+
+    def unfinished(self):
+        with self._lock:
+            rows = self._conn.execute(
+                'SELECT id, status, payload, result, error, created, started, finished FROM jobs '
+                'WHERE status IN (?, ?) ORDER BY created', (QUEUED, RUNNING)).fetchall()
+        return [self._to_job(r) for r in rows]
+
+
+class JobQueue:
+
+    def __init__(self, handler, workers=4, max_depth=100, result_ttl=3600, store=None, on_finish=None):
+        self.handler = handler
+        self.workers = workers
+        self.max_depth = max_depth
+        self.result_ttl = result_ttl
+        self.store = store or MemoryJobStore()
+        self.on_finish = on_finish
+        self._queue = queue.Queue(maxsize=max_depth)
+        self._cond = threading.Condition()
+        self._threads = []
+        self._start_lock = threading.Lock()
+        self._backlog = collections.deque()
+        self._backlog_lock = threading.Lock()
+        self._stats_lock = threading.Lock()
+        self.submitted = 0
+        self.rejected = 0
+        self.completed = 0
+        self.failed = 0
+        self.total_wait = 0.0
+        self.total_exec = 0.0
+        self.max_wait = 0.0
+        self.max_exec = 0.0
+        self._last_prune = time.time()
+
+    def _ensure_started(self):
+        # Workers start on first use so importing the app never spawns threads
+        if self._threads:
+            return
+        with self._start_lock:
+            if self._threads:
+                return
+            for job in self.store.unfinished():
+                job['status'] = QUEUED
+                self.store.save(job)
+                self._backlog.append(job['id'])
+            self._refill()
+            for n in range(self.workers):
+                t = threading.Thread(target=self._work, name=f'job-worker-{n}', daemon=True)
+                t.start()
+                self._threads.append(t)
+
+    def resume(self):
+        """Start the workers now if the store holds unfinished jobs (e.g. after a restart); True if it did."""
+        if not self._threads and self.store.unfinished():
+            self._ensure_started()
+            return True
+        return False
+
+    def _refill(self):
+        # Jobs re-queued on start-up beyond max_depth wait here until workers free up room
+        with self._backlog_lock:
+            while self._backlog:
+                try:
+                    self._queue.put_nowait(self._backlog[0])
+                except queue.Full:
+                    return
+                self._backlog.popleft()
+
+    def submit(self, payload):
+        self._ensure_started()
+        job = {'id': uuid.uuid4().hex, 'status': QUEUED, 'payload': payload, 'result': None,
+               'error': None, 'created': time.time(), 'started': None, 'finished': None}
+        self.store.save(job)
+        try:
+            self._queue.put_nowait(job['id'])
+        except queue.Full:
+            job['status'] = FAILED
+            job['error'] = 'Queue full'
+            job['finished'] = time.time()
+            self.store.save(job)
+            with self._stats_lock:
+                self.rejected += 1
+            raise QueueFull(f'Job queue is full ({self.max_depth} pending)')
+        with self._stats_lock:
+            self.submitted += 1
+        return job
+
+    def get(self, job_id, wait=0):
+        """Return the job, optionally long-polling up to ``wait`` seconds for it to finish."""
+        # A job re-queued on start-up must not wait for the next submit to get workers
+        self._ensure_started()
+        job = self.store.load(job_id)
+        if job is None or job['status'] in FINISHED or wait <= 0:
+            return job
+        deadline = time.monotonic() + wait
+        with self._cond:
+            while True:
+                job = self.store.load(job_id)
+                remaining = deadline - time.monotonic()
+                if job is None or job['status'] in FINISHED or remaining <= 0:
+                    return job
+                self._cond.wait(remaining)
+
+    def _work(self):
+        while True:
+            job_id = self._queue.get()
+            try:
+                self._run(job_id)
+            except Exception as e:
+                log.event('jobs.worker_error', level='error', job_id=job_id, error=str(e))
+            finally:
+                self._queue.task_done()
+                if self._backlog:
+                    self._refill()
+
+    def _run(self, job_id):
+        job = self.store.load(job_id)
+        if job is None or job['status'] != QUEUED:
+            return
+        job['status'] = RUNNING
+        job['started'] = time.time()
+        self.store.save(job)
+        try:
+            job['result'] = self.handler(job['payload'])
+            job['status'] = DONE
+        except Exception as e:
+            job['error'] = str(e)
+            job['status'] = FAILED
+        job['finished'] = time.time()
+        self.store.save(job)
+
+        waited = job['started'] - job['created']
+        ran = job['finished'] - job['started']
+        with self._stats_lock:
+            if job['status'] == DONE:
+                self.completed += 1
+            else:
+                self.failed += 1
+            self.total_wait += waited
+            self.total_exec += ran
+            self.max_wait = max(self.max_wait, waited)
+            self.max_exec = max(self.max_exec, ran)
+        with self._cond:
+            self._cond.notify_all()
+        if self.on_finish is not None:
+            try:
+                self.on_finish(job)
+            except Exception as e:
+                log.event('jobs.on_finish_failed', level='error', job_id=job_id, error=str(e))
+        self._maybe_prune()
+
+    def _maybe_prune(self):
+        now = time.time()
+        if now - self._last_prune < 60:
+            return
+        self._last_prune = now
+        self.store.prune(now - self.result_ttl)
+
+    def stats(self):
+        with self._stats_lock:
+            finished = self.completed + self.failed
+            return {
+                'workers': self.workers,
+                'started': bool(self._threads),
+                'depth': self._queue.qsize() + len(self._backlog),
+                'max_depth': self.max_depth,
+                'submitted': self.submitted,
+                'rejected': self.rejected,
+                'completed': self.completed,
+                'failed': self.failed,
+                'avg_queue_wait_ms': round(self.total_wait / finished * 1000, 1) if finished else 0.0,
+                'avg_exec_ms': round(self.total_exec / finished * 1000, 1) if finished else 0.0,
+                'max_queue_wait_ms': round(self.max_wait * 1000, 1),
+                'max_exec_ms': round(self.max_exec * 1000, 1),
+            }
+
+
+def job_view(job):
+    """Public JSON shape of a job (the stored payload is not echoed back)."""
+    view = {'jobId': job['id'], 'status': job['status']}
+    if job['started']:
+        view['queueWaitMs'] = int((job['started'] - job['created']) * 1000)
+    if job['finished'] and job['started']:
+        view['execMs'] = int((job['finished'] - job['started']) * 1000)
+    if job['status'] == DONE:
+        view['result'] = job['result']
+    if job['error']:
+        view['error'] = job['error']
+    return view
@@ -0,0 +1,134 @@
+"""Precompiled template engine for the local (no-API) job description.
+
+The posting layout is parsed once at import into static text fragments and
+named slots. Rendering a record only computes the handful of slot values and
+does a single ``''.join``; ``render_many`` and ``render_columns`` render
+whole batches without per-call setup.
+"""
+from functools import lru_cache
+from string import Formatter
+
+EXPERIENCE_LABELS = {
+    'entry': 'Entry Level (0-2 years)',
+    'mid': 'Mid Level (3-5 years)',
+    'senior': 'Senior Level (5-8 years)',
+    'lead': 'Lead/Principal (8+ years)'
+}
+
+
+def experience_label(level):
+    """Convert experience level to readable format"""
+    label = EXPERIENCE_LABELS.get(level)
+    return label if label is not None else level.title()
+
+
+class CompiledTemplate:
+    """A ``str.format``-style template split once into fragments and slots."""
+
+    def __init__(self, source):
+        parts = []
+        slots = []
+        for literal, field, _, _ in Formatter().parse(source):
+            if literal:
+                parts.append(literal)
+            if field is not None:
+                slots.append((len(parts), field))
+                parts.append(None)
+        self._parts = parts
+        self._slots = tuple(slots)
+        self.fields = tuple(dict.fromkeys(name for _, name in slots))
+
+    def render(self, values):
+        buf = self._parts.copy()
+        for i, name in self._slots:
+            buf[i] = values[name]
+        return ''.join(buf)
+
+
+JOB_DESCRIPTION = CompiledTemplate(
+    "Job Overview:\n{title} at {company} — {city}, {state}\n\n"
+    "{title} at {company} is a {job_type} role targeted at {exp}. The successful candidate will work on "
+    "building reliable, user-focused applications and collaborate across teams to deliver high-quality software.\n"
+    "\nKey Responsibilities:\n"
+    "- Design, develop and maintain {title} features using {skills_or_default}.\n"
+    "- Collaborate with cross-functional teams to define, design, and ship new features.\n"
+    "- Write clean, maintainable code and unit tests; participate in code reviews.\n"
+    "- Troubleshoot, debug and optimize application performance and user experience.\n"
+    "- Help document technical designs and contribute to team knowledge sharing.\n"
+    "\nRequired Qualifications:\n"
+    "- Bachelor's degree in {degree} or equivalent experience.\n"
+    "- {exp} experience level.\n"
+    "- {skills_qualification}\n"
+    "\nPreferred Qualifications:\n"
+    "- Familiarity with version control (Git) and CI/CD pipelines.\n"
+    "- Experience working in Agile teams.\n"
+    "- Strong problem-solving and communication skills."
+    "{additional}\n"
+    "\nWhat We Offer:\n"
+    "- {salary_line}\n"
+    "- Opportunities for growth and professional development.\n"
+    "- Supportive team environment and flexible working arrangements where applicable.\n"
+    "\nHow to Apply:\n"
+    "{apply_line}"
+)
+
+
+@lru_cache(maxsize=4096)
+def _skills(skills):
+    """(responsibility phrase, qualification line) for a raw comma-separated skills string."""
+    skills_list = [s.strip() for s in skills.split(',') if s.strip()]
+    if not skills_list:
+        return 'relevant technologies', 'Relevant technical skills.'
+    joined = ', '.join(skills_list)
+    return joined, f"Proven experience with {joined}."
+
+
+def slot_values(data):
+    """Compute the template slots for one submitted form."""
+    get = data.get
+    title = (get('jobTitle') or 'Unknown Position').strip()
+    skills_phrase, skills_qualification = _skills((get('skillsKnown') or '').strip())
+    salary = (get('salary') or '').strip()
+    email = (get('companyEmail') or '').strip()
+    add = (get('additionalDetails') or '').strip()
+    if email:
+        apply_line = f"Please send your resume and a brief cover letter to {email} with the subject '{title} Application'."
+    else:
+        apply_line = "Please apply through the company's careers page or contact the hiring team for application instructions."
+    return {
+        'title': title,
+        'company': (get('companyName') or '').strip(),
+        'city': (get('city') or '').strip(),
+        'state': (get('state') or '').strip(),
+        'job_type': (get('jobType') or '').strip(),
+        'exp': experience_label(get('experienceLevel', '')),
+        'degree': (get('degree') or 'Relevant degree').strip(),
+        'skills_or_default': skills_phrase,
+        'skills_qualification': skills_qualification,
+        'salary_line': f"Salary: {salary}" if salary else "Competitive salary.",
+        'additional': f"\n\nAdditional Details:\n{add}" if add else '',
+        'apply_line': apply_line,
+    }
+
+
+def render(data):
+    """Render one job description from a form dict."""
+    return JOB_DESCRIPTION.render(slot_values(data))
+
+
+def render_many(records):
+    """Render a list (or any iterable) of form dicts."""
+    tpl = JOB_DESCRIPTION.render
+    return [tpl(slot_values(r)) for r in records]
+
+
+def render_columns(columns):
+    """Render from column arrays, e.g. ``{'jobTitle': [...], 'companyName': [...], ...}``.
+
+    All columns must have the same length; missing columns are treated as empty.
+    """
+    names = list(columns)
+    if not names:
+        return []
+    rows = zip(*(columns[n] for n in names))
+    return render_many(dict(zip(names, row)) for row in rows)
@@ -0,0 +1,74 @@
+"""Structured, sampled event log for the request hot path.
+
+``event('upstream.http_error', level='warning', status=502)`` writes one
+JSON line. Request threads only put the record on a bounded queue; a
+listener thread does the stdout write, so a slow log sink never stalls a
+request (when the queue is full records are dropped and counted).
+
+Info events are sampled at LOG_SAMPLE_RATE (default 0.1); warnings and
+errors are always kept. Counts of what happened belong in metrics.py; this
+log is for the details of individual requests.
+"""
+import atexit
+import json
+import logging
+import logging.handlers
+import os
+import queue
+import random
+import sys
+import time
+
+LEVELS = {'debug': logging.DEBUG, 'info': logging.INFO, 'warning': logging.WARNING, 'error': logging.ERROR}
+
+try:
+    SAMPLE_RATE = float(os.getenv('LOG_SAMPLE_RATE', '0.1'))
+except ValueError:
+    SAMPLE_RATE = 0.1
+QUEUE_SIZE = 10000
+
+_stats = {'written': 0, 'sampled_out': 0, 'dropped': 0}
+
+
+class _DroppingQueueHandler(logging.handlers.QueueHandler):
+
+    def prepare(self, record):
+        # The message is already a finished JSON string; skip QueueHandler's copying
+        return record
+
+    def enqueue(self, record):
+        try:
+            self.queue.put_nowait(record)
+            _stats['written'] += 1
+        except queue.Full:
+            _stats['dropped'] += 1
+
+
+_queue = queue.Queue(QUEUE_SIZE)
+_stream_handler = logging.StreamHandler(sys.stdout)
+_stream_handler.setFormatter(logging.Formatter('%(message)s'))
+_listener = logging.handlers.QueueListener(_queue, _stream_handler)
+_listener.start()
+atexit.register(_listener.stop)
+
+logger = logging.getLogger('jd.events')
+logger.setLevel(logging.DEBUG)
+logger.propagate = False
+logger.addHandler(_DroppingQueueHandler(_queue))
+
+
+def event(name, level='info', sample=None, **fields):
+    """Log one structured event; info/debug are kept with probability ``sample`` (default SAMPLE_RATE)."""
+    lvl = LEVELS.get(level, logging.INFO)
+    if lvl < logging.WARNING:
+        rate = SAMPLE_RATE if sample is None else sample
+        if rate < 1 and random.random() >= rate:
+            _stats['sampled_out'] += 1
+            return
+    record = {'ts': round(time.time(), 3), 'level': level, 'event': name}
+    record.update(fields)
+    logger.log(lvl, json.dumps(record, default=str))
+
+
+def stats():
+    return dict(_stats, sample_rate=SAMPLE_RATE, queued=_queue.qsize())
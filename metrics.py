@@ -0,0 +1,179 @@
+"""In-process counters and histograms, exposed in Prometheus text format.
+
+Kept dependency-free and cheap enough for the hot path: an observation is a
+dict lookup, a bisect and two additions under a per-metric lock. ``/metrics``
+renders ``registry``.
+
+Stage metrics carry a ``route`` label taken from ``current_route``, a
+context variable app.py sets per request; work on background threads (job
+queue, probes) reports as ``background``.
+"""
+import threading
+import time
+from bisect import bisect_left
+from contextlib import contextmanager
+from contextvars import ContextVar
+
+DEFAULT_BUCKETS = (0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60)
+
+current_route = ContextVar('current_route', default='background')
+
+
+def _escape(value):
+    return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+def _labels(names, values, extra=''):
+    parts = [f'{n}="{_escape(v)}"' for n, v in zip(names, values)]
+    if extra:
+        parts.append(extra)
+    return '{' + ','.join(parts) + '}' if parts else ''
+
+
+class Counter:
+
+    def __init__(self, name, help, labelnames=()):
+        self.name = name
+        self.help = help
+        self.labelnames = tuple(labelnames)
+        self._values = {}
+        self._lock = threading.Lock()
+
+    def inc(self, amount=1, **labels):
+        key = tuple(labels.get(n, '') for n in self.labelnames)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def value(self, **labels):
+        return self._values.get(tuple(labels.get(n, '') for n in self.labelnames), 0)
+
+    def render(self):
+        lines = [f'# HELP {self.name} {self.help}', f'# TYPE {self.name} counter']
+        with self._lock:
+            items = sorted(self._values.items())
+        for key, v in items:
+            lines.append(f'{self.name}{_labels(self.labelnames, key)} {v}')
+        return lines
+
+
+class Histogram:
+
+    def __init__(self, name, help, labelnames=(), buckets=DEFAULT_BUCKETS):
+        self.name = name
+        self.help = help
+        self.labelnames = tuple(labelnames)
+        self.buckets = tuple(sorted(buckets))
+        self._series = {}  # label values -> [per-bucket counts..., +Inf count, sum]
+        self._lock = threading.Lock()
+
+    def observe(self, value, **labels):
+        key = tuple(labels.get(n, '') for n in self.labelnames)
+        i = bisect_left(self.buckets, value)
+        with self._lock:
+            series = self._series.get(key)
+            if series is None:
+                series = self._series[key] = [0] * (len(self.buckets) + 2)
+            series[i] += 1
+            series[-1] += value
+
+    def count(self, **labels):
+        series = self._series.get(tuple(labels.get(n, '') for n in self.labelnames))
+        return sum(series[:-1]) if series else 0
+
+    def render(self):
+        lines = [f'# HELP {self.name} {self.help}', f'# TYPE {self.name} histogram']
+        with self._lock:
+            items = sorted((k, list(v)) for k, v in self._series.items())
+        for key, series in items:
+            cumulative = 0
+            for bound, n in zip(self.buckets, series):
+                cumulative += n
+                le = 'le="%s"' % bound
+                lines.append(f'{self.name}_bucket{_labels(self.labelnames, key, le)} {cumulative}')
+            cumulative += series[len(self.buckets)]
+            le = 'le="+Inf"'
+            lines.append(f'{self.name}_bucket{_labels(self.labelnames, key, le)} {cumulative}')
+            lines.append(f'{self.name}_sum{_labels(self.labelnames, key)} {series[-1]}')
+            lines.append(f'{self.name}_count{_labels(self.labelnames, key)} {cumulative}')
+        return lines
+
+
+class Snapshot:
+    """Series read from ``collect()`` at scrape time, for counts another object already keeps.
+
+    ``collect`` returns ``{label values tuple: value}``; ``kind`` is the
+    Prometheus type to report (a monotonic count is a ``counter``).
+    """
+
+    def __init__(self, name, help, labelnames=(), collect=None, kind='gauge'):
+        self.name = name
+        self.help = help
+        self.labelnames = tuple(labelnames)
+        self.collect = collect
+        self.kind = kind
+
+    def render(self):
+        lines = [f'# HELP {self.name} {self.help}', f'# TYPE {self.name} {self.kind}']
+        for key, v in sorted(self.collect().items()):
+            lines.append(f'{self.name}{_labels(self.labelnames, key)} {v}')
+        return lines
+
+
+class Registry:
+
+    def __init__(self):
+        self._metrics = {}
+        self._lock = threading.Lock()
+
+    def _add(self, metric):
+        with self._lock:
+            existing = self._metrics.get(metric.name)
+            if existing is not None:
+                return existing
+            self._metrics[metric.name] = metric
+            return metric
+
+    def counter(self, name, help, labelnames=()):
+        return self._add(Counter(name, help, labelnames))
+
+    def histogram(self, name, help, labelnames=(), buckets=DEFAULT_BUCKETS):
+        return self._add(Histogram(name, help, labelnames, buckets))
+
+    def snapshot(self, name, help, labelnames, collect, kind='gauge'):
+        return self._add(Snapshot(name, help, labelnames, collect, kind))
+
+    def render(self):
+        lines = []
+        for name in sorted(self._metrics):
+            lines.extend(self._metrics[name].render())
+        return '\n'.join(lines) + '\n'
+
+
+registry = Registry()
+
+# Shared by every module that reports a stage of the generate or export path
+STAGE_SECONDS = registry.histogram('jd_stage_duration_seconds',
+                                   'Time spent in one stage of a request', ('route', 'stage', 'outcome'))
+
+
+@contextmanager
+def stage(name, outcome='ok'):
+    """Time a block into STAGE_SECONDS; the yielded dict's 'outcome' can be changed inside.
+
+    An exception escaping the block is recorded as outcome 'error'.
+    """
+    labels = {'outcome': outcome}
+    t = time.perf_counter()
+    try:
+        yield labels
+    except BaseException:
+        labels['outcome'] = 'error'
+        raise
+    finally:
+        STAGE_SECONDS.observe(time.perf_counter() - t, route=current_route.get(), stage=name,
+                              outcome=labels['outcome'])
+
+
+def observe_stage(name, seconds, outcome='ok'):
+    """Record a stage measured elsewhere (e.g. a response's TTFB)."""
+    STAGE_SECONDS.observe(seconds, route=current_route.get(), stage=name, outcome=outcome)
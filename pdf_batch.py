@@ -0,0 +1,277 @@
+"""Bulk PDF export (used by /download_pdf/batch).
+
+Postings are rendered with ``pdf_render.render_job_pdf`` in a process pool
+and written out as they complete (in input order), either as ZIP entries or
+as pages appended to one merged PDF. Only a bounded window of rendered
+documents is held in memory at a time; the output itself is produced
+incrementally as byte chunks.
+
+Where a process pool cannot be created (e.g. serverless runtimes without
+``/dev/shm``) rendering falls back to the calling thread.
+
+Workers only need this module and pdf_render. A spawned worker would
+normally also re-run the parent's main script (all of app.py under
+``python app.py``), so the pool points them at this module instead.
+"""
+import atexit
+import importlib.util
+import multiprocessing
+import re
+import sys
+import threading
+import zipfile
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+
+import log
+from pdf_render import render_job_pdf, pdf_filename
+
+
+def render_item(item):
+    """Worker entry point: ``(filename, pdf bytes, error)`` for one posting."""
+    jobDetails = item.get('jobDetails') or {}
+    try:
+        pdf = render_job_pdf(jobDetails, item.get('jobDescription') or '', sections=item.get('sections'))
+    except Exception as e:
+        return pdf_filename(jobDetails.get('title') or 'Job Description'), None, str(e)
+    return pdf_filename(jobDetails.get('title') or 'Job Description'), pdf, None
+
+
+_pool = None
+_pool_lock = threading.Lock()
+_pool_error = None
+
+
+def worker_main():
+    """Make spawned workers import this module as their ``__main__``, not the parent's script.
+
+    spawn and forkserver children re-run a script ``__main__`` (one without
+    ``__spec__``) as ``__mp_main__``; with a spec they import that module by
+    name instead. Mains started with ``-m`` already have one and are left alone.
+    """
+    main = sys.modules.get('__main__')
+    if main is not None and getattr(main, '__spec__', None) is None and getattr(main, '__file__', None):
+        main.__spec__ = importlib.util.find_spec(__name__)
+
+
+def get_pool(workers, start_method='spawn'):
+    """Shared process pool, created on first use. Returns None if unavailable."""
+    global _pool, _pool_error
+    if workers <= 1:
+        return None
+    with _pool_lock:
+        if _pool is None and _pool_error is None:
+            try:
+                if start_method != 'fork':
+                    worker_main()
+                _pool = ProcessPoolExecutor(max_workers=workers,
+                                            mp_context=multiprocessing.get_context(start_method))
+                atexit.register(_pool.shutdown, wait=False, cancel_futures=True)
+            except Exception as e:
+                _pool_error = str(e)
+                log.event('pdf_batch.pool_unavailable', level='warning', error=str(e))
+        return _pool
+
+
+def pool_stats():
+    return {'running': _pool is not None, 'error': _pool_error}
+
+
+def _discard_pool(pool, error):
+    global _pool, _pool_error
+    with _pool_lock:
+        if _pool is pool:
+            _pool = None
+            _pool_error = error
+    pool.shutdown(wait=False, cancel_futures=True)
+
+
+def render_all(items, pool=None, window=8):
+    """Yield ``render_item`` results in input order, keeping at most ``window`` in flight.
+
+    If the pool breaks (a worker died), the rest is rendered inline.
+    """
+    pending = deque()
+
+    def result(item, fut):
+        nonlocal pool
+        try:
+            return fut.result()
+        except BrokenProcessPool as e:
+            if pool is not None:
+                log.event('pdf_batch.pool_broken', level='warning', error=str(e))
+                _discard_pool(pool, str(e))
+                pool = None
+            return render_item(item)
+
+    try:
+        for item in items:
+            if pool is None:
+                while pending:
+                    yield result(*pending.popleft())
+                yield render_item(item)
+                continue
+            pending.append((item, pool.submit(render_item, item)))
+            if len(pending) >= window:
+                yield result(*pending.popleft())
+        while pending:
+            yield result(*pending.popleft())
+    finally:
+        # Client went away: drop anything not started yet
+        for _, fut in pending:
+            fut.cancel()
+
+
+class _ChunkSink:
+    """Write-only, non-seekable file object that hands back what was written."""
+
+    def __init__(self):
+        self._chunks = []
+
+    def write(self, b):
+        self._chunks.append(bytes(b))
+        return len(b)
+
+    def flush(self):
+        pass
+
+    def drain(self):
+        out = b''.join(self._chunks)
+        self._chunks.clear()
+        return out
+
+
+def unique_name(name, seen):
+    """``name`` or ``name`` with a ``_2``/``_3``... suffix before the extension."""
+    n = seen.get(name, 0) + 1
+    seen[name] = n
+    if n == 1:
+        return name
+    stem, dot, ext = name.rpartition('.')
+    return f'{stem}_{n}.{ext}' if dot else f'{name}_{n}'
+
+
+def zip_stream(results):
+    """Stream a ZIP archive (one PDF per posting) from ``render_all`` results.
+
+    Entries are written with data descriptors, so nothing is seeked back
+    into. Failed postings are listed in ``ERRORS.txt`` at the end.
+    """
+    sink = _ChunkSink()
+    seen = {}
+    errors = []
+    with zipfile.ZipFile(sink, 'w', compression=zipfile.ZIP_DEFLATED) as zf:
+        for index, (filename, pdf, error) in enumerate(results):
+            if error:
+                log.event('pdf_batch.item_failed', level='warning', index=index, filename=filename, error=error)
+                errors.append(f'{index}\t{filename}\t{error}')
+                continue
+            zf.writestr(unique_name(filename, seen), pdf, compresslevel=1)
+            yield sink.drain()
+        if errors:
+            zf.writestr('ERRORS.txt', '\n'.join(errors) + '\n')
+    yield sink.drain()
+
+
+_XREF_ENTRY = re.compile(rb'(\d{10}) (\d{5}) ([nf])')
+_REF = re.compile(rb'(\d+) 0 R\b')
+_TYPE = re.compile(rb'/Type /(\w+)')
+_KIDS = re.compile(rb'/Kids \[([^\]]*)\]')
+_PARENT = re.compile(rb'/Parent \d+ 0 R')
+_TRAILER_REF = re.compile(rb'/(Root|Info) (\d+) 0 R')
+
+
+class PdfConcatenator:
+    """Append whole PDFs produced by ``render_job_pdf`` into one document.
+
+    Each source's objects are renumbered and written straight through; only
+    their byte offsets and the page ids are kept, so memory does not grow
+    with the size of the merged file. Sources must use a single classic
+    xref table and a flat page tree, which is what reportlab writes.
+    """
+
+    def __init__(self):
+        self._pos = 0
+        self._offsets = {}
+        self._pages = []
+        self._next = 3  # 1 = page tree root, 2 = catalog (written last)
+
+    def _emit(self, data):
+        self._pos += len(data)
+        return data
+
+    def start(self):
+        return self._emit(b'%PDF-1.4\n%\xe2\xe3\xcf\xd3\n')
+
+    def add(self, pdf):
+        """Return the bytes that append ``pdf``'s pages to the output."""
+        xref_at = int(pdf[pdf.rindex(b'startxref') + 9:].split()[0])
+        head, _, trailer = pdf[xref_at:].partition(b'trailer')
+        lines = head.split(b'\n')
+        first, count = (int(x) for x in lines[1].split())
+        offsets = []
+        for num, m in enumerate(_XREF_ENTRY.finditer(head), first):
+            if m.group(3) == b'n':
+                offsets.append((int(m.group(1)), num))
+        offsets.sort()
+        skip = {int(num) for name, num in _TRAILER_REF.findall(trailer)}
+        base = self._next - 1
+        self._next += first + count - 1
+
+        def renumber(m):
+            return b'%d 0 R' % (int(m.group(1)) + base)
+
+        out = []
+        kids = []
+        for i, (start, num) in enumerate(offsets):
+            end = offsets[i + 1][0] if i + 1 < len(offsets) else xref_at
+            obj = pdf[start:end]
+            body_at = obj.index(b'obj') + 3
+            dict_part, sep, stream_part = obj[body_at:].partition(b'stream')
+            kind = _TYPE.search(dict_part)
+            kind = kind.group(1) if kind else b''
+            if kind == b'Pages':
+                kids = [int(k) + base for k in _REF.findall(_KIDS.search(dict_part).group(1))]
+                continue
+            if num in skip or kind == b'Catalog':
+                continue
+            dict_part = _REF.sub(renumber, dict_part)
+            if kind == b'Page':
+                dict_part = _PARENT.sub(b'/Parent 1 0 R', dict_part)
+            self._offsets[num + base] = self._pos + sum(len(b) for b in out)
+            out.append(b'%d 0 obj' % (num + base) + dict_part + sep + stream_part)
+        self._pages.extend(kids)
+        return self._emit(b''.join(out))
+
+    def finish(self):
+        """Page tree, catalog, xref table and trailer."""
+        out = []
+        pos = self._pos
+        kids = b' '.join(b'%d 0 R' % n for n in self._pages)
+        for num, body in ((1, b'<< /Type /Pages /Count %d /Kids [ %s ] >>' % (len(self._pages), kids)),
+                          (2, b'<< /Type /Catalog /Pages 1 0 R >>')):
+            self._offsets[num] = pos
+            obj = b'%d 0 obj\n%s\nendobj\n' % (num, body)
+            out.append(obj)
+            pos += len(obj)
+        size = self._next
+        xref = [b'xref\n0 %d\n' % size, b'0000000000 65535 f \n']
+        for num in range(1, size):
+            at = self._offsets.get(num)
+            xref.append(b'%010d 00000 n \n' % at if at is not None else b'0000000000 65535 f \n')
+        out.append(b''.join(xref))
+        out.append(b'trailer\n<< /Size %d /Root 2 0 R >>\nstartxref\n%d\n%%%%EOF\n' % (size, pos))
+        return self._emit(b''.join(out))
+
+
+def merged_pdf_stream(results):
+    """Stream one PDF containing every posting's pages, in input order."""
+    merger = PdfConcatenator()
+    yield merger.start()
+    for index, (filename, pdf, error) in enumerate(results):
+        if error:
+            log.event('pdf_batch.item_failed', level='warning', index=index, filename=filename, error=error)
+            continue
+        yield merger.add(pdf)
+    yield merger.finish()
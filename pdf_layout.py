@@ -0,0 +1,175 @@
+"""Layout stage for the PDF body.
+
+1. ``FontMetrics`` measures each word once per (font, size) and wraps lines
+   exactly like reportlab's ``simpleSplit`` (greedy, space-separated).
+2. ``layout_blocks`` turns classified blocks (see ``jd_text``) into
+   positioned runs, computing line and page breaks in a single pass;
+   ``layout_body`` does the same for plain text. The result is plain data (pages of
+   tuples), so it can be cached or reused, e.g. to draw preview thumbnails.
+3. ``emit_page`` draws one laid-out page with a single text object.
+"""
+import threading
+
+from reportlab.pdfbase.pdfmetrics import stringWidth
+
+from jd_text import classify_lines
+
+HEADER_COLOR = (0.55, 0.08, 0.08)
+BODY_COLOR = (0.2, 0.2, 0.2)
+
+
+class FontMetrics:
+    """Memoised ``stringWidth`` per (font, size)."""
+
+    def __init__(self, max_words=50000):
+        self.max_words = max_words
+        self._widths = {}
+        self._lock = threading.Lock()
+
+    def _table(self, font, size):
+        table = self._widths.get((font, size))
+        if table is None:
+            with self._lock:
+                table = self._widths.setdefault((font, size), {})
+        return table
+
+    def width(self, text, font, size):
+        table = self._table(font, size)
+        w = table.get(text)
+        if w is None:
+            if len(table) >= self.max_words:
+                table.clear()
+            w = table[text] = stringWidth(text, font, size)
+        return w
+
+    def split(self, text, font, size, max_width):
+        """Same result as ``reportlab.lib.utils.simpleSplit``, with cached word widths."""
+        table = self._table(font, size)
+        if len(table) >= self.max_words:
+            table.clear()
+        ws = table.get(' ')
+        if ws is None:
+            ws = table[' '] = stringWidth(' ', font, size)
+        lines = []
+        for txt in text.split('\n'):
+            out = []
+            w = -ws
+            for t in txt.split():
+                lt = table.get(t)
+                if lt is None:
+                    lt = table[t] = stringWidth(t, font, size)
+                if w + ws + lt <= max_width or not out:
+                    out.append(t)
+                    w = w + ws + lt
+                else:
+                    lines.append(' '.join(out))
+                    out = [t]
+                    w = lt
+            if out:
+                lines.append(' '.join(out))
+        return lines
+
+    def stats(self):
+        return {f'{font}@{size}': len(t) for (font, size), t in self._widths.items()}
+
+
+metrics = FontMetrics()
+
+
+def layout_body(jobDescription, width, margin, body_top):
+    """Lay out plain description text (lines classified by ``jd_text.classify_line``)."""
+    return layout_blocks(classify_lines(jobDescription), width, margin, body_top)
+
+
+def layout_blocks(blocks, width, margin, body_top):
+    """Lay out ``[kind, text]`` blocks into pages of positioned runs.
+
+    Returns a list of pages; each page is ``{'dots': [(x, y), ...],
+    'runs': [(x, y, text, font, size, charspace, color), ...]}``.
+    """
+    max_width = width - margin * 2
+    base_font = 'Helvetica'
+    bold_font = 'Helvetica-Bold'
+    base_size = 11
+    leading = 15
+    header_size = 14
+    header_leading = 18
+    bottom = margin + 20
+    split = metrics.split
+
+    pages = []
+    dots = []
+    runs = []
+
+    def new_page():
+        nonlocal dots, runs
+        dots = []
+        runs = []
+        pages.append({'dots': dots, 'runs': runs})
+        return body_top
+
+    y = new_page()
+    for kind, text in blocks:
+        if kind == 'blank':
+            y -= int(leading * 0.4)
+            continue
+
+        # Section header
+        if kind == 'header':
+            if y < bottom:
+                y = new_page()
+            for wline in split(text, bold_font, header_size, max_width):
+                runs.append((margin, y, wline, bold_font, header_size, 0.2, HEADER_COLOR))
+                y -= header_leading
+            y -= 4
+            continue
+
+        # Bullet lines
+        if kind == 'bullet':
+            wrap = split(text, base_font, base_size, max_width - 36)
+            if y < bottom:
+                y = new_page()
+            text_x = margin + 20
+            dots.append((margin + 6, y + 4))
+            for i, wline in enumerate(wrap):
+                if i:
+                    y -= int(base_size * 1.1)
+                    if y < bottom:
+                        y = new_page()
+                runs.append((text_x, y, wline, base_font, base_size, 0.15, BODY_COLOR))
+            y -= int(base_size * 1.35)
+            continue
+
+        # Normal paragraph
+        for wline in split(text, base_font, base_size, max_width):
+            if y < bottom:
+                y = new_page()
+            runs.append((margin, y, wline, base_font, base_size, 0.1, BODY_COLOR))
+            y -= leading
+
+    return pages
+
+
+def emit_page(c, page):
+    """Draw a laid-out page: bullet dots, then every run in one text object."""
+    if page['dots']:
+        c.setFillColorRGB(*BODY_COLOR)
+        for x, y in page['dots']:
+            c.circle(x, y, 2.5, stroke=0, fill=1)
+    if not page['runs']:
+        return
+    t = c.beginText()
+    font = charspace = color = None
+    for x, y, text, run_font, size, run_charspace, run_color in page['runs']:
+        if (run_font, size) != font:
+            t.setFont(run_font, size)
+            font = (run_font, size)
+        if run_charspace != charspace:
+            t.setCharSpace(run_charspace)
+            charspace = run_charspace
+        if run_color != color:
+            t.setFillColorRGB(*run_color)
+            color = run_color
+        t.setTextOrigin(x, y)
+        t.textOut(text)
+    c.drawText(t)
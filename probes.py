@@ -0,0 +1,173 @@
+"""Background health probes (used by /diag and /debug).
+
+``Prober`` runs a set of named checks concurrently, on a schedule in a
+daemon thread, and keeps the latest result of each with its latency and
+timestamp. Readers get that snapshot without touching the network. An
+explicit ``refresh()`` runs the checks now, but only one run is ever in
+flight (a concurrent caller waits for it) and runs closer together than
+``min_refresh_interval`` are refused. The schedule's first run comes one
+interval after the start, and every wait gets up to ``jitter`` (a fraction
+of the interval) added, so freshly started instances do not probe together.
+
+Checks are ``fn() -> dict`` (``{'status': 'OK' | ..., ...}``); an exception
+becomes ``{'status': 'FAILED', 'error': ...}``. ``on_result(name, result)``
+is called after each check, e.g. to feed upstream health tracking.
+
+``run_async`` / ``refresh_async`` do the same from an event loop with
+coroutine checks (asgi.py passes versions that use the async HTTP client);
+they share the in-flight lock, throttle and results with the threaded runs.
+"""
+import asyncio
+import random
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timezone
+
+import log
+
+
+def _iso(ts):
+    return datetime.fromtimestamp(ts, timezone.utc).isoformat() if ts else None
+
+
+class Prober:
+
+    def __init__(self, checks, interval=300.0, min_refresh_interval=10.0, on_result=None, jitter=0.1):
+        self.checks = dict(checks)
+        self.interval = interval
+        self.jitter = jitter
+        self.min_refresh_interval = min_refresh_interval
+        self.on_result = on_result
+        self._results = {}
+        self._last_started = 0.0
+        self._last_finished = 0.0
+        self._runs = 0
+        self._throttled = 0
+        self._run_lock = threading.Lock()
+        self._lock = threading.Lock()
+        self._thread = None
+        self._stop = threading.Event()
+
+    def ensure_started(self):
+        """Start the schedule thread once (no-op when interval <= 0)."""
+        if self._thread is not None or self.interval <= 0:
+            return
+        with self._lock:
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._loop, name='prober', daemon=True)
+                self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+
+    def _next_wait(self):
+        return self.interval * (1 + random.uniform(0, self.jitter))
+
+    def _loop(self):
+        # Wait first: starting the schedule (on the first request) must not cost a probe
+        while not self._stop.wait(self._next_wait()):
+            try:
+                self.run()
+            except Exception as e:
+                log.event('probe.run_failed', level='error', error=str(e))
+
+    def _check(self, name, fn):
+        started = time.time()
+        t = time.perf_counter()
+        try:
+            result = dict(fn())
+        except Exception as e:
+            result = {'status': 'FAILED', 'error': str(e)}
+        return self._store(name, result, started, t)
+
+    async def _check_async(self, name, fn):
+        started = time.time()
+        t = time.perf_counter()
+        try:
+            result = dict(await fn())
+        except Exception as e:
+            result = {'status': 'FAILED', 'error': str(e)}
+        return self._store(name, result, started, t)
+
+    def _store(self, name, result, started, t):
+        result['latency_ms'] = round((time.perf_counter() - t) * 1000, 1)
+        result['checked_at'] = _iso(started)
+        if self.on_result is not None:
+            try:
+                self.on_result(name, result)
+            except Exception as e:
+                log.event('probe.on_result_failed', level='error', probe=name, error=str(e))
+        with self._lock:
+            self._results[name] = result
+        return result
+
+    def run(self):
+        """Run every check concurrently now, unless a run is already in flight (then wait for it)."""
+        if not self._run_lock.acquire(blocking=False):
+            with self._run_lock:
+                return False
+        try:
+            self._last_started = time.time()
+            with ThreadPoolExecutor(max_workers=len(self.checks) or 1, thread_name_prefix='probe') as pool:
+                for name, fn in self.checks.items():
+                    pool.submit(self._check, name, fn)
+            self._last_finished = time.time()
+            self._runs += 1
+        finally:
+            self._run_lock.release()
+        return True
+
+    async def run_async(self, checks):
+        """``run`` with coroutine ``checks`` (same names as ``self.checks``) on the running loop."""
+        joined = False
+        # The lock may be held by the schedule thread, so poll it instead of blocking the loop
+        while not self._run_lock.acquire(blocking=False):
+            joined = True
+            await asyncio.sleep(0.05)
+        if joined:
+            self._run_lock.release()
+            return False
+        try:
+            self._last_started = time.time()
+            await asyncio.gather(*(self._check_async(name, fn) for name, fn in checks.items()))
+            self._last_finished = time.time()
+            self._runs += 1
+        finally:
+            self._run_lock.release()
+        return True
+
+    async def refresh_async(self, checks):
+        """``refresh`` using ``run_async``."""
+        if not self._run_lock.locked() and time.time() - self._last_finished < self.min_refresh_interval:
+            self._throttled += 1
+            return 'throttled'
+        return 'ran' if await self.run_async(checks) else 'joined'
+
+    def refresh(self):
+        """On-demand run, rate limited. Returns 'ran', 'joined' or 'throttled'."""
+        if not self._run_lock.locked() and time.time() - self._last_finished < self.min_refresh_interval:
+            self._throttled += 1
+            return 'throttled'
+        return 'ran' if self.run() else 'joined'
+
+    def snapshot(self):
+        with self._lock:
+            results = {name: dict(r) for name, r in self._results.items()}
+        age = time.time() - self._last_finished if self._last_finished else None
+        return {
+            'checks': results,
+            'last_run_started': _iso(self._last_started),
+            'last_run_finished': _iso(self._last_finished),
+            'age_seconds': round(age, 1) if age is not None else None,
+            'running': self._run_lock.locked(),
+        }
+
+    def stats(self):
+        return {
+            'interval': self.interval,
+            'runs': self._runs,
+            'refreshes_throttled': self._throttled,
+            'scheduled': self._thread is not None,
+            'last_run_finished': _iso(self._last_finished),
+        }
@@ -0,0 +1,277 @@
+"""Process-wide client-side rate limiting for OpenRouter.
+
+Every upstream call takes a permit from ``UpstreamLimiter`` first:
+
+* two token buckets, one in requests/min and one in (LLM) tokens/min;
+* an AIMD concurrency cap that halves on a 429 and grows by roughly one
+  slot per window of successful calls;
+* a shared "blocked until" time set from ``Retry-After`` and the
+  ``X-RateLimit-*`` headers, so one 429 pauses every worker, not just the
+  one that saw it.
+
+Callers pass a deadline. If a permit cannot be had by then, ``acquire``
+raises ``RateLimited`` straight away instead of sleeping, and the caller
+can serve the local fallback. ``acquire_async`` is the same for code
+running on an event loop (asgi.py); both draw on the same budget.
+"""
+import asyncio
+import threading
+import time
+from email.utils import parsedate_to_datetime
+
+
+# How often acquire_async re-checks for a free concurrency slot
+SLOT_POLL_INTERVAL = 0.05
+
+
+class RateLimited(Exception):
+    """No upstream permit could be obtained before the caller's deadline."""
+
+
+class TokenBucket:
+    """Token bucket refilled continuously at ``per_minute / 60`` tokens per second.
+
+    ``reserve`` takes tokens up front (the balance may go negative) and
+    returns how long the caller must wait for its reservation to mature,
+    which keeps waiters in FIFO order without a thundering herd.
+    """
+
+    def __init__(self, per_minute, capacity=None):
+        self.rate = per_minute / 60.0
+        self.capacity = float(capacity or per_minute)
+        self._tokens = self.capacity
+        self._updated = time.monotonic()
+        self._lock = threading.Lock()
+
+    def _refill(self, now):
+        self._tokens = min(self.capacity, self._tokens + (now - self._updated) * self.rate)
+        self._updated = now
+
+    def reserve(self, cost, max_wait):
+        """Reserve ``cost`` tokens; return the wait in seconds, or None if over ``max_wait``."""
+        with self._lock:
+            now = time.monotonic()
+            self._refill(now)
+            # A single request bigger than the bucket would never fit; let it drain the bucket
+            cost = min(cost, self.capacity)
+            wait = 0.0 if self._tokens >= cost else (cost - self._tokens) / self.rate
+            if wait > max_wait:
+                return None
+            self._tokens -= cost
+            return wait
+
+    def refund(self, cost):
+        with self._lock:
+            self._tokens = min(self.capacity, self._tokens + min(cost, self.capacity))
+
+    @property
+    def available(self):
+        with self._lock:
+            self._refill(time.monotonic())
+            return self._tokens
+
+
+class AIMDLimiter:
+    """Concurrency cap with additive increase / multiplicative decrease."""
+
+    def __init__(self, initial, minimum=1, maximum=64, decrease=0.5):
+        self.minimum = minimum
+        self.maximum = maximum
+        self.decrease = decrease
+        self.limit = float(max(minimum, min(initial, maximum)))
+        self.in_flight = 0
+        self._cond = threading.Condition()
+
+    def acquire(self, deadline):
+        with self._cond:
+            while self.in_flight >= int(self.limit):
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    return False
+                self._cond.wait(remaining)
+            self.in_flight += 1
+            return True
+
+    def try_acquire(self):
+        with self._cond:
+            if self.in_flight >= int(self.limit):
+                return False
+            self.in_flight += 1
+            return True
+
+    def release(self, outcome):
+        with self._cond:
+            self.in_flight -= 1
+            if outcome == 'success':
+                self.limit = min(self.maximum, self.limit + 1.0 / self.limit)
+            elif outcome == 'rate_limited':
+                self.limit = max(self.minimum, self.limit * self.decrease)
+            self._cond.notify_all()
+
+
+def parse_retry_after(value, now=None):
+    """Seconds to wait from a ``Retry-After`` header (delta-seconds or HTTP date)."""
+    if not value:
+        return None
+    try:
+        return max(0.0, float(value))
+    except ValueError:
+        pass
+    try:
+        when = parsedate_to_datetime(value).timestamp()
+    except (TypeError, ValueError):
+        return None
+    return max(0.0, when - (now or time.time()))
+
+
+def parse_ratelimit_reset(headers, now=None):
+    """Seconds until ``X-RateLimit-Reset`` when ``X-RateLimit-Remaining`` is exhausted.
+
+    OpenRouter sends the reset as epoch milliseconds; plain epoch seconds and
+    relative seconds are accepted too.
+    """
+    remaining = headers.get('X-RateLimit-Remaining')
+    reset = headers.get('X-RateLimit-Reset')
+    if remaining is None or reset is None:
+        return None
+    try:
+        if float(remaining) > 0:
+            return None
+        reset = float(reset)
+    except ValueError:
+        return None
+    now = now or time.time()
+    if reset > 1e12:
+        reset /= 1000.0
+    if reset > 1e9:
+        return max(0.0, reset - now)
+    return max(0.0, reset)
+
+
+class Permit:
+    __slots__ = ('_limiter', '_released')
+
+    def __init__(self, limiter):
+        self._limiter = limiter
+        self._released = False
+
+    def release(self, outcome='success'):
+        """Return the concurrency slot; ``outcome`` is success, rate_limited or error."""
+        if not self._released:
+            self._released = True
+            self._limiter._concurrency.release(outcome)
+
+
+class UpstreamLimiter:
+
+    def __init__(self, requests_per_minute=20, tokens_per_minute=0, max_concurrency=8,
+                 min_concurrency=1):
+        self._requests = TokenBucket(requests_per_minute) if requests_per_minute else None
+        self._tokens = TokenBucket(tokens_per_minute) if tokens_per_minute else None
+        self._concurrency = AIMDLimiter(max_concurrency, minimum=min_concurrency,
+                                        maximum=max_concurrency)
+        self._lock = threading.Lock()
+        self._blocked_until = 0.0  # monotonic
+        self.granted = 0
+        self.rejected = 0
+        self.rate_limited = 0
+        self.total_wait = 0.0
+
+    def acquire(self, tokens=0, deadline=None):
+        """Block until a permit is available; raise ``RateLimited`` if that is past ``deadline``.
+
+        ``deadline`` is a ``time.monotonic()`` value; None means "do not wait".
+        """
+        start, deadline, wait, reserved = self._reserve(tokens, deadline)
+        if wait > 0:
+            time.sleep(wait)
+        if not self._concurrency.acquire(deadline):
+            self._no_slot(reserved)
+        return self._grant(start)
+
+    async def acquire_async(self, tokens=0, deadline=None):
+        """``acquire`` for coroutines: waits with ``asyncio.sleep`` instead of blocking the thread."""
+        start, deadline, wait, reserved = self._reserve(tokens, deadline)
+        if wait > 0:
+            await asyncio.sleep(wait)
+        # Slots are shared with threaded callers, so poll rather than wait on their Condition
+        while not self._concurrency.try_acquire():
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                self._no_slot(reserved)
+            await asyncio.sleep(min(SLOT_POLL_INTERVAL, remaining))
+        return self._grant(start)
+
+    def _reserve(self, tokens, deadline):
+        """Check the shared back-off and reserve bucket tokens: ``(start, deadline, wait, reserved)``."""
+        start = time.monotonic()
+        deadline = start if deadline is None else deadline
+        with self._lock:
+            blocked = self._blocked_until - start
+        if blocked > 0 and start + blocked > deadline:
+            self._reject(f'upstream asked us to back off for {blocked:.1f}s')
+        wait = max(0.0, blocked)
+
+        max_wait = deadline - start
+        reserved = []
+        for bucket, cost, label in ((self._requests, 1, 'requests/min'),
+                                    (self._tokens, tokens, 'tokens/min')):
+            if bucket is None or not cost:
+                continue
+            w = bucket.reserve(cost, max_wait)
+            if w is None:
+                for b, c in reserved:
+                    b.refund(c)
+                self._reject(f'{label} budget exhausted')
+            reserved.append((bucket, cost))
+            wait = max(wait, w)
+        return start, deadline, wait, reserved
+
+    def _no_slot(self, reserved):
+        for b, c in reserved:
+            b.refund(c)
+        self._reject(f'all {int(self._concurrency.limit)} upstream slots busy')
+
+    def _grant(self, start):
+        with self._lock:
+            self.granted += 1
+            self.total_wait += time.monotonic() - start
+        return Permit(self)
+
+    def _reject(self, reason):
+        with self._lock:
+            self.rejected += 1
+        raise RateLimited(f'Client-side rate limit: {reason}')
+
+    def observe(self, status_code, headers):
+        """Feed response status/headers back so the whole process backs off together."""
+        delay = None
+        if status_code == 429:
+            with self._lock:
+                self.rate_limited += 1
+            delay = parse_retry_after(headers.get('Retry-After'))
+            if delay is None:
+                delay = parse_ratelimit_reset(headers)
+            if delay is None:
+                delay = 1.0
+        else:
+            delay = parse_ratelimit_reset(headers)
+        if delay:
+            with self._lock:
+                self._blocked_until = max(self._blocked_until, time.monotonic() + delay)
+
+    def stats(self):
+        with self._lock:
+            blocked = max(0.0, self._blocked_until - time.monotonic())
+            granted = self.granted
+            return {
+                'granted': granted,
+                'rejected': self.rejected,
+                'rate_limited': self.rate_limited,
+                'avg_wait_ms': round(self.total_wait / granted * 1000, 1) if granted else 0.0,
+                'blocked_for_s': round(blocked, 2),
+                'concurrency_limit': round(self._concurrency.limit, 2),
+                'in_flight': self._concurrency.in_flight,
+                'requests_available': round(self._requests.available, 2) if self._requests else None,
+                'tokens_available': round(self._tokens.available, 2) if self._tokens else None,
+            }
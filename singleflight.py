@@ -0,0 +1,157 @@
+"""Coalesce identical concurrent calls into one.
+
+The first caller for a key becomes the leader and does the work; callers
+that arrive while it is running wait for the leader's outcome instead of
+starting their own. Whatever the leader ends with, a result or an
+exception, is handed to every follower.
+
+Leaders and followers may be threads or coroutines (``do_async`` /
+``wait_async``) in any mix; a coroutine follower waits without holding a
+thread.
+"""
+import asyncio
+import threading
+
+
+class FlightTimeout(Exception):
+    """A follower gave up waiting for the leader."""
+
+
+class _Call:
+    __slots__ = ('event', 'result', 'error', 'followers', 'callbacks')
+
+    def __init__(self):
+        self.event = threading.Event()
+        self.result = None
+        self.error = None
+        self.followers = 0
+        self.callbacks = []
+
+    def finish(self, result, error, lock):
+        self.result = result
+        self.error = error
+        with lock:
+            self.event.set()
+            callbacks, self.callbacks = self.callbacks, []
+        for cb in callbacks:
+            cb()
+
+    def outcome(self):
+        if self.error is not None:
+            raise self.error
+        return self.result
+
+    def wait(self, timeout=None):
+        if not self.event.wait(timeout):
+            raise FlightTimeout(f'Timed out after {timeout}s waiting for an identical in-flight request')
+        return self.outcome()
+
+    async def wait_async(self, lock, timeout=None):
+        loop = asyncio.get_running_loop()
+        done = loop.create_future()
+
+        def wake():
+            # May run on the leader's thread
+            loop.call_soon_threadsafe(lambda: done.done() or done.set_result(None))
+
+        with lock:
+            if not self.event.is_set():
+                self.callbacks.append(wake)
+                wake = None
+        if wake is not None:
+            return self.outcome()
+        try:
+            await asyncio.wait_for(done, timeout)
+        except asyncio.TimeoutError:
+            raise FlightTimeout(f'Timed out after {timeout}s waiting for an identical in-flight request')
+        return self.outcome()
+
+
+class SingleFlight:
+
+    def __init__(self, wait_timeout=None):
+        self.wait_timeout = wait_timeout
+        self._calls = {}
+        self._lock = threading.Lock()
+        self.leaders = 0
+        self.coalesced = 0
+        self.follower_timeouts = 0
+
+    def acquire(self, key):
+        """Join the flight for ``key``; returns ``(call, is_leader)``.
+
+        A leader must always call ``release`` (use try/finally), otherwise
+        followers hang until their wait timeout.
+        """
+        with self._lock:
+            call = self._calls.get(key)
+            if call is not None:
+                call.followers += 1
+                self.coalesced += 1
+                return call, False
+            call = _Call()
+            self._calls[key] = call
+            self.leaders += 1
+            return call, True
+
+    def release(self, key, call, result=None, error=None):
+        with self._lock:
+            if self._calls.get(key) is call:
+                del self._calls[key]
+        call.finish(result, error, self._lock)
+
+    def wait(self, call, timeout=None):
+        try:
+            return call.wait(self.wait_timeout if timeout is None else timeout)
+        except FlightTimeout:
+            self.follower_timeouts += 1
+            raise
+
+    async def wait_async(self, call, timeout=None):
+        try:
+            return await call.wait_async(self._lock, self.wait_timeout if timeout is None else timeout)
+        except FlightTimeout:
+            self.follower_timeouts += 1
+            raise
+
+    async def do_async(self, key, fn, timeout=None):
+        """``do`` for a coroutine function ``fn``; returns ``(result, shared)``."""
+        call, leader = self.acquire(key)
+        if not leader:
+            return await self.wait_async(call, timeout), True
+        try:
+            result = await fn()
+        except asyncio.CancelledError:
+            # The leader's client went away; followers fall back rather than inherit the cancellation
+            self.release(key, call, error=Exception('Identical in-flight request was cancelled'))
+            raise
+        except BaseException as e:
+            self.release(key, call, error=e)
+            raise
+        self.release(key, call, result=result)
+        return result, False
+
+    def do(self, key, fn, timeout=None):
+        """Run ``fn()`` once per concurrent ``key``; returns ``(result, shared)``."""
+        call, leader = self.acquire(key)
+        if not leader:
+            return self.wait(call, timeout), True
+        try:
+            result = fn()
+        except BaseException as e:
+            self.release(key, call, error=e)
+            raise
+        self.release(key, call, result=result)
+        return result, False
+
+    def stats(self):
+        with self._lock:
+            in_flight = len(self._calls)
+            waiting = sum(c.followers for c in self._calls.values())
+        return {
+            'in_flight': in_flight,
+            'waiting_followers': waiting,
+            'leaders': self.leaders,
+            'coalesced': self.coalesced,
+            'follower_timeouts': self.follower_timeouts,
+        }
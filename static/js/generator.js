@@ -2,6 +2,7 @@
 // Global variable to store current job details and description for server PDF generation
 let currentJobDetails = null;
 let currentJobDescription = '';
+let currentSections = null;
 
 document.addEventListener('DOMContentLoaded', function () {
     initializeFormAnimations();
@@ -239,7 +240,8 @@ function initializeJobGenerator() {
         const jobData = Object.fromEntries(formData);
 
         startGeneration();
-        generateJobDescription(jobData).then(showResults);
+        // Regenerate must produce a fresh description, so bypass the server cache
+        generateJobDescription(jobData, { nocache: true }).then(showResults);
         animateButton(this);
     });
 }
@@ -483,21 +485,37 @@ function animateButton(button) {
     }, 150);
 }
 
-// Server-side PDF helpers: call backend endpoints to download or preview PDFs
+// Server-side PDF helpers: call backend endpoints to download or preview PDFs.
+// The last rendered PDF is kept with its ETag; asking again for the same content sends
+// If-None-Match and reuses the blob on a 304, so repeat previews cost no rendering.
+let lastPdf = { body: null, etag: null, blob: null };
+
+function fetchPdfBlob() {
+    const body = JSON.stringify(currentSections
+        ? { jobDetails: currentJobDetails, sections: currentSections }
+        : { jobDetails: currentJobDetails, jobDescription: currentJobDescription });
+    const headers = { 'Content-Type': 'application/json' };
+    if (lastPdf.body === body && lastPdf.etag && lastPdf.blob) {
+        headers['If-None-Match'] = lastPdf.etag;
+    }
+    return fetch('/download_pdf', { method: 'POST', headers, body }).then(resp => {
+        if (resp.status === 304 && lastPdf.blob) return lastPdf.blob;
+        if (!resp.ok) throw new Error('Server error while generating PDF');
+        const etag = resp.headers.get('ETag');
+        return resp.blob().then(blob => {
+            lastPdf = { body, etag, blob };
+            return blob;
+        });
+    });
+}
+
 function downloadPdfBackend() {
     if (!currentJobDescription || !currentJobDetails) {
         showToast('No job description to download. Please generate one first.', 'warning');
         return;
     }
 
-    fetch('/download_pdf', {
-        method: 'POST',
-        headers: { 'Content-Type': 'application/json' },
-        body: JSON.stringify({ jobDetails: currentJobDetails, jobDescription: currentJobDescription })
-    }).then(resp => {
-        if (!resp.ok) throw new Error('Server error while generating PDF');
-        return resp.blob();
-    }).then(blob => {
+    fetchPdfBlob().then(blob => {
         const url = URL.createObjectURL(blob);
         const a = document.createElement('a');
         a.href = url;
@@ -519,14 +537,7 @@ function previewPdfBackend() {
         showToast('No job description to preview. Please generate one first.', 'warning');
         return;
     }
-    fetch('/download_pdf', {
-        method: 'POST',
-        headers: { 'Content-Type': 'application/json' },
-        body: JSON.stringify({ jobDetails: currentJobDetails, jobDescription: currentJobDescription })
-    }).then(resp => {
-        if (!resp.ok) throw new Error('Server error while generating PDF');
-        return resp.blob();
-    }).then(blob => {
+    fetchPdfBlob().then(blob => {
         const url = URL.createObjectURL(blob);
         window.open(url, '_blank');
         setTimeout(() => URL.revokeObjectURL(url), 10000);
@@ -566,9 +577,16 @@ function initializeTooltips() {
     });
 }
 
-async function generateJobDescription(jobData) {
+async function generateJobDescription(jobData, options = {}) {
+    const query = options.nocache ? '?nocache=1' : '';
     try {
-        const response = await fetch("/generate", {
+        // Prefer the streaming endpoint so text shows up while the model is still writing
+        if (window.ReadableStream && window.TextDecoder) {
+            const streamed = await generateJobDescriptionStream(jobData, query);
+            if (streamed) return streamed;
+        }
+
+        const response = await fetch("/generate" + query, {
             method: "POST",
             headers: { "Content-Type": "application/json" },
             body: JSON.stringify(jobData)
@@ -600,6 +618,91 @@ async function generateJobDescription(jobData) {
     }
 }
 
+// Stream a generation from /generate/stream (Server-Sent Events over a POST body).
+// Resolves with the formatted HTML, or null if the browser/server can't stream so
+// the caller can fall back to the plain JSON endpoint.
+async function generateJobDescriptionStream(jobData, query = '') {
+    const response = await fetch("/generate/stream" + query, {
+        method: "POST",
+        headers: { "Content-Type": "application/json", "Accept": "text/event-stream" },
+        body: JSON.stringify(jobData)
+    });
+
+    if (!response.ok) {
+        throw new Error(`HTTP error! status: ${response.status}`);
+    }
+
+    const contentType = response.headers.get('Content-Type') || '';
+    if (!contentType.includes('text/event-stream')) {
+        // Validation errors come back as plain JSON
+        const result = await response.json();
+        throw new Error(result.message || result.error || "Failed to generate job description. Please try again.");
+    }
+    if (!response.body) return null;
+
+    const reader = response.body.getReader();
+    const decoder = new TextDecoder();
+    let buffer = '';
+    let text = '';
+    let finalResult = null;
+
+    while (true) {
+        const { value, done } = await reader.read();
+        if (done) break;
+        buffer += decoder.decode(value, { stream: true });
+
+        // Events are separated by a blank line
+        let sep;
+        while ((sep = buffer.indexOf('\n\n')) !== -1) {
+            const rawEvent = buffer.slice(0, sep);
+            buffer = buffer.slice(sep + 2);
+
+            let eventName = 'message';
+            let dataStr = '';
+            for (const line of rawEvent.split('\n')) {
+                if (line.startsWith('event:')) eventName = line.slice(6).trim();
+                else if (line.startsWith('data:')) dataStr += line.slice(5).trim();
+            }
+            const payload = dataStr ? JSON.parse(dataStr) : {};
+
+            if (eventName === 'delta') {
+                text += payload.text || '';
+                renderStreamingPreview(text);
+            } else if (eventName === 'reset') {
+                text = '';
+                renderStreamingPreview(text);
+            } else if (eventName === 'done') {
+                finalResult = payload;
+            }
+        }
+    }
+
+    if (finalResult && finalResult.success && finalResult.jobDescription) {
+        return formatJobDescriptionDisplay(finalResult);
+    }
+    throw new Error((finalResult && (finalResult.message || finalResult.error)) || "Failed to generate job description. Please try again.");
+}
+
+// Show the raw text in the results panel while a streamed generation is in progress
+function renderStreamingPreview(text) {
+    const loadingState = document.getElementById('loading-state');
+    const resultsSection = document.getElementById('results-section');
+    const outputContainer = document.getElementById('job-description-output');
+    if (!outputContainer) return;
+
+    if (resultsSection.classList.contains('hidden')) {
+        loadingState.classList.add('hidden');
+        resultsSection.classList.remove('hidden');
+        outputContainer.innerHTML = '<pre class="whitespace-pre-wrap font-sans text-sm sm:text-base text-gray-700 leading-relaxed"></pre>';
+    }
+    let pre = outputContainer.querySelector('pre');
+    if (!pre) {
+        outputContainer.innerHTML = '<pre class="whitespace-pre-wrap font-sans text-sm sm:text-base text-gray-700 leading-relaxed"></pre>';
+        pre = outputContainer.querySelector('pre');
+    }
+    pre.textContent = text;
+}
+
 // Format the job description for structured display
 function formatJobDescriptionDisplay(result) {
     let { jobDescription, jobDetails, metadata } = result;
@@ -623,48 +726,27 @@ function formatJobDescriptionDisplay(result) {
     // Build a semantic, decorated HTML version of the job description
     function escapeHtml(str) { return (str || '').replace(/&/g, '&amp;').replace(/</g, '&lt;').replace(/>/g, '&gt;').replace(/"/g, '&quot;').replace(/'/g, '&#39;'); }
 
-    const lines = (jobDescription || '').split(/\r?\n/).map(l => l.trim());
-    const sectionOrder = ['Job Overview', 'Key Responsibilities', 'Required Qualifications', 'Preferred Qualifications', 'What We Offer', 'How to Apply'];
-    const sections = { 'Job Overview': [], 'Key Responsibilities': [], 'Required Qualifications': [], 'Preferred Qualifications': [], 'What We Offer': [], 'How to Apply': [] };
-    let current = 'Job Overview';
-
-    const headingMap = {
-        'job overview': 'Job Overview', 'overview': 'Job Overview',
-        'key responsibilities': 'Key Responsibilities', 'responsibilities': 'Key Responsibilities',
-        'required qualifications': 'Required Qualifications', 'required': 'Required Qualifications',
-        'preferred qualifications': 'Preferred Qualifications', 'preferred': 'Preferred Qualifications',
-        'what we offer': 'What We Offer', 'what we offer.': 'What We Offer', 'what we offer:': 'What We Offer',
-        'how to apply': 'How to Apply', 'apply': 'How to Apply'
-    };
-
-    for (let raw of lines) {
-        if (!raw) { sections[current].push(''); continue; }
-        const low = raw.replace(/^\d+\.\s*/, '').replace(/\*\*/g, '').toLowerCase();
-        if (headingMap[low] !== undefined) { current = headingMap[low]; continue; }
-        const m = raw.match(/^([A-Za-z ][A-Za-z ]{2,}):$/);
-        if (m && headingMap[m[1].toLowerCase()]) { current = headingMap[m[1].toLowerCase()]; continue; }
-        sections[current].push(raw);
-    }
+    // Sections arrive parsed by the server (jd_text.parse_sections): [{title, blocks: [[kind, text], ...]}]
+    // in display order. Copy them so the email line below doesn't touch the response object.
+    const sections = ((result.sections && result.sections.sections) || [])
+        .map(s => ({ title: s.title, blocks: s.blocks.slice() }));
 
     // REQUIREMENT: Add an email address to the “How to Apply” section
     const emailStr = jobDetails.email || jobDetails.companyEmail;
-    // Only add if we have an email and it's not already clearly in the section (simple check)
-    // We'll append it to ensure it's there.
     if (emailStr) {
-        sections['How to Apply'].push(`Please send your application to ${emailStr}`);
+        let apply = sections.find(s => s.title === 'How to Apply');
+        if (!apply) {
+            apply = { title: 'How to Apply', blocks: [] };
+            sections.push(apply);
+        }
+        // Its own paragraph, not a continuation of the last line of the section
+        if (apply.blocks.length && apply.blocks[apply.blocks.length - 1][0] !== 'blank') apply.blocks.push(['blank', '']);
+        apply.blocks.push(['paragraph', `Please send your application to ${emailStr}`]);
     }
 
     // REQUIREMENT: Ensure the same email content is included in the generated/downloaded PDF
-    // We reconstruct currentJobDescription from the parsed sections to ensure sync
-    let reconstructed = '';
-    for (let key of sectionOrder) {
-        if (sections[key] && sections[key].length > 0) {
-            reconstructed += `${key}:\n`;
-            // Join lines, ensure clean spacing
-            reconstructed += sections[key].join('\n') + '\n\n';
-        }
-    }
-    currentJobDescription = reconstructed.trim();
+    // The PDF is rendered straight from these sections (see fetchPdfBlob)
+    currentSections = { sections };
 
     const icons = {
         'Job Overview': 'fas fa-info-circle', 'Key Responsibilities': 'fas fa-tasks',
@@ -672,27 +754,48 @@ function formatJobDescriptionDisplay(result) {
         'What We Offer': 'fas fa-gift', 'How to Apply': 'fas fa-paper-plane'
     };
 
+    // Blocks are rendered in order: a run of bullets becomes one list, a run of paragraph
+    // lines one <p> (blank lines, sub-headers and bullets end the run)
+    function blocksHtml(blocks) {
+        let html = '';
+        let bullets = [];
+        let para = [];
+        const flush = () => {
+            if (bullets.length) {
+                html += `<ul class="list-disc list-inside text-gray-700 space-y-2 mb-4">`;
+                for (let b of bullets) html += `<li>${escapeHtml(b)}</li>`;
+                html += `</ul>`;
+                bullets = [];
+            }
+            if (para.length) {
+                html += `<p class="text-gray-700 leading-relaxed mb-3">${escapeHtml(para.join('\n'))}</p>`;
+                para = [];
+            }
+        };
+        for (let [kind, text] of blocks) {
+            if (kind === 'bullet') {
+                if (para.length) flush();
+                bullets.push(text);
+            } else if (kind === 'paragraph') {
+                if (bullets.length) flush();
+                para.push(text);
+            } else {
+                flush();
+                if (kind === 'header') html += `<h4 class="font-semibold text-gray-800 mt-4 mb-2">${escapeHtml(text)}</h4>`;
+            }
+        }
+        flush();
+        return html;
+    }
+
     let bodyHtml = '';
-    for (let key of sectionOrder) {
-        const items = sections[key].filter(x => x !== undefined && x !== '');
-        if (!items || items.length === 0) continue;
+    for (let section of sections) {
+        const key = section.title;
+        if (!section.blocks.some(b => b[0] !== 'blank')) continue;
 
         bodyHtml += `<div class="mb-6">`;
-        bodyHtml += `<h3 class="text-xl font-bold text-primary-red mb-3 flex items-center"><i class="${icons[key]} mr-3 text-primary-red"></i>${key}</h3>`;
-
-        const bullets = items.filter(line => line.startsWith('- ')).map(l => l.slice(2));
-        const paras = items.filter(line => !line.startsWith('- ')).join('\n').trim();
-
-        if (bullets.length) {
-            bodyHtml += `<ul class="list-disc list-inside text-gray-700 space-y-2 mb-4">`;
-            for (let b of bullets) bodyHtml += `<li>${escapeHtml(b)}</li>`;
-            bodyHtml += `</ul>`;
-        }
-        if (paras) {
-            const pblocks = paras.split(/\n\s*\n/).map(p => p.trim()).filter(Boolean);
-            for (let p of pblocks) bodyHtml += `<p class="text-gray-700 leading-relaxed mb-3">${escapeHtml(p)}</p>`;
-        }
-
+        bodyHtml += `<h3 class="text-xl font-bold text-primary-red mb-3 flex items-center"><i class="${icons[key] || 'fas fa-info-circle'} mr-3 text-primary-red"></i>${escapeHtml(key)}</h3>`;
+        bodyHtml += blocksHtml(section.blocks);
         bodyHtml += `</div>`;
     }
 
@@ -0,0 +1,38 @@
+import os
+import sys
+
+ROOT = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..')
+sys.path.insert(0, ROOT)
+
+import pytest
+
+# The app reads its settings at import, so it is imported once, pointed at the
+# in-process OpenRouter stub from bench/
+APP_ENV = {'OPENROUTER_API_KEY': 'test-key', 'DIAG_PROBE_INTERVAL': '0', 'LOG_SAMPLE_RATE': '0',
+           'OPENROUTER_RPM': '0', 'HISTORY_DB': '', 'JD_CACHE_DB': '', 'PREWARM': ''}
+
+
+@pytest.fixture(scope='session')
+def stub():
+    sys.path.insert(0, os.path.join(ROOT, 'bench'))
+    import openrouter_stub
+    config = openrouter_stub.StubConfig(latency_ms=0, jitter_ms=0, chunk_delay_ms=0)
+    server, url = openrouter_stub.start(config)
+    config.base_url = url
+    yield config
+    server.shutdown()
+
+
+@pytest.fixture(scope='session')
+def main(stub):
+    os.environ.update(APP_ENV, OPENROUTER_BASE_URL=f'{stub.base_url}/api')
+    import app
+    return app
+
+
+@pytest.fixture
+def job_form(request):
+    """A valid /generate body, unique per test so cached answers never leak between tests."""
+    return {'jobTitle': f'Backend Engineer {request.node.nodeid}', 'companyName': 'Acme', 'city': 'Chennai',
+            'state': 'Tamil Nadu', 'jobType': 'full-time', 'experienceLevel': 'mid', 'salary': '12 LPA',
+            'companyEmail': 'jobs@example.com', 'skillsKnown': 'Python, SQL'}
@@ -0,0 +1,50 @@
+import asyncio
+import time
+
+import pytest
+
+httpx = pytest.importorskip('httpx')
+
+from test_generate import sse_done, slow_upstream  # noqa: F401  (fixture)
+
+
+@pytest.fixture(scope='module')
+def asgi(main):
+    import asgi
+    return asgi
+
+
+async def post_generate(client, form):
+    return (await client.post('/generate', json=form)).json()
+
+
+async def post_stream(client, form):
+    return sse_done((await client.post('/generate/stream', json=form)).text)
+
+
+async def lead_and_follow(asgi, lead, follow, form):
+    transport = httpx.ASGITransport(app=asgi.app)
+    async with httpx.AsyncClient(transport=transport, base_url='http://test', timeout=10) as client:
+        leader = asyncio.ensure_future(lead(client, form))
+        deadline = time.monotonic() + 5
+        while asgi.main.upstream_flights.stats()['in_flight'] == 0:
+            assert time.monotonic() < deadline, 'leader never started'
+            await asyncio.sleep(0.01)
+        follower = await follow(client, dict(form))
+        return await leader, follower
+
+
+def test_generate(asgi, job_form):
+    out = asyncio.run(lead_and_follow(asgi, post_generate, post_generate, job_form))[0]
+    assert not out['metadata']['fallbackUsed'] and out['metadata']['tokens']['completion']
+
+
+@pytest.mark.parametrize('lead, follow', [(post_stream, post_generate), (post_generate, post_stream),
+                                          (post_stream, post_stream), (post_generate, post_generate)])
+def test_identical_requests_coalesce_across_modes(asgi, job_form, slow_upstream, lead, follow):
+    leader, follower = asyncio.run(lead_and_follow(asgi, lead, follow, job_form))
+    assert not leader['metadata']['fallbackUsed']
+    assert not follower['metadata']['fallbackUsed'], follower['metadata']['apiError']
+    assert follower['metadata']['coalesced'] is True
+    assert follower['jobDescription'] == leader['jobDescription']
+    assert follower['metadata']['tokens'] == leader['metadata']['tokens']
@@ -0,0 +1,84 @@
+import time
+
+import pytest
+
+from breaker import CLOSED, HALF_OPEN, OPEN, CircuitBreaker, CircuitOpen
+
+
+def make_breaker(**kwargs):
+    options = dict(window_seconds=60, min_calls=4, failure_rate=0.5, timeout_rate=0.5, open_seconds=0.1)
+    options.update(kwargs)
+    return CircuitBreaker(**options)
+
+
+def test_stays_closed_below_min_calls():
+    breaker = make_breaker()
+    for _ in range(3):
+        breaker.record_failure()
+    assert breaker.state == CLOSED
+    breaker.before_call()
+
+
+def test_opens_on_failure_rate_and_refuses_calls():
+    breaker = make_breaker()
+    breaker.record_success()
+    breaker.record_success()
+    breaker.record_failure()
+    assert breaker.state == CLOSED
+    breaker.record_failure()
+    assert breaker.state == OPEN
+    with pytest.raises(CircuitOpen, match='2/4 calls failed'):
+        breaker.before_call()
+    assert breaker.stats()['short_circuited'] == 1
+
+
+def test_opens_on_timeout_rate():
+    breaker = make_breaker(failure_rate=1.0, timeout_rate=0.25)
+    for _ in range(3):
+        breaker.record_success()
+    breaker.record_failure(timeout=True)
+    assert breaker.state == OPEN
+    assert 'timed out' in breaker.stats()['reason']
+
+
+def open_breaker():
+    breaker = make_breaker(min_calls=1)
+    breaker.record_failure()
+    assert breaker.state == OPEN
+    time.sleep(0.12)
+    return breaker
+
+
+def test_half_open_admits_one_probe_and_closes_on_success():
+    breaker = open_breaker()
+    assert breaker.state == HALF_OPEN
+    breaker.before_call()
+    with pytest.raises(CircuitOpen):
+        breaker.before_call()
+    breaker.record_success()
+    assert breaker.state == CLOSED
+    assert breaker.stats()['window_calls'] == 0
+
+
+def test_failed_probe_reopens():
+    breaker = open_breaker()
+    breaker.before_call()
+    breaker.record_failure()
+    assert breaker.state == OPEN
+    assert breaker.stats()['opened_count'] == 2
+
+
+def test_released_probe_slot_can_be_reused():
+    breaker = open_breaker()
+    breaker.before_call()
+    breaker.release()
+    breaker.before_call()
+    assert breaker.state == HALF_OPEN
+
+
+def test_outcomes_expire_with_the_window():
+    breaker = make_breaker(window_seconds=0.05, min_calls=2)
+    breaker.record_failure()
+    time.sleep(0.06)
+    breaker.record_failure()
+    assert breaker.state == CLOSED
@@ -0,0 +1,105 @@
+import json
+import threading
+import time
+
+import pytest
+
+
+def sse_done(body):
+    """The ``done`` event's payload from an SSE response body."""
+    for block in body.split('\n\n'):
+        if block.startswith('event: done'):
+            return json.loads(block.split('data: ', 1)[1])
+    raise AssertionError(f'no done event in {body[:200]!r}')
+
+
+@pytest.fixture
+def slow_upstream(stub):
+    stub.latency_ms = 400
+    yield
+    stub.latency_ms = 0
+
+
+def wait_in_flight(main):
+    deadline = time.monotonic() + 5
+    while main.upstream_flights.stats()['in_flight'] == 0:
+        assert time.monotonic() < deadline, 'leader never started'
+        time.sleep(0.01)
+
+
+def lead_and_follow(main, lead, follow):
+    """Start ``lead(client)`` on a thread, then run ``follow(client)`` once its upstream call is in flight."""
+    client = main.app.test_client()
+    out = {}
+    leader = threading.Thread(target=lambda: out.update(leader=lead(client)))
+    leader.start()
+    wait_in_flight(main)
+    out['follower'] = follow(client)
+    leader.join(10)
+    return out['leader'], out['follower']
+
+
+def post_generate(form):
+    return lambda client: client.post('/generate', json=form).get_json()
+
+
+def post_stream(form):
+    return lambda client: sse_done(client.post('/generate/stream', json=form).get_data(as_text=True))
+
+
+def test_generate_uses_the_upstream(main, job_form):
+    out = main.app.test_client().post('/generate', json=job_form).get_json()
+    meta = out['metadata']
+    assert not meta['fallbackUsed'] and meta['apiError'] is None
+    assert meta['tokens']['completion'] and meta['tokens']['maxTokens'] >= meta['tokens']['estimatedCompletion']
+    assert out['sections']['sections']
+
+
+@pytest.mark.parametrize('lead, follow', [(post_stream, post_generate), (post_generate, post_stream),
+                                          (post_stream, post_stream), (post_generate, post_generate)])
+def test_identical_requests_coalesce_across_modes(main, job_form, slow_upstream, lead, follow):
+    leader, follower = lead_and_follow(main, lead(job_form), follow(dict(job_form)))
+    assert not leader['metadata']['fallbackUsed']
+    assert not follower['metadata']['fallbackUsed'], follower['metadata']['apiError']
+    assert follower['metadata']['coalesced'] is True
+    assert follower['metadata']['apiError'] is None
+    assert follower['jobDescription'] == leader['jobDescription']
+    assert follower['metadata']['tokens'] == leader['metadata']['tokens']
+
+
+@pytest.mark.parametrize('route', ['/generate', '/generate/stream'])
+def test_non_text_fields_are_coerced(main, job_form, route):
+    form = dict(job_form, skillsKnown=['Python', 'SQL', 3], additionalDetails=42, salary=1200000)
+    resp = main.app.test_client().post(route, json=form)
+    assert resp.status_code == 200
+    out = resp.get_json() if route == '/generate' else sse_done(resp.get_data(as_text=True))
+    assert out['success'] and not out['metadata']['fallbackUsed'], out['metadata']['apiError']
+    assert 'Required Skills: Python, SQL, 3' in main.plan_generation(main.strip_job_fields(form)).prompt
+
+
+def test_strip_job_fields(main):
+    data = main.strip_job_fields({'jobTitle': ' Dev ', 'skillsKnown': [' Go ', ['Rust'], None, {}], 'salary': 5,
+                                  'additionalDetails': {'a': 1}, 'extra': [1]})
+    assert data == {'jobTitle': 'Dev', 'skillsKnown': 'Go, Rust', 'salary': '5', 'additionalDetails': '',
+                    'extra': [1]}
+
+
+@pytest.mark.parametrize('served_by, truncated, cached', [(None, False, True), ('primary', False, True),
+                                                          ('hedge/model', False, False), (None, True, False)])
+def test_only_full_primary_model_answers_are_cached(main, job_form, served_by, truncated, cached):
+    key = main.generation_cache_key(job_form)
+    extra = {'tokens': {'truncated': truncated}}
+    if served_by:
+        extra.update(hedged=True, servedBy=main.OPENROUTER_MODEL if served_by == 'primary' else served_by)
+    out = main.finish_generation(job_form, key, 'Job Overview:\nFrom upstream.', None, extra=extra)
+    assert out['jobDescription'] == 'Job Overview:\nFrom upstream.'
+    assert (main.jd_cache.get(key) is not None) is cached
+
+
+def test_hedged_answer_followed_by_a_stream_is_not_cached(main, job_form):
+    key = main.generation_cache_key(job_form)
+    outcome = main.new_stream_outcome()
+    events = list(main.finish_stream(job_form, key, 'Job Overview:\nFrom the hedge.', None, outcome, True, True,
+                                     True, False, {'hedged': True, 'servedBy': 'hedge/model', 'tokens': {}}))
+    assert sse_done(''.join(events))['metadata']['servedBy'] == 'hedge/model'
+    assert main.jd_cache.get(key) is None
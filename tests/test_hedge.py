@@ -0,0 +1,120 @@
+import socket
+import threading
+import time
+
+import pytest
+
+import upstream
+from hedge import Hedger
+from ratelimit import UpstreamLimiter
+
+HEADERS_ONLY = (b'HTTP/1.1 200 OK\r\nContent-Type: text/event-stream\r\nTransfer-Encoding: chunked\r\n\r\n')
+
+
+class StalledServer:
+    """Accepts connections, optionally sends ``greeting``, then never sends another byte."""
+
+    def __init__(self, greeting=b''):
+        self.greeting = greeting
+        self.sock = socket.create_server(('127.0.0.1', 0))
+        self.url = f'http://127.0.0.1:{self.sock.getsockname()[1]}/api/v1/chat/completions'
+        self.accepted = threading.Event()
+        self.conns = []
+        threading.Thread(target=self._serve, daemon=True).start()
+
+    def _serve(self):
+        while True:
+            try:
+                conn, _ = self.sock.accept()
+            except OSError:
+                return
+            self.conns.append(conn)
+            conn.recv(65536)
+            if self.greeting:
+                conn.sendall(self.greeting)
+            self.accepted.set()
+
+    def close(self):
+        self.sock.close()
+        for conn in self.conns:
+            conn.close()
+
+
+@pytest.fixture(params=[b'', HEADERS_ONLY], ids=['before-headers', 'before-first-line'])
+def stalled(request):
+    server = StalledServer(request.param)
+    yield server
+    server.close()
+
+
+def stalled_call(server, limiter, cancel):
+    """A streamed call to ``server`` read the way stream_openrouter reads it: ``(None, error)``."""
+    resp = None
+    try:
+        resp = upstream.post_with_retry(server.url, max_retries=1, limiter=limiter, cancel=cancel,
+                                        json={}, stream=True, timeout=(5, 30))
+        for _ in upstream.iter_sse_data(resp):
+            pass
+        return None, 'stream ended'
+    except Exception as e:
+        return None, type(e).__name__
+    finally:
+        if resp is not None:
+            upstream.close(resp)
+
+
+def test_abort_interrupts_a_stalled_call(stalled):
+    limiter = UpstreamLimiter(requests_per_minute=0, max_concurrency=1)
+    abort = upstream.Abort()
+    out = {}
+    call = threading.Thread(target=lambda: out.update(result=stalled_call(stalled, limiter, abort)))
+    call.start()
+    assert stalled.accepted.wait(5)
+    time.sleep(0.1)
+    started = time.monotonic()
+    abort.set()
+    call.join(2)
+    assert not call.is_alive(), 'the call kept waiting for the read timeout'
+    assert time.monotonic() - started < 1
+    # The only concurrency slot is free again
+    limiter.acquire().release()
+
+
+def test_hedge_loser_gives_back_its_slot_at_once(stalled):
+    limiter = UpstreamLimiter(requests_per_minute=0, max_concurrency=2)
+    hedger = Hedger(initial_delay=0.1, make_cancel=upstream.Abort)
+    primary_done = threading.Event()
+
+    def primary(cancel, on_first_token):
+        try:
+            return stalled_call(stalled, limiter, cancel)
+        finally:
+            primary_done.set()
+
+    def secondary(cancel, on_first_token):
+        return 'backup text', None
+
+    result, error, info = hedger.race(primary, secondary)
+    assert (result, info['winner']) == ('backup text', 'secondary')
+    assert primary_done.wait(1), 'the losing primary kept its connection until the read timeout'
+    permits = [limiter.acquire(), limiter.acquire()]
+    for permit in permits:
+        permit.release()
+
+
+def test_abort_set_before_the_call_skips_it():
+    abort = upstream.Abort()
+    abort.set()
+    with pytest.raises(upstream.Cancelled):
+        upstream.post_with_retry('http://127.0.0.1:9/', cancel=abort, json={})
+
+
+def test_abort_does_not_touch_a_finished_call(main, stub):
+    abort = upstream.Abort()
+    resp = upstream.post_with_retry(f'{stub.base_url}/api/v1/chat/completions', max_retries=1, cancel=abort,
+                                    json={'model': 'm', 'messages': [{'role': 'user', 'content': 'hi'}]})
+    assert resp.ok
+    abort.set()
+    # The pooled connection is reused by the next call, unharmed
+    assert upstream.post_with_retry(f'{stub.base_url}/api/v1/chat/completions', max_retries=1,
+                                    json={'model': 'm', 'messages': [{'role': 'user', 'content': 'hi'}]}).ok
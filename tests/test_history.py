@@ -0,0 +1,87 @@
+import pytest
+
+from history import HistoryStore
+
+
+@pytest.fixture
+def store(tmp_path):
+    store = HistoryStore(str(tmp_path / 'history.db'), batch_size=7)
+    for i in range(25):
+        store.record({'created': 1000 + i, 'company': 'Acme' if i % 2 else 'Globex', 'title': f'Role {i % 5}',
+                      'model': 'm', 'route': '/generate', 'latency_ms': i, 'fallback_used': i == 3,
+                      'cache_hit': False, 'api_error': None, 'inputs': {'jobTitle': f'Role {i % 5}'},
+                      'job_description': f'text {i}', 'metadata': {'n': i}})
+    assert store.flush()
+    return store
+
+
+def walk(store, limit, **filters):
+    pages, cursor = [], None
+    while True:
+        entries, cursor = store.page(limit=limit, cursor=cursor, **filters)
+        pages.append([e['id'] for e in entries])
+        if cursor is None:
+            return pages
+
+
+def test_pages_cover_every_entry_newest_first(store):
+    pages = walk(store, 10)
+    assert [len(p) for p in pages] == [10, 10, 5]
+    ids = [i for p in pages for i in p]
+    assert ids == sorted(ids, reverse=True) and len(set(ids)) == 25
+
+
+def test_exact_multiple_has_no_empty_last_page(store):
+    assert [len(p) for p in walk(store, 5)] == [5] * 5
+
+
+def test_page_returns_summaries(store):
+    entries, _ = store.page(limit=1)
+    assert set(entries[0]) == {'id', 'created', 'company', 'title', 'model', 'route', 'latency_ms',
+                               'fallback_used', 'cache_hit', 'api_error'}
+
+
+def test_filters_are_case_insensitive_and_combine_with_cursors(store):
+    pages = walk(store, 4, company='acme')
+    assert [len(p) for p in pages] == [4, 4, 4]
+    entries = [store.get(i) for p in pages for i in p]
+    assert all(e['company'] == 'Acme' for e in entries)
+    entries, cursor = store.page(limit=10, company='ACME', title='role 1')
+    assert cursor is None and {e['title'] for e in entries} == {'Role 1'} and len(entries) == 3
+
+
+def test_time_filters(store):
+    entries, _ = store.page(limit=50, since=1010, until=1015)
+    assert sorted(e['created'] for e in entries) == [1010, 1011, 1012, 1013, 1014]
+
+
+def test_get_decodes_the_row(store):
+    entry = store.get(4)
+    assert entry['fallback_used'] is True and entry['cache_hit'] is False
+    assert entry['inputs'] == {'jobTitle': 'Role 3'} and entry['metadata'] == {'n': 3}
+    assert entry['job_description'] == 'text 3'
+    assert store.get(999) is None
+
+
+def test_iter_entries_reads_in_batches(store):
+    entries = list(store.iter_entries(batch_size=4))
+    assert [e['id'] for e in entries] == list(range(25, 0, -1))
+    assert entries[0]['job_description'] == 'text 24'
+    assert len(list(store.iter_entries(batch_size=5, company='Globex'))) == 13
+    assert list(store.iter_entries(company='Nobody')) == []
+
+
+def test_stats(store):
+    stats = store.stats()
+    assert stats['rows'] == stats['written'] == stats['queued'] == 25
+    assert stats['dropped'] == stats['failed'] == stats['pending'] == 0
+
+
+def test_full_queue_drops_entries(tmp_path):
+    store = HistoryStore(str(tmp_path / 'h.db'), queue_size=1)
+    store._thread = object()  # pretend the writer is running, so nothing drains the queue
+    store.record({'company': 'A'})
+    store.record({'company': 'B'})
+    assert (store.queued, store.dropped) == (1, 1)
+    store._queue.get_nowait()
+    store._queue.task_done()
@@ -0,0 +1,74 @@
+import random
+
+import pytest
+
+from jd_text import MarkdownStreamCleaner, clean_markdown, parse_sections, sections_to_text, valid_sections
+
+SAMPLES = [
+    '## Job Overview:\n**Great** role.\n\n\n\nKey Responsibilities:\n- Build things\n- Ship',
+    '**Job Overview:**\nWe build __fast__ services.\n\n### Key Responsibilities\n- Own #1 priority\n- Review',
+    '\n\n  # Title\nText with * single stars * and _under_scores_.\n\n\n\n\n## What We Offer\n- Pay **',
+    'Plain text only.\nNo markdown here.',
+    '####### seven hashes\n#hashtag stays\n# real header\n**',
+    '',
+]
+
+
+def stream(text, sizes):
+    cleaner = MarkdownStreamCleaner()
+    out = []
+    i = 0
+    for size in sizes:
+        out.append(cleaner.feed(text[i:i + size]))
+        i += size
+    out.append(cleaner.feed(text[i:]))
+    out.append(cleaner.finish())
+    return ''.join(out)
+
+
+@pytest.mark.parametrize('text', SAMPLES)
+def test_stream_matches_clean_markdown_for_any_chunking(text):
+    expected = clean_markdown(text) or ''
+    assert stream(text, []) == expected
+    assert stream(text, [1] * len(text)) == expected
+    rng = random.Random(text)
+    for _ in range(50):
+        sizes = [rng.randint(1, 6) for _ in range(len(text))]
+        assert stream(text, sizes) == expected
+
+
+def test_bold_marker_split_across_chunks_is_held_back():
+    cleaner = MarkdownStreamCleaner()
+    assert cleaner.feed('Hello *') == 'Hello'
+    assert cleaner.feed('*world**') == ' world'
+    assert cleaner.finish() == ''
+
+
+def test_partial_header_line_is_held_until_decided():
+    cleaner = MarkdownStreamCleaner()
+    assert cleaner.feed('Intro\n##') == 'Intro\n'
+    assert cleaner.feed(' Skills\n') == 'Skills'
+
+
+JD = ('Job Overview:\nFirst paragraph.\n\nSecond paragraph.\n\nKey Responsibilities:\n- Build\n- Ship\n'
+      'TEAM CULTURE\nWe like tea.\n\nHow to Apply:\nSend a CV.')
+
+
+def test_parse_sections_model():
+    model = parse_sections(JD)
+    assert [s['title'] for s in model['sections']] == ['Job Overview', 'Key Responsibilities', 'How to Apply']
+    assert model['sections'][0]['blocks'] == [['paragraph', 'First paragraph.'], ['blank', ''],
+                                              ['paragraph', 'Second paragraph.'], ['blank', '']]
+    assert model['sections'][1]['blocks'][:3] == [['bullet', 'Build'], ['bullet', 'Ship'], ['header', 'TEAM CULTURE']]
+    assert valid_sections(model)
+    assert sections_to_text(model).startswith('Job Overview:\nFirst paragraph.\n\nSecond paragraph.')
+
+
+def test_parse_sections_results_can_be_modified_without_touching_the_cache():
+    first = parse_sections(JD)
+    first['sections'][2]['blocks'].append(['paragraph', 'Please send your application to a@b.c'])
+    first['sections'][0]['blocks'][0][1] = 'changed'
+    first['sections'].pop()
+    assert parse_sections(JD) == parse_sections(JD.replace('\n', '\r\n'))
+    assert parse_sections(JD)['sections'][0]['blocks'][0] == ['paragraph', 'First paragraph.']
+    assert parse_sections(JD)['sections'][2]['blocks'] == [['paragraph', 'Send a CV.']]
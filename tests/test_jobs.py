@@ -0,0 +1,82 @@
+import threading
+import time
+
+import pytest
+
+from jobs import DONE, FAILED, QUEUED, RUNNING, JobQueue, QueueFull, SQLiteJobStore, job_view
+
+
+def pending_job(job_id, status=QUEUED, created=None):
+    return {'id': job_id, 'status': status, 'payload': {'n': job_id}, 'result': None, 'error': None,
+            'created': created or time.time(), 'started': None, 'finished': None}
+
+
+def test_submit_runs_the_handler():
+    jobs = JobQueue(lambda payload: payload['n'] * 2, workers=2)
+    job = jobs.submit({'n': 21})
+    done = jobs.get(job['id'], wait=5)
+    assert done['status'] == DONE and job_view(done)['result'] == 42
+    assert jobs.stats()['completed'] == 1
+
+
+def test_handler_errors_fail_the_job():
+    def handler(payload):
+        raise ValueError('bad input')
+
+    jobs = JobQueue(handler, workers=1)
+    job = jobs.get(jobs.submit({})['id'], wait=5)
+    assert job['status'] == FAILED and job_view(job)['error'] == 'bad input'
+
+
+def test_full_queue_rejects_submits():
+    release = threading.Event()
+    jobs = JobQueue(lambda payload: release.wait(5), workers=1, max_depth=1)
+    first = jobs.submit({})
+    deadline = time.monotonic() + 5
+    while jobs.get(first['id'])['status'] != RUNNING:
+        assert time.monotonic() < deadline
+        time.sleep(0.01)
+    jobs.submit({})
+    with pytest.raises(QueueFull):
+        jobs.submit({})
+    release.set()
+    assert jobs.stats()['rejected'] == 1
+
+
+def test_reopened_store_runs_pending_jobs_without_a_submit(tmp_path):
+    path = str(tmp_path / 'jobs.db')
+    store = SQLiteJobStore(path)
+    store.save(pending_job('queued'))
+    store.save(pending_job('interrupted', status=RUNNING))
+
+    jobs = JobQueue(lambda payload: payload['n'], workers=1, store=SQLiteJobStore(path))
+    assert jobs.get('queued', wait=5)['status'] == DONE
+    assert jobs.get('interrupted', wait=5)['result'] == 'interrupted'
+    assert jobs.stats()['submitted'] == 0
+
+
+def test_resume_starts_workers_only_for_unfinished_jobs(tmp_path):
+    path = str(tmp_path / 'jobs.db')
+    jobs = JobQueue(lambda payload: payload, workers=1, store=SQLiteJobStore(path))
+    assert not jobs.resume() and not jobs.stats()['started']
+
+    SQLiteJobStore(path).save(pending_job('left-over'))
+    jobs = JobQueue(lambda payload: payload, workers=1, store=SQLiteJobStore(path))
+    assert jobs.resume()
+    deadline = time.monotonic() + 5
+    while jobs.store.load('left-over')['status'] != DONE:
+        assert time.monotonic() < deadline, 'resumed job never ran'
+        time.sleep(0.01)
+
+
+def test_pending_jobs_beyond_max_depth_still_run(tmp_path):
+    path = str(tmp_path / 'jobs.db')
+    store = SQLiteJobStore(path)
+    for i in range(7):
+        store.save(pending_job(f'job-{i}', created=1000 + i))
+
+    jobs = JobQueue(lambda payload: payload['n'], workers=1, max_depth=2, store=SQLiteJobStore(path))
+    assert jobs.resume()
+    for i in range(7):
+        assert jobs.get(f'job-{i}', wait=5)['status'] == DONE
+    assert jobs.stats()['depth'] == 0
@@ -0,0 +1,35 @@
+from metrics import Registry
+
+
+def test_counter_and_histogram_render():
+    registry = Registry()
+    counter = registry.counter('jobs_total', 'Jobs', ('outcome',))
+    counter.inc(outcome='ok')
+    counter.inc(2, outcome='ok')
+    hist = registry.histogram('latency_seconds', 'Latency', ('route',), buckets=(0.1, 1))
+    hist.observe(0.05, route='/a')
+    hist.observe(5, route='/a')
+    text = registry.render()
+    assert 'jobs_total{outcome="ok"} 3' in text
+    assert 'latency_seconds_bucket{route="/a",le="0.1"} 1' in text
+    assert 'latency_seconds_bucket{route="/a",le="1"} 1' in text
+    assert 'latency_seconds_bucket{route="/a",le="+Inf"} 2' in text
+    assert 'latency_seconds_count{route="/a"} 2' in text
+
+
+def test_snapshot_reads_its_source_at_render_time():
+    registry = Registry()
+    source = {'fired': 0}
+    registry.snapshot('hedges_fired_total', 'Hedges', (), lambda: {(): source['fired']}, kind='counter')
+    assert 'hedges_fired_total 0' in registry.render()
+    source['fired'] = 4
+    text = registry.render()
+    assert '# TYPE hedges_fired_total counter' in text and 'hedges_fired_total 4' in text
+
+
+def test_breaker_and_hedger_are_exported(main):
+    text = main.app.test_client().get('/metrics').get_data(as_text=True)
+    assert 'jd_circuit_breaker_state{state="closed"} 1' in text
+    assert 'jd_circuit_breaker_transitions_total{state="open"}' in text
+    assert 'jd_hedges_fired_total' in text
+    assert 'jd_hedge_wins_total{winner="secondary"}' in text
@@ -0,0 +1,101 @@
+import io
+import re
+import subprocess
+import sys
+import textwrap
+import zipfile
+
+import pytest
+
+from conftest import ROOT
+from pdf_batch import PdfConcatenator, merged_pdf_stream, render_all, render_item, unique_name, zip_stream
+
+ITEMS = [
+    {'jobDetails': {'title': 'Backend Engineer', 'company': 'Acme'},
+     'jobDescription': 'Job Overview:\nBuild services.\n\nKey Responsibilities:\n- Ship features\n- Review code'},
+    {'jobDetails': {'title': 'Data Analyst', 'company': 'Acme'},
+     # Long enough to run onto a second page
+     'jobDescription': 'Job Overview:\n' + '\n'.join(f'- Responsibility number {i}' for i in range(120))},
+]
+
+
+def check_xref(pdf):
+    """Every in-use xref entry points at the start of its object; returns the page count."""
+    xref_at = int(pdf[pdf.rindex(b'startxref') + 9:].split()[0])
+    assert pdf[xref_at:xref_at + 4] == b'xref'
+    table = pdf[xref_at:pdf.index(b'trailer', xref_at)]
+    first, count = (int(x) for x in table.split(b'\n')[1].split())
+    for num, m in enumerate(re.finditer(rb'(\d{10}) (\d{5}) ([nf])', table), first):
+        if m.group(3) == b'n':
+            offset = int(m.group(1))
+            assert pdf[offset:].startswith(b'%d 0 obj' % num), num
+    assert num == first + count - 1
+    # reportlab writes '/Count n /Kids [...] /Type /Pages', the concatenator the other way round
+    tree = next(d for d in re.findall(rb'<<[^<>]*>>', pdf) if b'/Type /Pages' in d)
+    return int(re.search(rb'/Count (\d+)', tree).group(1))
+
+
+def test_merged_pdf_keeps_every_page_in_order():
+    rendered = [render_item(item) for item in ITEMS]
+    pages = [check_xref(pdf) for _, pdf, _ in rendered]
+    assert pages[1] > 1
+    merged = b''.join(merged_pdf_stream(iter(rendered)))
+    assert check_xref(merged) == sum(pages)
+    pypdf = pytest.importorskip('pypdf')
+    reader = pypdf.PdfReader(io.BytesIO(merged))
+    assert len(reader.pages) == sum(pages)
+    assert 'Backend Engineer' in reader.pages[0].extract_text()
+    assert 'Data Analyst' in reader.pages[1].extract_text()
+
+
+def test_merged_pdf_skips_failed_items():
+    ok = render_item(ITEMS[0])
+    merged = b''.join(merged_pdf_stream(iter([ok, ('broken.pdf', None, 'boom'), ok])))
+    assert check_xref(merged) == 2 * check_xref(ok[1])
+
+
+def test_concatenator_with_nothing_added_is_a_valid_empty_document():
+    merger = PdfConcatenator()
+    assert check_xref(merger.start() + merger.finish()) == 0
+
+
+def test_zip_has_one_pdf_per_posting_and_lists_failures():
+    rendered = [render_item(ITEMS[0]), ('x.pdf', None, 'boom'), render_item(ITEMS[0])]
+    archive = zipfile.ZipFile(io.BytesIO(b''.join(zip_stream(iter(rendered)))))
+    assert archive.namelist() == ['backend_engineer_job_description.pdf',
+                                  'backend_engineer_job_description_2.pdf', 'ERRORS.txt']
+    assert archive.read('ERRORS.txt').decode() == '1\tx.pdf\tboom\n'
+    assert archive.read('backend_engineer_job_description.pdf').startswith(b'%PDF')
+
+
+def test_unique_name():
+    seen = {}
+    assert [unique_name(n, seen) for n in ('a.pdf', 'a.pdf', 'b', 'b')] == ['a.pdf', 'a_2.pdf', 'b', 'b_2']
+
+
+def test_render_all_inline_keeps_input_order():
+    names = [name for name, _, _ in render_all(ITEMS)]
+    assert names == ['backend_engineer_job_description.pdf', 'data_analyst_job_description.pdf']
+
+
+def test_spawned_workers_do_not_rerun_the_main_script(tmp_path):
+    # As under `python app.py`: the parent's __main__ is a script with side effects
+    script = tmp_path / 'server.py'
+    script.write_text(textwrap.dedent(f'''
+        import sys
+        sys.path.insert(0, {ROOT!r})
+        print('main script ran', flush=True)
+        import pdf_batch
+        if __name__ == '__main__':
+            pool = pdf_batch.get_pool(2, 'spawn')
+            items = [{{'jobDetails': {{'title': f'Role {{i}}'}}, 'jobDescription': 'Job Overview:\\nText.'}}
+                     for i in range(4)]
+            results = list(pdf_batch.render_all(items, pool))
+            print('rendered', sum(1 for _, pdf, error in results if pdf and not error))
+            print('pool', pdf_batch.pool_stats())
+    '''))
+    proc = subprocess.run([sys.executable, str(script)], capture_output=True, text=True, timeout=120)
+    assert proc.returncode == 0, proc.stderr
+    assert proc.stdout.count('main script ran') == 1, proc.stdout
+    assert 'rendered 4' in proc.stdout
+    assert "'running': True" in proc.stdout
@@ -0,0 +1,46 @@
+import time
+
+from probes import Prober
+
+
+def counting_prober(interval, jitter=0.0):
+    calls = []
+    prober = Prober({'ok': lambda: calls.append(time.monotonic()) or {'status': 'OK'}},
+                    interval=interval, jitter=jitter)
+    return prober, calls
+
+
+def test_schedule_waits_an_interval_before_the_first_run():
+    prober, calls = counting_prober(0.3)
+    started = time.monotonic()
+    prober.ensure_started()
+    time.sleep(0.15)
+    assert calls == [] and prober.stats()['runs'] == 0
+    deadline = time.monotonic() + 3
+    while not calls:
+        assert time.monotonic() < deadline, 'scheduled run never happened'
+        time.sleep(0.02)
+    prober.stop()
+    assert calls[0] - started >= 0.3
+    assert prober.snapshot()['checks']['ok']['status'] == 'OK'
+
+
+def test_jitter_stays_within_its_fraction():
+    prober, _ = counting_prober(10, jitter=0.2)
+    waits = [prober._next_wait() for _ in range(200)]
+    assert all(10 <= w <= 12 for w in waits) and len(set(waits)) > 1
+
+
+def test_refresh_runs_now_and_throttles():
+    prober, calls = counting_prober(0)
+    prober.min_refresh_interval = 60
+    assert prober.refresh() == 'ran' and len(calls) == 1
+    assert prober.refresh() == 'throttled' and len(calls) == 1
+
+
+def test_api_probe_does_not_use_the_user_budget(main):
+    granted = main.upstream_limiter.stats()['granted']
+    probes = main.probe_limiter.stats()['granted']
+    assert main.probe_api()['status'] == 'OK'
+    assert main.upstream_limiter.stats()['granted'] == granted
+    assert main.probe_limiter.stats()['granted'] == probes + 1
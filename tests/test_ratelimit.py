@@ -0,0 +1,106 @@
+import asyncio
+import time
+
+import pytest
+
+from ratelimit import (AIMDLimiter, RateLimited, TokenBucket, UpstreamLimiter, parse_ratelimit_reset,
+                       parse_retry_after)
+
+
+def test_bucket_reserves_until_empty_then_quotes_a_wait():
+    bucket = TokenBucket(per_minute=60, capacity=2)
+    assert bucket.reserve(1, max_wait=0) == 0.0
+    assert bucket.reserve(1, max_wait=0) == 0.0
+    # Empty: the next token is a second away at 1/s
+    assert bucket.reserve(1, max_wait=0.5) is None
+    assert bucket.reserve(1, max_wait=2) == pytest.approx(1.0, abs=0.05)
+
+
+def test_bucket_caps_oversized_requests_and_refunds():
+    bucket = TokenBucket(per_minute=600, capacity=10)
+    assert bucket.reserve(50, max_wait=0) == 0.0
+    assert bucket.available < 1
+    bucket.refund(50)
+    assert bucket.available == pytest.approx(10, abs=0.5)
+
+
+def test_aimd_halves_on_rate_limit_and_grows_back_slowly():
+    limiter = AIMDLimiter(initial=8, minimum=1, maximum=8)
+    assert limiter.try_acquire()
+    limiter.release('rate_limited')
+    assert limiter.limit == 4
+    for _ in range(4):
+        assert limiter.try_acquire()
+        limiter.release('success')
+    assert 4.9 < limiter.limit < 5.1
+    assert limiter.in_flight == 0
+
+
+def test_aimd_blocks_at_the_limit_until_the_deadline():
+    limiter = AIMDLimiter(initial=1)
+    assert limiter.acquire(time.monotonic() + 1)
+    assert not limiter.try_acquire()
+    started = time.monotonic()
+    assert not limiter.acquire(started + 0.05)
+    assert time.monotonic() - started >= 0.04
+    limiter.release('success')
+    assert limiter.try_acquire()
+
+
+def test_retry_after_parsing():
+    assert parse_retry_after('3') == 3.0
+    assert parse_retry_after(None) is None
+    assert parse_retry_after('soon') is None
+    assert parse_retry_after('Wed, 21 Oct 2015 07:28:00 GMT', now=1445412470) == pytest.approx(10)
+
+
+def test_ratelimit_reset_parsing():
+    now = 1_700_000_000
+    assert parse_ratelimit_reset({'X-RateLimit-Remaining': '5', 'X-RateLimit-Reset': '9'}, now) is None
+    assert parse_ratelimit_reset({'X-RateLimit-Remaining': '0', 'X-RateLimit-Reset': '7'}, now) == 7
+    assert parse_ratelimit_reset({'X-RateLimit-Remaining': '0',
+                                  'X-RateLimit-Reset': str((now + 4) * 1000)}, now) == pytest.approx(4)
+
+
+def test_limiter_rejects_instead_of_waiting_past_the_deadline():
+    limiter = UpstreamLimiter(requests_per_minute=60, max_concurrency=4)
+    for _ in range(60):
+        limiter.acquire().release()
+    with pytest.raises(RateLimited):
+        limiter.acquire(deadline=time.monotonic() + 0.1)
+    stats = limiter.stats()
+    assert stats['granted'] == 60 and stats['rejected'] == 1
+
+
+def test_429_backs_off_every_caller_and_shrinks_concurrency():
+    limiter = UpstreamLimiter(requests_per_minute=0, max_concurrency=8)
+    permit = limiter.acquire()
+    limiter.observe(429, {'Retry-After': '30'})
+    permit.release('rate_limited')
+    with pytest.raises(RateLimited, match='back off'):
+        limiter.acquire(deadline=time.monotonic() + 1)
+    assert limiter.stats()['concurrency_limit'] == 4
+    assert limiter.stats()['rate_limited'] == 1
+
+
+def test_permit_release_is_idempotent():
+    limiter = UpstreamLimiter(requests_per_minute=0, max_concurrency=1)
+    permit = limiter.acquire()
+    permit.release()
+    permit.release()
+    assert limiter.stats()['in_flight'] == 0
+
+
+def test_async_acquire_shares_slots_with_threads():
+    limiter = UpstreamLimiter(requests_per_minute=0, max_concurrency=1)
+    held = limiter.acquire()
+
+    async def main():
+        with pytest.raises(RateLimited, match='slots busy'):
+            await limiter.acquire_async(deadline=time.monotonic() + 0.1)
+        asyncio.get_running_loop().call_later(0.05, held.release)
+        permit = await limiter.acquire_async(deadline=time.monotonic() + 1)
+        permit.release()
+
+    asyncio.run(main())
+    assert limiter.stats()['in_flight'] == 0
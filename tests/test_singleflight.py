@@ -0,0 +1,109 @@
+import asyncio
+import threading
+import time
+
+import pytest
+
+from singleflight import SingleFlight, FlightTimeout
+
+
+def run_together(flights, key, fn, n):
+    """Call ``flights.do(key, fn)`` from ``n`` threads at once; returns their ``(result, shared)``s."""
+    results = [None] * n
+    errors = [None] * n
+
+    def worker(i):
+        try:
+            results[i] = flights.do(key, fn)
+        except Exception as e:
+            errors[i] = e
+
+    threads = [threading.Thread(target=worker, args=(i,)) for i in range(n)]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join(5)
+    return results, errors
+
+
+def slow(value, calls, delay=0.2):
+    def fn():
+        calls.append(1)
+        time.sleep(delay)
+        return value
+    return fn
+
+
+def test_concurrent_calls_share_one_result():
+    flights = SingleFlight(wait_timeout=5)
+    calls = []
+    results, errors = run_together(flights, 'k', slow(('jd', None, {}), calls), 5)
+    assert errors == [None] * 5
+    assert len(calls) == 1
+    assert [r for r, _ in results] == [('jd', None, {})] * 5
+    assert sorted(shared for _, shared in results) == [False, True, True, True, True]
+    assert flights.stats()['leaders'] == 1 and flights.stats()['coalesced'] == 4
+    assert flights.stats()['in_flight'] == 0
+
+
+def test_leader_exception_reaches_followers():
+    flights = SingleFlight(wait_timeout=5)
+
+    def boom():
+        time.sleep(0.2)
+        raise ValueError('upstream down')
+
+    results, errors = run_together(flights, 'k', boom, 3)
+    assert results == [None] * 3
+    assert all(isinstance(e, ValueError) for e in errors)
+
+
+def test_key_is_released_after_the_call():
+    flights = SingleFlight()
+    calls = []
+    assert flights.do('k', slow(1, calls, 0)) == (1, False)
+    assert flights.do('k', slow(2, calls, 0)) == (2, False)
+    assert len(calls) == 2
+
+
+def test_follower_times_out():
+    flights = SingleFlight(wait_timeout=0.05)
+    call, leader = flights.acquire('k')
+    assert leader
+    follower, leader = flights.acquire('k')
+    assert not leader
+    with pytest.raises(FlightTimeout):
+        flights.wait(follower)
+    assert flights.stats()['follower_timeouts'] == 1
+    flights.release('k', call, result=1)
+
+
+def test_async_follower_of_thread_leader():
+    flights = SingleFlight(wait_timeout=5)
+    call, _ = flights.acquire('k')
+
+    async def follow():
+        follower, leader = flights.acquire('k')
+        assert not leader
+        return await flights.wait_async(follower)
+
+    threading.Timer(0.1, lambda: flights.release('k', call, result=('jd', None, {}))).start()
+    assert asyncio.run(follow()) == ('jd', None, {})
+
+
+def test_do_async_coalesces_coroutines():
+    flights = SingleFlight(wait_timeout=5)
+    calls = []
+
+    async def fetch():
+        calls.append(1)
+        await asyncio.sleep(0.1)
+        return 'jd'
+
+    async def main():
+        return await asyncio.gather(*(flights.do_async('k', fetch) for _ in range(4)))
+
+    results = asyncio.run(main())
+    assert len(calls) == 1
+    assert [r for r, _ in results] == ['jd'] * 4
+    assert sum(shared for _, shared in results) == 3
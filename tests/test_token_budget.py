@@ -0,0 +1,97 @@
+from token_budget import TokenBudget, compact_details, compact_skills, estimate_tokens, usage_of
+
+
+def build_prompt(fields, words):
+    return f"{fields['jobTitle']} {fields['skillsKnown']} {fields['additionalDetails']} ({words} words)"
+
+
+def job(**fields):
+    return dict({'jobTitle': 'Engineer', 'experienceLevel': 'mid', 'skillsKnown': '', 'additionalDetails': ''},
+                **fields)
+
+
+def test_estimate_tokens():
+    assert estimate_tokens('') == 0
+    assert estimate_tokens('go') == 1
+    assert estimate_tokens('internationalization') == 4
+    assert estimate_tokens('123456') == 2
+    assert estimate_tokens('a, b!') == 4
+
+
+def test_compact_skills_drops_duplicates_and_keeps_order():
+    skills, dropped = compact_skills('Python, SQL;python\n - SQL | Go, , Docker', 20, 80)
+    assert skills == 'Python, SQL, Go, Docker'
+    assert dropped == 0
+
+
+def test_compact_skills_caps_items_and_tokens():
+    many = ', '.join(f'skill{i}' for i in range(30))
+    skills, dropped = compact_skills(many, 5, 80)
+    assert skills.split(', ') == [f'skill{i}' for i in range(5)] and dropped == 25
+    skills, dropped = compact_skills(many, 30, 10)
+    assert estimate_tokens(skills) + len(skills.split(', ')) <= 10 + 1 and dropped == 30 - len(skills.split(', '))
+
+
+def test_compact_details_leaves_short_text_alone():
+    assert compact_details('Hybrid role.', 50) == ('Hybrid role.', False)
+    assert compact_details(None, 50) == ('', False)
+
+
+def test_compact_details_keeps_the_context_and_the_facts():
+    filler = ' '.join(f'We value teamwork and kindness in everything we do {i}x.' for i in 'abcdefgh')
+    text = (f'Acme builds payment software. {filler} The role is remote with 25 days of leave. '
+            f'{filler} Acme builds payment software.')
+    details, shortened = compact_details(text, 40)
+    assert shortened
+    assert details.startswith('Acme builds payment software.')
+    assert 'remote with 25 days of leave' in details
+    assert details.count('Acme builds payment software.') == 1
+    assert estimate_tokens(details) <= 40
+
+
+def test_plan_compacts_inputs_and_sizes_the_answer():
+    budget = TokenBudget(min_tokens=400, max_tokens=1500, max_skills=3)
+    plan = budget.plan(job(skillsKnown='a, b, c, d, a'), build_prompt)
+    assert plan.fields['skillsKnown'] == 'a, b, c' and plan.trimmed == ['skillsKnown']
+    assert 400 <= plan.max_tokens <= 1500 and plan.max_tokens >= plan.estimated_completion
+    assert f'({plan.target_words} words)' in plan.prompt and plan.estimated_prompt == estimate_tokens(plan.prompt)
+    assert budget.plan(job(experienceLevel='lead'), build_prompt).estimated_completion > \
+        budget.plan(job(experienceLevel='entry'), build_prompt).estimated_completion
+    assert budget.stats()['plans'] == 3 and budget.stats()['trimmed'] == 1
+
+
+def test_plan_respects_the_floor_and_ceiling():
+    assert TokenBudget(min_tokens=5000, max_tokens=6000).plan(job(), build_prompt).max_tokens == 5000
+    assert TokenBudget(min_tokens=10, max_tokens=100).plan(job(), build_prompt).max_tokens == 100
+
+
+def test_truncated_completions_widen_the_headroom():
+    budget = TokenBudget(headroom=1.4, max_headroom=2.0)
+    plan = budget.plan(job(), build_prompt)
+    plan.record({'prompt_tokens': 100, 'completion_tokens': plan.max_tokens}, 'length')
+    budget.observe(plan)
+    assert budget.headroom == 1.75 and budget.stats()['truncated'] == 1
+    assert budget.plan(job(), build_prompt).max_tokens > plan.max_tokens
+    for _ in range(3):
+        budget.observe(plan)
+    assert budget.headroom == 2.0
+
+    clean = budget.plan(job(), build_prompt)
+    clean.record({'completion_tokens': 300}, 'stop')
+    budget.observe(clean)
+    assert budget.headroom == 1.99
+
+
+def test_record_keeps_the_first_usage():
+    plan = TokenBudget().plan(job(), build_prompt)
+    assert plan.record({'prompt_tokens': 1, 'completion_tokens': 2}, 'stop')
+    assert not plan.record({'prompt_tokens': 9, 'completion_tokens': 9}, 'length')
+    meta = plan.metadata()
+    assert (meta['prompt'], meta['completion'], meta['truncated']) == (1, 2, False)
+
+
+def test_usage_of():
+    body = {'usage': {'completion_tokens': 3}, 'choices': [{'finish_reason': 'length'}]}
+    assert usage_of(body) == ({'completion_tokens': 3}, 'length')
+    assert usage_of({'choices': []}) == (None, None)
+    assert usage_of('[DONE]') == (None, None)
@@ -0,0 +1,288 @@
+"""Token budgets for OpenRouter generations.
+
+Upstream latency grows with the number of tokens the model writes, so
+rather than one fixed ``max_tokens`` every generation gets a plan sized to
+what it asks for:
+
+* the answer's expected length is the sum of per-section budgets, scaled
+  by experience level and by how much input (skills, details) there is to
+  cover. The prompt asks for about that many words, and ``max_tokens`` is
+  that length plus headroom, between a floor and a ceiling;
+* oversized ``skillsKnown`` and ``additionalDetails`` are compacted before
+  they go into the prompt: duplicate skills are dropped, and long details
+  are cut down to their most informative sentences;
+* prompt tokens are estimated locally, without a tokenizer dependency.
+
+The plan carries the estimates and, once the call returns, the token usage
+OpenRouter reports, so /generate can show both. A completion cut off by
+``max_tokens`` (finish_reason ``length``) widens the headroom for later
+plans, and clean completions narrow it back slowly.
+"""
+import math
+import re
+import threading
+
+from jd_text import SECTION_ORDER
+
+# Expected answer length per section, in tokens, for a mid-level role with a few skills
+SECTION_TOKENS = {
+    'Job Overview': 110,
+    'Key Responsibilities': 170,
+    'Required Qualifications': 130,
+    'Preferred Qualifications': 80,
+    'What We Offer': 90,
+    'How to Apply': 50,
+}
+LEVEL_SCALE = {'entry': 0.8, 'mid': 1.0, 'senior': 1.15, 'lead': 1.3}
+# Each skill past the first few adds a responsibility or qualification line
+BASE_SKILLS = 4
+TOKENS_PER_EXTRA_SKILL = 15
+MAX_SKILL_TOKENS = 150
+# Details are worked into the text at roughly half their length
+DETAILS_FACTOR = 0.5
+WORDS_PER_TOKEN = 0.75
+
+PIECE_RE = re.compile(r'[^\W\d_]+|\d+|[^\w\s]|_')
+SKILL_SPLIT_RE = re.compile(r'\s*(?:[,;\n]|\s\|\s)\s*')
+SENTENCE_SPLIT_RE = re.compile(r'(?<=[.!?])\s+|\s*\n+\s*(?:[-*•]\s*)?')
+# Sentences worth keeping when details are cut down: hard facts and conditions
+DETAIL_KEYWORDS = frozenset((
+    'remote', 'hybrid', 'onsite', 'on-site', 'office', 'relocation', 'visa', 'shift', 'travel', 'benefits',
+    'insurance', 'bonus', 'equity', 'stock', 'leave', 'certification', 'certified', 'degree', 'must',
+    'required', 'mandatory', 'notice', 'clearance', 'contract', 'immediate', 'weekend',
+))
+
+
+def estimate_tokens(text):
+    """Approximate token count of ``text`` for BPE tokenizers such as Llama's.
+
+    Words count one token plus one per further six letters, digit runs one
+    per three digits, and every other symbol one each.
+    """
+    n = 0
+    for piece in PIECE_RE.findall(text or ''):
+        if piece.isdigit():
+            n += (len(piece) + 2) // 3
+        elif piece.isalpha():
+            n += 1 + (len(piece) - 1) // 6
+        else:
+            n += 1
+    return n
+
+
+def compact_skills(text, max_items, max_tokens):
+    """``(skills, dropped)``: de-duplicated and capped at ``max_items`` / ``max_tokens``, order kept."""
+    items = []
+    seen = set()
+    for item in SKILL_SPLIT_RE.split(text or ''):
+        item = ' '.join(item.split()).strip('-*• ')
+        if item and item.casefold() not in seen:
+            seen.add(item.casefold())
+            items.append(item)
+    kept = []
+    used = 0
+    for item in items[:max_items]:
+        cost = estimate_tokens(item) + 1
+        if kept and used + cost > max_tokens:
+            break
+        kept.append(item)
+        used += cost
+    return ', '.join(kept), len(items) - len(kept)
+
+
+def detail_score(sentence):
+    words = sentence.lower().split()
+    score = sum(1 for w in words if w.strip('.,;:()') in DETAIL_KEYWORDS)
+    if any(ch.isdigit() for ch in sentence):
+        score += 2
+    return score
+
+
+def compact_details(text, max_tokens):
+    """``(details, shortened)``: ``text`` cut down to about ``max_tokens``.
+
+    Repeated sentences are dropped. If it is still too long the first
+    sentence (usually the context) is kept, then the sentences with the most
+    facts (numbers, work mode, benefits, hard requirements) that still fit,
+    in their original order.
+    """
+    text = text or ''
+    if estimate_tokens(text) <= max_tokens:
+        return text, False
+    sentences = []
+    seen = set()
+    for s in SENTENCE_SPLIT_RE.split(text):
+        s = ' '.join(s.split())
+        if s and s.casefold() not in seen:
+            seen.add(s.casefold())
+            sentences.append(s)
+    if not sentences:
+        return '', True
+    costs = [estimate_tokens(s) for s in sentences]
+    if costs[0] > max_tokens:
+        return truncate_words(sentences[0], max_tokens), True
+    chosen = {0}
+    used = costs[0]
+    ranked = sorted(range(1, len(sentences)), key=lambda i: (-detail_score(sentences[i]), i))
+    for i in ranked:
+        if used + costs[i] <= max_tokens:
+            chosen.add(i)
+            used += costs[i]
+    return ' '.join(sentences[i] for i in sorted(chosen)), True
+
+
+def truncate_words(text, max_tokens):
+    words = text.split()
+    while words and estimate_tokens(' '.join(words)) > max_tokens:
+        # Drop ~10% at a time; estimates are cheap but not free on long input
+        words = words[:max(0, len(words) - max(1, len(words) // 10))]
+    return ' '.join(words)
+
+
+def usage_of(body):
+    """``(usage dict or None, finish_reason or None)`` from a completion body or stream event."""
+    if not isinstance(body, dict):
+        return None, None
+    usage = body.get('usage') if isinstance(body.get('usage'), dict) else None
+    finish_reason = None
+    try:
+        finish_reason = body['choices'][0].get('finish_reason')
+    except (KeyError, IndexError, TypeError, AttributeError):
+        pass
+    return usage, finish_reason
+
+
+class TokenPlan:
+    """What one generation asks for and, after the call, what it used."""
+
+    def __init__(self, fields, trimmed, completion_tokens, max_tokens):
+        self.fields = fields
+        self.trimmed = trimmed
+        self.estimated_completion = completion_tokens
+        self.max_tokens = max_tokens
+        self.target_words = int(round(completion_tokens * WORDS_PER_TOKEN, -1))
+        self.prompt = ''
+        self.estimated_prompt = 0
+        self.prompt_tokens = None
+        self.completion_tokens = None
+        self.finish_reason = None
+        self.recorded = False
+
+    def set_prompt(self, prompt):
+        self.prompt = prompt
+        self.estimated_prompt = estimate_tokens(prompt)
+
+    def record(self, usage, finish_reason=None):
+        """Store what the upstream reported. The first call wins, so a hedge race keeps the winner's usage."""
+        if self.recorded:
+            return False
+        self.recorded = True
+        usage = usage or {}
+        self.prompt_tokens = usage.get('prompt_tokens')
+        self.completion_tokens = usage.get('completion_tokens')
+        self.finish_reason = finish_reason
+        return True
+
+    def metadata(self):
+        return {
+            'estimatedPrompt': self.estimated_prompt,
+            'estimatedCompletion': self.estimated_completion,
+            'maxTokens': self.max_tokens,
+            'prompt': self.prompt_tokens,
+            'completion': self.completion_tokens,
+            'truncated': self.finish_reason == 'length',
+            'trimmed': self.trimmed,
+        }
+
+
+class TokenBudget:
+    """Builds TokenPlans and adapts the ``max_tokens`` headroom to truncated completions."""
+
+    def __init__(self, min_tokens=400, max_tokens=1500, headroom=1.4, max_headroom=2.5, max_skills=20,
+                 skills_max_tokens=80, details_max_tokens=200):
+        self.min_tokens = min_tokens
+        self.max_tokens = max_tokens
+        self.base_headroom = headroom
+        self.max_headroom = max(headroom, max_headroom)
+        self.max_skills = max_skills
+        self.skills_max_tokens = skills_max_tokens
+        self.details_max_tokens = details_max_tokens
+        self._lock = threading.Lock()
+        self._headroom = headroom
+        self._plans = 0
+        self._observed = 0
+        self._truncated = 0
+        self._trimmed = 0
+        self._prompt_ratio = None
+        self._completion_ratio = None
+
+    @property
+    def headroom(self):
+        return self._headroom
+
+    def expected_completion(self, level, skills, details):
+        """Tokens a complete answer should take, from the sections and the (compacted) input."""
+        scale = LEVEL_SCALE.get((level or '').lower(), 1.0)
+        n_skills = len([s for s in skills.split(',') if s.strip()]) if skills else 0
+        extra = min(max(0, n_skills - BASE_SKILLS) * TOKENS_PER_EXTRA_SKILL, MAX_SKILL_TOKENS)
+        extra += int(estimate_tokens(details) * DETAILS_FACTOR)
+        return int(sum(SECTION_TOKENS[title] for title in SECTION_ORDER) * scale) + extra
+
+    def plan(self, data, build_prompt):
+        """Compact the free-text inputs, size the answer and build the prompt with ``build_prompt(fields, words)``."""
+        fields = dict(data)
+        trimmed = []
+        skills, dropped = compact_skills(data.get('skillsKnown', ''), self.max_skills, self.skills_max_tokens)
+        if dropped:
+            trimmed.append('skillsKnown')
+        fields['skillsKnown'] = skills
+        details, shortened = compact_details(data.get('additionalDetails', ''), self.details_max_tokens)
+        if shortened:
+            trimmed.append('additionalDetails')
+        fields['additionalDetails'] = details
+
+        expected = self.expected_completion(data.get('experienceLevel'), skills, details)
+        max_tokens = min(self.max_tokens, max(self.min_tokens, math.ceil(expected * self._headroom)))
+        plan = TokenPlan(fields, trimmed, expected, max_tokens)
+        plan.set_prompt(build_prompt(fields, plan.target_words))
+        with self._lock:
+            self._plans += 1
+            if trimmed:
+                self._trimmed += 1
+        return plan
+
+    def observe(self, plan):
+        """Learn from a finished call: truncations widen the headroom, clean completions narrow it."""
+        if plan.completion_tokens is None:
+            return
+        with self._lock:
+            self._observed += 1
+            if plan.finish_reason == 'length':
+                self._truncated += 1
+                self._headroom = min(self._headroom * 1.25, self.max_headroom)
+            else:
+                self._headroom = max(self.base_headroom, self._headroom - 0.01)
+            if plan.prompt_tokens and plan.estimated_prompt:
+                self._prompt_ratio = _ewma(self._prompt_ratio, plan.prompt_tokens / plan.estimated_prompt)
+            if plan.estimated_completion:
+                self._completion_ratio = _ewma(self._completion_ratio,
+                                               plan.completion_tokens / plan.estimated_completion)
+
+    def stats(self):
+        with self._lock:
+            return {
+                'headroom': round(self._headroom, 3),
+                'min_tokens': self.min_tokens,
+                'max_tokens': self.max_tokens,
+                'plans': self._plans,
+                'trimmed': self._trimmed,
+                'observed': self._observed,
+                'truncated': self._truncated,
+                # actual / estimated, averaged over recent calls
+                'prompt_ratio': round(self._prompt_ratio, 3) if self._prompt_ratio is not None else None,
+                'completion_ratio': round(self._completion_ratio, 3) if self._completion_ratio is not None else None,
+            }
+
+
+def _ewma(current, value, alpha=0.1):
+    return value if current is None else current + alpha * (value - current)
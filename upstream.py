@@ -0,0 +1,358 @@
+"""Shared HTTP client for every outbound call made by app.py.
+
+A single ``requests.Session`` is created per process and mounted with a
+bounded urllib3 pool, so keep-alive connections to OPENROUTER_BASE_URL (and
+the /diag probe hosts) are reused instead of paying a TCP+TLS handshake on
+every request. Pool sizing and timeouts come from the environment.
+
+New connections, time to response headers, total time, retries and 429s
+are reported to metrics.py as ``upstream_*`` stages and counters.
+
+A call made with an ``Abort`` can be stopped from another thread: setting
+it shuts down the call's socket, so a read blocked before the response
+headers or between stream chunks returns at once and the limiter permit
+and connection are given back straight away, not after the read timeout.
+
+``requests`` itself is imported with the session, on the first outbound
+call, so page views on a cold start never load it.
+"""
+import json
+import os
+import socket
+import sys
+import threading
+import time
+
+import log
+import metrics
+from metrics import observe_stage
+
+UPSTREAM_RETRIES = metrics.registry.counter('jd_upstream_retries_total',
+                                            'Upstream attempts that were retried', ('route', 'reason'))
+UPSTREAM_RESPONSES = metrics.registry.counter('jd_upstream_responses_total',
+                                              'Upstream responses by status class', ('route', 'status'))
+
+
+def _env_int(name, default):
+    try:
+        return int(os.getenv(name, default))
+    except (TypeError, ValueError):
+        return int(default)
+
+
+def _env_float(name, default):
+    try:
+        return float(os.getenv(name, default))
+    except (TypeError, ValueError):
+        return float(default)
+
+
+# Number of distinct hosts to keep pools for, and connections kept per host.
+POOL_CONNECTIONS = _env_int('OPENROUTER_POOL_CONNECTIONS', 4)
+POOL_MAXSIZE = _env_int('OPENROUTER_POOL_MAXSIZE', 16)
+# When true, callers wait for a free connection instead of opening extra ones.
+POOL_BLOCK = os.getenv('OPENROUTER_POOL_BLOCK', '').lower() in ('1', 'true')
+CONNECT_TIMEOUT = _env_float('OPENROUTER_CONNECT_TIMEOUT', 5)
+READ_TIMEOUT = _env_float('OPENROUTER_READ_TIMEOUT', 30)
+
+_session = None
+_session_lock = threading.Lock()
+# The Abort of the call running on this thread, seen by the pool's connections
+_calls = threading.local()
+
+
+class Cancelled(Exception):
+    """The call's Abort was set before it finished."""
+
+
+class Abort(threading.Event):
+    """A cancel flag that also interrupts the request it guards (see the module docstring)."""
+
+    def __init__(self):
+        super().__init__()
+        self._conn_lock = threading.Lock()
+        self._conns = set()
+
+    def set(self):
+        with self._conn_lock:
+            super().set()
+            conns = list(self._conns)
+        for conn in conns:
+            sock = getattr(conn, 'sock', None)
+            if sock is not None:
+                try:
+                    sock.shutdown(socket.SHUT_RDWR)
+                except OSError:
+                    pass
+
+    def track(self, conn):
+        with self._conn_lock:
+            if self.is_set():
+                raise Cancelled('cancelled')
+            self._conns.add(conn)
+
+    def untrack(self):
+        # Before the connection goes back to the pool, where another call may pick it up
+        with self._conn_lock:
+            self._conns.clear()
+
+
+def _timed_pool_classes():
+    """urllib3 pool classes whose connections time TCP+TLS setup as ``upstream_connect``."""
+    from urllib3.connection import HTTPConnection, HTTPSConnection
+    from urllib3.connectionpool import HTTPConnectionPool, HTTPSConnectionPool
+
+    def timed_connect(connect):
+        def wrapper(self):
+            t = time.perf_counter()
+            try:
+                connect(self)
+            except Exception:
+                observe_stage('upstream_connect', time.perf_counter() - t, 'error')
+                raise
+            observe_stage('upstream_connect', time.perf_counter() - t)
+        return wrapper
+
+    def abortable_getresponse(getresponse):
+        # The request has been sent, so the socket exists; an Abort can now shut it down
+        def wrapper(self):
+            abort = getattr(_calls, 'abort', None)
+            if abort is not None:
+                abort.track(self)
+            return getresponse(self)
+        return wrapper
+
+    class _TimedHTTPConnection(HTTPConnection):
+        connect = timed_connect(HTTPConnection.connect)
+        getresponse = abortable_getresponse(HTTPConnection.getresponse)
+
+    class _TimedHTTPSConnection(HTTPSConnection):
+        connect = timed_connect(HTTPSConnection.connect)
+        getresponse = abortable_getresponse(HTTPSConnection.getresponse)
+
+    class _TimedHTTPConnectionPool(HTTPConnectionPool):
+        ConnectionCls = _TimedHTTPConnection
+
+    class _TimedHTTPSConnectionPool(HTTPSConnectionPool):
+        ConnectionCls = _TimedHTTPSConnection
+
+    return {'http': _TimedHTTPConnectionPool, 'https': _TimedHTTPSConnectionPool}
+
+
+def get_session():
+    """Return the process-wide session, creating it on first use."""
+    global _session
+    if _session is None:
+        with _session_lock:
+            if _session is None:
+                import requests
+                from requests.adapters import HTTPAdapter
+                s = requests.Session()
+                adapter = HTTPAdapter(pool_connections=POOL_CONNECTIONS,
+                                      pool_maxsize=POOL_MAXSIZE,
+                                      pool_block=POOL_BLOCK)
+                adapter.poolmanager.pool_classes_by_scheme = _timed_pool_classes()
+                s.mount('https://', adapter)
+                s.mount('http://', adapter)
+                _session = s
+    return _session
+
+
+def timeout(read=None):
+    """Build a (connect, read) timeout tuple using the configured defaults."""
+    return (CONNECT_TIMEOUT, READ_TIMEOUT if read is None else read)
+
+
+def get(url, **kwargs):
+    kwargs.setdefault('timeout', timeout())
+    return get_session().get(url, **kwargs)
+
+
+def post(url, **kwargs):
+    kwargs.setdefault('timeout', timeout())
+    return get_session().post(url, **kwargs)
+
+
+def post_with_retry(url, max_retries=3, limiter=None, tokens=0, deadline=None, cancel=None, **kwargs):
+    """POST with retries on 429 responses and connection errors.
+
+    With a ``limiter`` every attempt first takes a permit, and 429s feed
+    ``Retry-After`` back into it, so waiting is coordinated across the
+    process and bounded by ``deadline`` (a ``time.monotonic()`` value):
+    ``RateLimited`` is raised as soon as the deadline cannot be met. Without
+    one the old exponential backoff is used.
+
+    Returns the last response received; raises the last exception if every
+    attempt failed without a response. Streaming responses keep their permit
+    until ``close(resp)``. Setting ``cancel`` (an ``Abort``, or any Event to
+    only stop between attempts) raises ``Cancelled`` without further retries.
+    """
+    backoff = 1
+    resp = None
+    last_exc = None
+    route = metrics.current_route.get()
+    abort = cancel if isinstance(cancel, Abort) else None
+    for attempt in range(1, max_retries + 1):
+        if cancel is not None and cancel.is_set():
+            raise Cancelled('cancelled')
+        permit = limiter.acquire(tokens, deadline) if limiter is not None else None
+        started = time.perf_counter()
+        _calls.abort = abort
+        try:
+            resp = post(url, **kwargs)
+        except Exception as e:
+            if permit is not None:
+                permit.release('error')
+            if abort is not None:
+                abort.untrack()
+            if cancel is not None and cancel.is_set():
+                observe_stage('upstream_total', time.perf_counter() - started, 'cancelled')
+                raise Cancelled('cancelled') from e
+            last_exc = e
+            observe_stage('upstream_total', time.perf_counter() - started, 'timeout' if is_timeout(e) else 'error')
+            log.event('upstream.attempt_failed', level='warning', attempt=attempt, error=str(e))
+            if attempt < max_retries and _can_wait(backoff, deadline):
+                UPSTREAM_RETRIES.inc(route=route, reason='error')
+                time.sleep(backoff)
+                backoff *= 2
+                continue
+            raise
+        finally:
+            _calls.abort = None
+        outcome = _status_outcome(resp.status_code)
+        UPSTREAM_RESPONSES.inc(route=route, status=f'{resp.status_code // 100}xx')
+        observe_stage('upstream_ttfb', resp.elapsed.total_seconds(), outcome)
+        if kwargs.get('stream'):
+            # upstream_total is recorded by close(resp) once the body has been read
+            resp.upstream_started = (started, outcome)
+        else:
+            observe_stage('upstream_total', time.perf_counter() - started, outcome)
+        if limiter is not None:
+            limiter.observe(resp.status_code, resp.headers)
+        if resp.status_code == 429 and attempt < max_retries:
+            UPSTREAM_RETRIES.inc(route=route, reason='429')
+            if permit is not None:
+                permit.release('rate_limited')
+                log.event('upstream.rate_limited', level='warning', attempt=attempt, max_retries=max_retries,
+                          wait='limiter')
+            else:
+                log.event('upstream.rate_limited', level='warning', attempt=attempt, max_retries=max_retries,
+                          wait=backoff)
+                time.sleep(backoff)
+                backoff *= 2
+            resp.upstream_started = None
+            if abort is not None:
+                abort.untrack()
+            resp.close()
+            continue
+        if permit is not None:
+            outcome = 'rate_limited' if resp.status_code == 429 else ('success' if resp.ok else 'error')
+            if kwargs.get('stream'):
+                # Released by close(resp) once the body has been consumed
+                resp.upstream_permit = (permit, outcome)
+            else:
+                permit.release(outcome)
+        if abort is not None:
+            if kwargs.get('stream'):
+                # Untracked by close(resp), once the body is no longer being read
+                resp.upstream_abort = abort
+            else:
+                abort.untrack()
+        # break out on success or non-retriable status
+        break
+    if resp is None:
+        raise last_exc or Exception('No response from OpenRouter')
+    return resp
+
+
+def _status_outcome(status):
+    if status == 429:
+        return 'rate_limited'
+    return 'ok' if status < 400 else 'http_error'
+
+
+def _can_wait(seconds, deadline):
+    return deadline is None or time.monotonic() + seconds <= deadline
+
+
+def close(resp):
+    """Close a (streaming) response and give back its limiter permit."""
+    started = getattr(resp, 'upstream_started', None)
+    if started is not None:
+        resp.upstream_started = None
+        observe_stage('upstream_total', time.perf_counter() - started[0], started[1])
+    abort = getattr(resp, 'upstream_abort', None)
+    if abort is not None:
+        abort.untrack()
+    try:
+        resp.close()
+    finally:
+        held = getattr(resp, 'upstream_permit', None)
+        if held is not None:
+            permit, outcome = held
+            permit.release(outcome)
+
+
+def pool_stats():
+    """Summarise connection reuse across all host pools.
+
+    urllib3 counts every request and every new connection per pool, so a hit
+    is a request served on an already-open connection.
+    """
+    hosts = {}
+    total_requests = 0
+    total_new = 0
+    if _session is not None:
+        adapter = _session.get_adapter('https://')
+        pools = adapter.poolmanager.pools
+        for key in list(pools.keys()):
+            pool = pools.get(key)
+            if pool is None:
+                continue
+            reqs = getattr(pool, 'num_requests', 0)
+            new = getattr(pool, 'num_connections', 0)
+            total_requests += reqs
+            total_new += new
+            hosts[f"{pool.scheme}://{pool.host}:{pool.port}"] = {
+                'requests': reqs,
+                'hits': max(reqs - new, 0),
+                'misses': new,
+            }
+    return {
+        'pool_connections': POOL_CONNECTIONS,
+        'pool_maxsize': POOL_MAXSIZE,
+        'pool_block': POOL_BLOCK,
+        'connect_timeout': CONNECT_TIMEOUT,
+        'read_timeout': READ_TIMEOUT,
+        'requests': total_requests,
+        'hits': max(total_requests - total_new, 0),
+        'misses': total_new,
+        'hosts': hosts,
+    }
+
+
+def iter_sse_data(resp):
+    """Yield decoded JSON payloads from an OpenAI-style ``text/event-stream`` body.
+
+    Comment lines (OpenRouter sends ``: OPENROUTER PROCESSING`` keep-alives)
+    and undecodable events are skipped; ``data: [DONE]`` ends the stream.
+    """
+    if not resp.encoding:
+        resp.encoding = 'utf-8'
+    for line in resp.iter_lines(decode_unicode=True):
+        if not line or line.startswith(':') or not line.startswith('data:'):
+            continue
+        data = line[5:].strip()
+        if data == '[DONE]':
+            break
+        try:
+            yield json.loads(data)
+        except ValueError:
+            continue
+
+
+def is_timeout(exc):
+    """True for connect/read timeouts raised by the client."""
+    # Nothing can have raised one if requests was never imported
+    requests = sys.modules.get('requests')
+    return requests is not None and isinstance(exc, requests.exceptions.Timeout)
@@ -0,0 +1,210 @@
+"""Async counterpart of upstream.py, used by the ASGI entry point (asgi.py).
+
+One ``httpx.AsyncClient`` per event loop, with the same timeouts as the
+requests session. A coroutine waiting on OpenRouter holds a socket but no
+thread, so the connection limit is set much higher than the threaded pool's
+(OPENROUTER_ASYNC_MAX_CONNECTIONS). The process-wide limiter still decides
+how many calls actually reach OpenRouter at once.
+
+The same ``upstream_*`` stages and counters are reported as by upstream.py.
+Needs ``httpx``; the WSGI app never imports this module.
+"""
+import asyncio
+import json
+import time
+
+import httpx
+
+import log
+import metrics
+from metrics import observe_stage
+from upstream import (CONNECT_TIMEOUT, READ_TIMEOUT, POOL_MAXSIZE, UPSTREAM_RETRIES, UPSTREAM_RESPONSES,
+                      _env_int, _can_wait, _status_outcome)
+
+MAX_CONNECTIONS = _env_int('OPENROUTER_ASYNC_MAX_CONNECTIONS', 256)
+
+_client = None
+_client_loop = None
+_stats = {'requests': 0, 'new_connections': 0}
+
+
+def get_client():
+    """Return the client for the running event loop, creating it on first use."""
+    global _client, _client_loop
+    loop = asyncio.get_running_loop()
+    if _client is None or _client_loop is not loop:
+        _client = httpx.AsyncClient(timeout=client_timeout(),
+                                    limits=httpx.Limits(max_connections=MAX_CONNECTIONS,
+                                                        max_keepalive_connections=max(POOL_MAXSIZE, 32)))
+        _client_loop = loop
+    return _client
+
+
+async def aclose():
+    """Close the client (ASGI lifespan shutdown)."""
+    global _client, _client_loop
+    client, _client, _client_loop = _client, None, None
+    if client is not None:
+        await client.aclose()
+
+
+def client_timeout(value=None):
+    """httpx timeout: the configured defaults, a read timeout, or upstream.timeout()'s tuple."""
+    if isinstance(value, tuple):
+        connect, read = value
+        return httpx.Timeout(read, connect=connect)
+    return httpx.Timeout(READ_TIMEOUT if value is None else value, connect=CONNECT_TIMEOUT)
+
+
+def _connect_tracer(url):
+    """httpcore trace hook timing TCP (+TLS) setup of new connections as ``upstream_connect``."""
+    done_event = 'connection.start_tls.complete' if url.startswith('https:') else 'connection.connect_tcp.complete'
+    started = []
+
+    async def trace(name, info):
+        if name == 'connection.connect_tcp.started':
+            started.append(time.perf_counter())
+            _stats['new_connections'] += 1
+        elif started and name == done_event:
+            observe_stage('upstream_connect', time.perf_counter() - started.pop())
+        elif started and name in ('connection.connect_tcp.failed', 'connection.start_tls.failed'):
+            observe_stage('upstream_connect', time.perf_counter() - started.pop(), 'error')
+
+    return trace
+
+
+async def get(url, timeout=None):
+    _stats['requests'] += 1
+    return await get_client().get(url, timeout=client_timeout(timeout),
+                                  extensions={'trace': _connect_tracer(url)})
+
+
+async def post_with_retry(url, max_retries=3, limiter=None, tokens=0, deadline=None, stream=False,
+                          timeout=None, **kwargs):
+    """upstream.post_with_retry for coroutines: the same retries, limiter use and metrics.
+
+    Backoff and limiter waits are ``await``ed. Non-streaming bodies are read
+    before returning; streaming responses keep their limiter permit until
+    ``await close(resp)``.
+    """
+    client = get_client()
+    request_timeout = client_timeout(timeout)
+    backoff = 1
+    resp = None
+    last_exc = None
+    route = metrics.current_route.get()
+    for attempt in range(1, max_retries + 1):
+        permit = await limiter.acquire_async(tokens, deadline) if limiter is not None else None
+        started = time.perf_counter()
+        attempt_resp = None
+        try:
+            _stats['requests'] += 1
+            request = client.build_request('POST', url, timeout=request_timeout,
+                                           extensions={'trace': _connect_tracer(url)}, **kwargs)
+            attempt_resp = await client.send(request, stream=True)
+            ttfb = time.perf_counter() - started
+            if not stream:
+                await attempt_resp.aread()
+        except Exception as e:
+            if attempt_resp is not None:
+                await attempt_resp.aclose()
+            if permit is not None:
+                permit.release('error')
+            last_exc = e
+            observe_stage('upstream_total', time.perf_counter() - started, 'timeout' if is_timeout(e) else 'error')
+            log.event('upstream.attempt_failed', level='warning', attempt=attempt, error=str(e))
+            if attempt < max_retries and _can_wait(backoff, deadline):
+                UPSTREAM_RETRIES.inc(route=route, reason='error')
+                await asyncio.sleep(backoff)
+                backoff *= 2
+                continue
+            raise
+        except asyncio.CancelledError:
+            if attempt_resp is not None:
+                await attempt_resp.aclose()
+            if permit is not None:
+                permit.release('error')
+            raise
+        resp = attempt_resp
+        outcome = _status_outcome(resp.status_code)
+        UPSTREAM_RESPONSES.inc(route=route, status=f'{resp.status_code // 100}xx')
+        observe_stage('upstream_ttfb', ttfb, outcome)
+        if stream:
+            # upstream_total is recorded by close(resp) once the body has been read
+            resp.upstream_started = (started, outcome)
+        else:
+            observe_stage('upstream_total', time.perf_counter() - started, outcome)
+        if limiter is not None:
+            limiter.observe(resp.status_code, resp.headers)
+        if resp.status_code == 429 and attempt < max_retries:
+            UPSTREAM_RETRIES.inc(route=route, reason='429')
+            resp.upstream_started = None
+            await resp.aclose()
+            if permit is not None:
+                permit.release('rate_limited')
+                log.event('upstream.rate_limited', level='warning', attempt=attempt, max_retries=max_retries,
+                          wait='limiter')
+            else:
+                log.event('upstream.rate_limited', level='warning', attempt=attempt, max_retries=max_retries,
+                          wait=backoff)
+                await asyncio.sleep(backoff)
+                backoff *= 2
+            continue
+        if permit is not None:
+            outcome = 'rate_limited' if resp.status_code == 429 else ('success' if resp.is_success else 'error')
+            if stream:
+                # Released by close(resp) once the body has been consumed
+                resp.upstream_permit = (permit, outcome)
+            else:
+                permit.release(outcome)
+        break
+    if resp is None:
+        raise last_exc or Exception('No response from OpenRouter')
+    return resp
+
+
+async def close(resp):
+    """Close a (streaming) response and give back its limiter permit."""
+    started = getattr(resp, 'upstream_started', None)
+    if started is not None:
+        resp.upstream_started = None
+        observe_stage('upstream_total', time.perf_counter() - started[0], started[1])
+    try:
+        await resp.aclose()
+    finally:
+        held = getattr(resp, 'upstream_permit', None)
+        if held is not None:
+            resp.upstream_permit = None
+            permit, outcome = held
+            permit.release(outcome)
+
+
+async def iter_sse_data(resp):
+    """upstream.iter_sse_data over an httpx streaming response."""
+    async for line in resp.aiter_lines():
+        if not line or line.startswith(':') or not line.startswith('data:'):
+            continue
+        data = line[5:].strip()
+        if data == '[DONE]':
+            break
+        try:
+            yield json.loads(data)
+        except ValueError:
+            continue
+
+
+def is_timeout(exc):
+    return isinstance(exc, httpx.TimeoutException)
+
+
+def pool_stats():
+    requests = _stats['requests']
+    new = _stats['new_connections']
+    return {
+        'max_connections': MAX_CONNECTIONS,
+        'connect_timeout': CONNECT_TIMEOUT,
+        'read_timeout': READ_TIMEOUT,
+        'requests': requests,
+        'hits': max(requests - new, 0),
+        'misses': new,
+    }